@@ -5,6 +5,10 @@ import json
 import uuid
 from dateutil.parser import isoparse
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+COLLECTION_TYPE_MARKER = '"x-mitre-collection"'
+CACHE_VERSION = 1
 
 
 def stix_representation(timestamp):
@@ -15,7 +19,147 @@ def stix_representation(timestamp):
     return timestamp.isoformat(timespec='milliseconds')[:-6] + "Z"
 
 
-def generate_collection_index(name, description, root_url, collection_index_id, files, folders):
+def _find_objects_array(f, chunk_size):
+    """Reads from f until the opening bracket of the bundle's "objects" array and returns (buffer, position after it)
+
+    :param file f: bundle file opened in text mode
+    :param int chunk_size: number of characters read per refill
+    """
+    buffer = ""
+    while True:
+        more = f.read(chunk_size)
+        if not more:
+            return None, None
+        buffer += more
+        match = re.search(r'"objects"\s*:\s*\[', buffer)
+        if match:
+            return buffer, match.end()
+
+
+def read_collection_objects(collection_bundle_file, chunk_size=1 << 20):
+    """Returns the x-mitre-collection objects of a bundle without parsing the rest of it
+
+    Objects are decoded one at a time until the first collection object (the first object in ATT&CK bundles);
+    the remainder of the file is only scanned for another collection type marker, and the whole bundle is
+    parsed only if one is found.
+
+    :param str collection_bundle_file: path of the bundle
+    :param int chunk_size: number of characters read per refill
+    """
+    decoder = json.JSONDecoder()
+    with open(collection_bundle_file, "r", encoding="utf-8") as f:
+        buffer, pos = _find_objects_array(f, chunk_size)
+        if buffer is None:
+            return []
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return []
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            if obj.get("type") == "x-mitre-collection":
+                break
+
+        # scan the rest for a second collection, keeping an overlap so a marker split across chunks is still seen
+        tail = buffer[pos:]
+        while True:
+            if COLLECTION_TYPE_MARKER in tail:
+                break
+            more = f.read(chunk_size)
+            if not more:
+                return [obj]
+            tail = tail[-len(COLLECTION_TYPE_MARKER):] + more
+
+    with open(collection_bundle_file, "r", encoding="utf-8") as f:
+        return [o for o in json.load(f)["objects"] if o["type"] == "x-mitre-collection"]
+
+
+def _parse_collection_file(collection_bundle_file):
+    """Process pool worker: returns the fields of each collection object in a bundle that the index needs
+
+    :param str collection_bundle_file: path of the bundle
+    """
+    return [
+        {
+            "id": collection_version["id"],
+            "created": collection_version["created"],
+            "version": collection_version["x_mitre_version"],
+            "modified": collection_version["modified"],
+            "name": collection_version["name"],
+            "description": collection_version["description"],
+        }
+        for collection_version in read_collection_objects(collection_bundle_file)
+    ]
+
+
+def _load_cache(cache_file):
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def _save_cache(cache_file, entries):
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": entries}, f)
+    os.replace(tmp_file, cache_file)
+
+
+def parse_collection_files(files, workers=None, cache_file=None):
+    """Returns a dictionary of bundle file -> list of parsed collection objects
+
+    Bundles whose path, size and mtime match the cache are not opened; the others are parsed in a process pool.
+
+    :param list of str files: bundle files to parse
+    :param int or None workers: number of worker processes; None uses one per CPU, 1 parses in this process
+    :param str or None cache_file: JSON file caching parsed collections between runs; None disables the cache
+    """
+    cache = _load_cache(cache_file)
+    parsed = {}
+    stats = {}
+    pending = []
+    for collection_bundle_file in files:
+        stat = os.stat(collection_bundle_file)
+        stats[collection_bundle_file] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entry = cache.get(os.path.abspath(collection_bundle_file))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            parsed[collection_bundle_file] = entry["collections"]
+        else:
+            pending.append(collection_bundle_file)
+
+    if workers == 1 or len(pending) <= 1:
+        for collection_bundle_file in tqdm(pending, desc="parsing collections"):
+            parsed[collection_bundle_file] = _parse_collection_file(collection_bundle_file)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_parse_collection_file, f): f for f in pending}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="parsing collections"):
+                parsed[futures[future]] = future.result()
+
+    if cache_file is not None:
+        entries = {
+            os.path.abspath(f): dict(stats[f], collections=parsed[f]) for f in files
+        }
+        if pending or set(entries) != set(cache):
+            _save_cache(cache_file, entries)
+
+    return parsed
+
+
+def generate_collection_index(name, description, root_url, collection_index_id, files, folders, workers=None, cache_file=None):
     """Generates a collection index from the input data and returns the index as a dictionary
 
     :param str name: The name of the collection index
@@ -24,6 +168,8 @@ def generate_collection_index(name, description, root_url, collection_index_id,
     :param str collection_index_id: the id to assign to the collection index
     :param list of str or None files: List of collection JSON files to include in the index; cannot be used with the folder argument
     :param list of str or None folders: List of folders containing the collection JSON files to include in the index; cannot be used with files argument; will only match collections that end with a version number
+    :param int or None workers: Number of processes parsing bundles in parallel; None uses one per CPU
+    :param str or None cache_file: JSON file caching parsed collections by path, size and mtime; None disables the cache
     """
     if (files and folders):
         print("cannot use both files and folder at the same time, please use only one argument at a time")
@@ -38,30 +184,32 @@ def generate_collection_index(name, description, root_url, collection_index_id,
     index_modified = None
     collections = {} # STIX ID -> collection object
 
-    for collection_bundle_file in tqdm(files, desc="parsing collections"):
-        with open(collection_bundle_file, "r") as f:
-            bundle = json.load(f)
-            for collection_version in filter(lambda x: x["type"] == "x-mitre-collection", bundle["objects"]):
-                # parse collection
-                if collection_version["id"] not in collections:
-                    # create
-                    collections[collection_version["id"]] = {
-                        "id": collection_version["id"],
-                        "created": collection_version["created"], # created is the same for all versions
-                        "versions": []
-                    }
-                collection = collections[collection_version["id"]]
-
-                # append this as a version
-                collection["versions"].append({
-                    "version": collection_version["x_mitre_version"],
-                    "url": root_url + collection_bundle_file if root_url.endswith("/") else root_url + "/" + collection_bundle_file,
-                    "modified": collection_version["modified"],
-                    "name": collection_version["name"], # this will be deleted later in the code
-                    "description": collection_version["description"], # this will be deleted later in the code
-                })
-                # ensure the versions are ordered
-                collection["versions"].sort(key=lambda version: isoparse(version["modified"]), reverse=True)
+    parsed = parse_collection_files(files, workers=workers, cache_file=cache_file)
+
+    for collection_bundle_file in files:
+        for collection_version in parsed[collection_bundle_file]:
+            # parse collection
+            if collection_version["id"] not in collections:
+                # create
+                collections[collection_version["id"]] = {
+                    "id": collection_version["id"],
+                    "created": collection_version["created"], # created is the same for all versions
+                    "versions": []
+                }
+            collection = collections[collection_version["id"]]
+
+            # append this as a version
+            collection["versions"].append({
+                "version": collection_version["version"],
+                "url": root_url + collection_bundle_file if root_url.endswith("/") else root_url + "/" + collection_bundle_file,
+                "modified": collection_version["modified"],
+                "name": collection_version["name"], # this will be deleted later in the code
+                "description": collection_version["description"], # this will be deleted later in the code
+            })
+
+    # order the versions once every bundle has been read
+    for collection in collections.values():
+        collection["versions"].sort(key=lambda version: isoparse(version["modified"]), reverse=True)
 
     for collection in collections.values():
         # set collection name and description from most recently modified version
@@ -122,6 +270,23 @@ if __name__ == "__main__":
         default=None,
         help="Unique identifier for the collection index. If omitted a new UUID will be generated"
     )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=None,
+        help="number of processes parsing collections in parallel. If omitted one per CPU is used"
+    )
+    parser.add_argument(
+        "-cache",
+        type=str,
+        default=".collection-index-cache.json",
+        help="file caching parsed collections by path, size and mtime so unchanged bundles are skipped on later runs"
+    )
+    parser.add_argument(
+        "-no-cache",
+        action="store_true",
+        help="parse every collection and do not read or write the cache file"
+    )
     input_options = parser.add_mutually_exclusive_group(required=True) # require at least one input type
     input_options.add_argument(
         '-files',
@@ -142,6 +307,6 @@ if __name__ == "__main__":
     args = parser.parse_args()
     # print(json.dumps(generate_index(args.name, args.description, args.root_url, files=args.files, folder=args.folder), indent=4))
     with open(args.output, "w") as f:
-        index = generate_collection_index(args.name, args.description, args.root_url, collection_index_id=args.collection_index_id, files=args.files, folders=args.folders)
+        index = generate_collection_index(args.name, args.description, args.root_url, collection_index_id=args.collection_index_id, files=args.files, folders=args.folders, workers=args.workers, cache_file=None if args.no_cache else args.cache)
         print(f"writing {args.output}")
         json.dump(index, f, indent=4)
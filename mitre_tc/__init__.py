@@ -0,0 +1,4 @@
+"""
+mitre-tc: one command line entry point for the MITRE text classification tools.
+"""
+__version__ = '0.1.0'
@@ -0,0 +1,4 @@
+from mitre_tc.cli import main
+
+if __name__ == "__main__":
+    main()
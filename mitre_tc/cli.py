@@ -0,0 +1,192 @@
+"""
+Entry point of the mitre-tc command.
+
+Each subcommand runs one of the scripts under tools/. Only this module and the chosen script are
+imported, and the scripts import heavy dependencies (sentence-transformers, pandas, scikit-learn,
+openai) inside the functions that need them, so --help and the non-ML subcommands start quickly.
+"""
+import argparse
+import os
+import sys
+import time
+from mitre_tc import __version__
+from mitre_tc.config import SETTINGS, load_settings
+
+PROFILE_DIR = os.path.join('data', 'profiles')
+
+# name: (script relative to the tools directory, settings the script accepts as flags, summary)
+COMMANDS = {
+    'ingest': ('data-scraper/mitre-stix-ingest.py', ('db', 'stix_dir'),
+               "Load ATT&CK STIX bundles into the database."),
+    'diff': ('data-scraper/mitre-stix-diff.py', ('stix_dir',),
+             "Compare two ATT&CK releases and write the affected technique IDs."),
+    'fetch-citations': ('data-scraper/mitre-citation-fetcher.py', ('db', 'store_dir'),
+                        "Download the articles cited by techniques."),
+    'generate': ('synthetic-data-generator/mitre-technique-human-text-generator.py', ('db',),
+                 "Generate synthetic texts through the OpenAI API."),
+    'batch-build': ('synthetic-data-generator/mitre-technique-human-text-generator-batch.py', ('db',),
+                    "Build (and optionally submit) OpenAI batch input shards."),
+    'batch-ingest': ('synthetic-data-generator/mitre-technique-human-text-generator-batch-parser.py', ('db',),
+                     "Load OpenAI batch output files into the synthetic text table."),
+    'embed': ('cosine-similarity/embed-texts.py', ('db', 'cache'),
+              "Encode technique descriptions and synthetic texts into the embedding cache."),
+    'bulk-embed': ('cosine-similarity/bulk-embed.py', ('db',),
+                   "Embed a whole text source into an embedding store with a pool of encoder processes."),
+    'dedup': ('deduplication/find-near-duplicates.py', ('db',),
+              "Flag near-duplicate synthetic texts and articles with MinHash/LSH, incrementally."),
+    'classify': ('cosine-similarity/cosine-similarity.py', ('db', 'cache'),
+                 "Classify synthetic texts against techniques by cosine similarity."),
+    'serve': ('cosine-similarity/classification-server.py', ('db', 'cache'),
+              "Serve classification over HTTP with the model kept in memory."),
+    'evaluate': ('cosine-similarity/evaluate-classifications.py', ('db',),
+                 "Score a top-k classification CSV against the gold technique IDs."),
+    'export-onnx': ('cosine-similarity/export-onnx-model.py', (),
+                    "Export the encoder to ONNX with an int8-quantized copy for --backend onnx."),
+    'encoder-parity': ('cosine-similarity/encoder-parity-report.py', ('db',),
+                       "Compare the ONNX int8 encoder against PyTorch: agreement, throughput and memory."),
+    'train': ('traditional-ml/train-models.py', ('db', 'cache'),
+              "Cross-validate and train the traditional ML models on cached embeddings."),
+    'classify-model': ('traditional-ml/classify-with-model.py', ('db', 'cache'),
+                       "Classify embedded texts with a saved traditional ML model."),
+    'build-prototypes': ('cosine-similarity/build-prototype-index.py', ('db', 'cache'),
+                         "Build or update the per-technique prototype index scored by classify --prototypes."),
+    'build-lexical': ('cosine-similarity/build-lexical-index.py', ('db',),
+                      "Build the per-technique BM25 index used by classify --hybrid."),
+    'fit-reducer': ('cosine-similarity/fit-reducer.py', (),
+                    "Fit a PCA or random-projection reducer for scoring and storing fewer dimensions."),
+    'reduction-report': ('cosine-similarity/reduction-report.py', (),
+                         "Report accuracy, store size and scoring speed per reducer and dimension."),
+    'industry-ingest': ('industry-analysis/ingest-classifications.py', ('db',),
+                        "Add top-k classification CSVs to the industry x technique summary tables."),
+    'industry-report': ('industry-analysis/industry-report.py', ('db',),
+                        "Report techniques over-represented in an industry, with log-odds and chi-square statistics."),
+    'bench': ('benchmarks/run-benchmarks.py', ('stix_dir',),
+              "Time every pipeline stage offline and write comparable JSON results."),
+}
+
+def has_flag(args, flag):
+    return any(arg == flag or arg.startswith(flag + '=') for arg in args)
+
+def build_argv(command, args, settings):
+    """
+    Returns the arguments passed to a command's script: the user's arguments plus a flag for every
+    configured setting the script accepts and the user did not already give.
+    """
+    _, accepted, _ = COMMANDS[command]
+    argv = list(args)
+    for name in accepted:
+        flag = SETTINGS[name]
+        if name in settings and not has_flag(argv, flag):
+            argv += [flag, settings[name]]
+    return argv
+
+def load_script(path):
+    """
+    Imports a tool script as a module named after its file, e.g. mitre_tc_mitre_stix_ingest.
+    The script's directory goes first on sys.path so its sibling modules import as usual; the prefix keeps a
+    script such as bulk-embed.py from shadowing its sibling module bulk_embed.py in sys.modules.
+    """
+    import importlib.util
+    name = 'mitre_tc_' + os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def run_script(path, argv, prog):
+    """
+    Runs a tool script's main() with argv, the way `python <path> <argv>` would, under the program name prog.
+    """
+    module = load_script(path)
+    sys.argv = [prog] + argv
+    module.main()
+
+def default_profile_path(command):
+    return os.path.join(PROFILE_DIR, f"{command}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+def run_profiled(path, argv, prog, command, output, python_profile=False, sample_hz=None):
+    """
+    Runs a tool script like run_script with tracing enabled, then writes the Chrome trace to output and prints
+    the per-stage summary. python_profile adds cProfile statistics in <output>.pstats, sample_hz stack samples
+    in <output>.folded.
+    """
+    from mitre_tc import tracing
+    base = os.path.splitext(output)[0]
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    tracer = tracing.enable()
+    sampler = tracing.StackSampler(sample_hz).start() if sample_hz else None
+    profiler = None
+    if python_profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with tracing.span(command):
+            run_script(path, argv, prog)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        tracing.disable()
+        # Each artifact is written on its own, so one that cannot be written does not lose the others
+        artifacts = [(output, lambda: tracer.write(output, {'command': command, 'argv': argv}))]
+        if profiler is not None:
+            artifacts.append((base + '.pstats', lambda: profiler.dump_stats(base + '.pstats')))
+        if sampler is not None:
+            artifacts.append((base + '.folded', lambda: sampler.write(base + '.folded')))
+        for path, write in artifacts:
+            try:
+                write()
+                print(f"Profile written to {path}", file=sys.stderr)
+            except OSError as e:
+                print(f"Could not write {path}: {e}", file=sys.stderr)
+        tracing.print_summary(tracer.summary())
+
+def main(argv=None):
+    commands = '\n'.join(f"  {name:<16} {summary}" for name, (_, _, summary) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog='mitre-tc',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="MITRE text classification pipeline. Run 'mitre-tc <command> --help' for a command's options.",
+        epilog=f"commands:\n{commands}\n\n"
+               "Paths come from flags, MITRE_TC_<SETTING> environment variables or the [paths] table of\n"
+               f"mitre-tc.toml (settings: {', '.join(SETTINGS)}, tools_dir).",
+    )
+    parser.add_argument('--config', type=str,
+                        help="Optional: Config file (default: $MITRE_TC_CONFIG, else ./mitre-tc.toml if present).")
+    parser.add_argument('--version', action='version', version=f"mitre-tc {__version__}")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time the command's stages and write a Chrome trace (chrome://tracing, ui.perfetto.dev) "
+                             "with a per-stage summary of seconds, items, bytes and peak RSS.")
+    parser.add_argument('--profile-output', type=str,
+                        help=f"Trace file of --profile (default: {os.path.join(PROFILE_DIR, '<command>-<time>.json')}).")
+    parser.add_argument('--profile-python', action='store_true',
+                        help="With --profile, also run cProfile and write its statistics next to the trace as .pstats.")
+    parser.add_argument('--profile-sample', type=int, metavar='HZ',
+                        help="With --profile, also sample Python stacks HZ times per second into a .folded file "
+                             "(the py-spy raw format read by flamegraph.pl and speedscope).")
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command', help="One of the commands listed below.")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Arguments passed on to the command.")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_settings(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    script, _, _ = COMMANDS[args.command]
+    path = os.path.join(settings['tools_dir'], script)
+    if not os.path.exists(path):
+        parser.error(f"{path} not found. Install mitre-tc from a checkout with 'pip install -e .' or set tools_dir.")
+    argv = build_argv(args.command, args.args, settings)
+    if args.profile:
+        run_profiled(path, argv, f"mitre-tc {args.command}", args.command,
+                     args.profile_output or default_profile_path(args.command), args.profile_python, args.profile_sample)
+    else:
+        run_script(path, argv, f"mitre-tc {args.command}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+
+CONFIG_FILE = 'mitre-tc.toml'
+CONFIG_ENV = 'MITRE_TC_CONFIG'
+ENV_PREFIX = 'MITRE_TC_'
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools')
+
+# Settings a config file or MITRE_TC_<NAME> environment variable may provide, with the flag each one maps to.
+# Tools that do not accept a flag are simply not given it.
+SETTINGS = {
+    'db': '--db',
+    'stix_dir': '--stix-dir',
+    'cache': '--cache',
+    'store_dir': '--store-dir',
+}
+
+def read_config_file(path):
+    """
+    Reads the [paths] table of a TOML config file.
+    Returns a dict of setting name -> value; unknown keys are rejected so typos do not go unnoticed.
+    """
+    import tomllib
+    with open(path, 'rb') as f:
+        paths = tomllib.load(f).get('paths', {})
+    unknown = set(paths) - set(SETTINGS) - {'tools_dir'}
+    if unknown:
+        raise ValueError(f"Unknown setting(s) in {path}: {', '.join(sorted(unknown))}. Known: {', '.join(SETTINGS)}, tools_dir.")
+    return {name: str(value) for name, value in paths.items()}
+
+def load_settings(config_file=None, environ=os.environ):
+    """
+    Resolves settings from, in increasing priority, the config file and MITRE_TC_<NAME> environment variables.
+    The config file is config_file, else $MITRE_TC_CONFIG, else mitre-tc.toml in the working directory if present.
+    Flags given on the command line win over both and are handled by the caller.
+    """
+    config_file = config_file or environ.get(CONFIG_ENV)
+    if config_file is None and os.path.exists(CONFIG_FILE):
+        config_file = CONFIG_FILE
+    settings = read_config_file(config_file) if config_file else {}
+    for name in list(SETTINGS) + ['tools_dir']:
+        value = environ.get(ENV_PREFIX + name.upper())
+        if value:
+            settings[name] = value
+    settings.setdefault('tools_dir', TOOLS_DIR)
+    return settings
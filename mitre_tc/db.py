@@ -0,0 +1,275 @@
+"""
+Shared access to the SQLite database every tool reads and writes (data/sqlite3/mitre_data.db).
+
+It owns the schema: connect() opens a connection in WAL mode with tuned pragmas, and ensure_schema()
+creates the tables a tool needs, adds columns introduced since a database was created and builds
+the indexes. In WAL mode readers see the last committed state and never block the writer, so a classifier can
+read while a generation or ingest run keeps committing.
+Only the standard library is used, so importing this module costs nothing measurable.
+"""
+import os
+import sqlite3
+from mitre_tc.tracing import span
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+BUSY_TIMEOUT_MS = 30000 # How long a writer waits for another writer's lock before giving up
+CACHE_SIZE_KIB = 64 * 1024 # Page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024 # Bytes of the database file read through mmap
+ROWS_PER_TRANSACTION = 5000 # Rows per executemany transaction in insert_rows
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL', # Durable at WAL checkpoints; a crash can only lose the last commits
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    f'PRAGMA cache_size = -{CACHE_SIZE_KIB}',
+    'PRAGMA temp_store = MEMORY',
+    f'PRAGMA mmap_size = {MMAP_SIZE}',
+)
+
+SYNTHETIC_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    technique_id TEXT,
+    name TEXT,
+    text TEXT
+)
+"""
+# superseded marks texts of a changed technique that are kept until their regenerated replacement is stored
+SYNTHETIC_COLUMNS = (('custom_id', 'TEXT'), ('technicality', 'TEXT'), ('style', 'TEXT'), ('iteration', 'INTEGER'),
+                     ('superseded', 'INTEGER DEFAULT 0'))
+SYNTHETIC_INDEXES = (
+    ('custom_id', ('custom_id',), True), # Makes batch ingest reruns idempotent; NULL custom_ids do not collide
+    ('variant', ('technique_id', 'technicality', 'style', 'iteration'), False),
+)
+# table: (CREATE TABLE statement, columns added since the table was introduced, indexes as (suffix, columns, unique))
+SCHEMA = {
+    'mitre_technique_descriptions': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        attack_pattern TEXT PRIMARY KEY,
+        technique_id TEXT,
+        name TEXT,
+        description TEXT
+    )
+    """, (('domain', 'TEXT'), ('attack_version', 'TEXT'), ('modified', 'TEXT'),
+          ('revoked', 'INTEGER DEFAULT 0'), ('deprecated', 'INTEGER DEFAULT 0')),
+        (('technique_id', ('technique_id',), False),)),
+    'mitre_technique_references': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        source_name TEXT,
+        url TEXT,
+        attack_pattern TEXT,
+        technique_id TEXT,
+        PRIMARY KEY (attack_pattern, url)
+    )
+    """, (('domain', 'TEXT'),),
+        (('technique_id', ('technique_id',), False), ('url', ('url',), False))),
+    'synthetic_texts': (SYNTHETIC_TABLE, SYNTHETIC_COLUMNS, SYNTHETIC_INDEXES),
+    'synthetic_texts_test': (SYNTHETIC_TABLE, SYNTHETIC_COLUMNS, SYNTHETIC_INDEXES),
+    'citation_fetches': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        url TEXT PRIMARY KEY,
+        status INTEGER,
+        etag TEXT,
+        last_modified TEXT,
+        content_type TEXT,
+        content_sha256 TEXT,
+        fetched_at TEXT,
+        attempts INTEGER DEFAULT 0,
+        error TEXT
+    )
+    """, (), ()),
+    'cited_article_texts': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        content_sha256 TEXT PRIMARY KEY,
+        title TEXT,
+        text TEXT
+    )
+    """, (), ()),
+    'cited_articles': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        url TEXT,
+        attack_pattern TEXT,
+        technique_id TEXT,
+        content_sha256 TEXT,
+        PRIMARY KEY (url, attack_pattern)
+    )
+    """, (), (('technique_id', ('technique_id',), False),)),
+    'industry_batches': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        content_sha256 TEXT,
+        industry TEXT,
+        source TEXT,
+        input_file TEXT,
+        texts INTEGER,
+        ingested_at TEXT,
+        PRIMARY KEY (content_sha256, industry, source)
+    )
+    """, (), ()),
+    'industry_technique_counts': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        industry TEXT,
+        source TEXT,
+        technique_id TEXT,
+        texts INTEGER DEFAULT 0,
+        passed INTEGER DEFAULT 0,
+        score_sum REAL DEFAULT 0,
+        PRIMARY KEY (industry, source, technique_id)
+    )
+    """, (), ()),
+    'industry_score_histogram': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        industry TEXT,
+        source TEXT,
+        technique_id TEXT,
+        bin INTEGER,
+        texts INTEGER DEFAULT 0,
+        PRIMARY KEY (industry, source, technique_id, bin)
+    )
+    """, (), ()),
+    'text_minhashes': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        source_table TEXT,
+        row_id INTEGER,
+        signature BLOB,
+        PRIMARY KEY (source_table, row_id)
+    )
+    """, (), ()),
+    'near_duplicates': ("""
+    CREATE TABLE IF NOT EXISTS {table} (
+        source_table TEXT,
+        row_id INTEGER,
+        duplicate_of_table TEXT,
+        duplicate_of_row_id INTEGER,
+        similarity REAL,
+        PRIMARY KEY (source_table, row_id)
+    )
+    """, (), (('duplicate_of', ('duplicate_of_table', 'duplicate_of_row_id'), False),)),
+}
+
+def connect(db_file=DB_FILE):
+    """
+    Opens a connection with the shared pragmas applied. WAL mode is stored in the database file, so the
+    first connection switches an existing rollback-journal database over for every later one.
+    """
+    db = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000)
+    for pragma in PRAGMAS:
+        db.execute(pragma)
+    return db
+
+def table_columns(db, table):
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+def ensure_schema(db, tables, kind=None):
+    """
+    Creates the given tables if missing, adds the columns newer code relies on and builds their indexes.
+    A table not in SCHEMA, such as a custom synthetic table given with --table, uses the schema of kind.
+    Safe to run on every start: each step is skipped when already applied.
+    """
+    for table in tables:
+        create, columns, indexes = SCHEMA[table if table in SCHEMA else kind]
+        db.execute(create.format(table=table))
+        existing = table_columns(db, table)
+        for column, column_type in columns:
+            if column not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        for suffix, index_columns, unique in indexes:
+            db.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS idx_{table}_{suffix} "
+                       f"ON {table} ({', '.join(index_columns)})")
+    db.commit()
+
+def prefix_range(prefix):
+    """
+    Returns (low, high) such that low <= value < high holds exactly for the strings starting with prefix.
+    Unlike LIKE 'prefix%', the range comparison can use a plain index on the column.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def technique_filter(technique_id=None, prefix=None, column='technique_id'):
+    """
+    Returns a (WHERE clause, parameters) pair selecting one technique ID exactly, or every ID starting with
+    prefix, e.g. T1059 for the technique and all of its sub-techniques. Both are index lookups.
+    """
+    if technique_id:
+        return f"WHERE {column} = ?", (technique_id,)
+    if prefix:
+        return f"WHERE {column} >= ? AND {column} < ?", prefix_range(prefix)
+    return "", ()
+
+def active_techniques(db, table='mitre_technique_descriptions'):
+    """
+    Returns the SQL condition selecting the techniques to generate for and classify against: those with a
+    description that are neither revoked nor deprecated. Databases ingested before the revoked and deprecated
+    columns existed are only filtered on the description.
+    """
+    columns = table_columns(db, table)
+    return ' AND '.join([f"{column} = 0" for column in ('revoked', 'deprecated') if column in columns] +
+                        ['description IS NOT NULL'])
+
+def retired_techniques(db, table='mitre_technique_descriptions'):
+    """
+    Returns the set of technique IDs all of whose rows are revoked or deprecated, so that synthetic texts and
+    articles labelled with them can be left out of classification targets too.
+    """
+    columns = {'revoked', 'deprecated'} & table_columns(db, table)
+    if not columns:
+        return set()
+    retired = ' OR '.join(f"{column} = 1" for column in sorted(columns))
+    return {technique_id for (technique_id,) in db.execute(
+        f"SELECT technique_id FROM {table} GROUP BY technique_id HAVING MIN(CASE WHEN {retired} THEN 1 ELSE 0 END) = 1")}
+
+def iter_techniques(db, technique_id=None, prefix=None, table='mitre_technique_descriptions'):
+    """
+    Streams (technique_id, name, description) rows of the active techniques, all of them or those matching
+    technique_id or prefix.
+    """
+    where, parameters = technique_filter(technique_id, prefix)
+    where = f"{where} AND {active_techniques(db, table)}" if where else f"WHERE {active_techniques(db, table)}"
+    yield from db.execute(f"SELECT technique_id, name, description FROM {table} {where}", parameters)
+
+def load_texts(db_file, query, parameters=()):
+    """
+    Returns the first column of the rows selected by query, with NULLs replaced by empty strings.
+    An {active} placeholder in query is replaced by the active_techniques() condition.
+    """
+    db = connect(db_file)
+    try:
+        if '{active}' in query:
+            query = query.format(active=active_techniques(db))
+        return [text or '' for (text, *_) in db.execute(query, parameters)]
+    finally:
+        db.close()
+
+def insert_rows(db, table, columns, rows, conflict=None, update=(), accumulate=(),
+                rows_per_transaction=ROWS_PER_TRANSACTION):
+    """
+    Inserts an iterable of row tuples with executemany, committing every rows_per_transaction rows. With
+    rows_per_transaction=None nothing is committed, so the rows land in the caller's transaction.
+    conflict names the columns of a unique key: a row colliding on it overwrites the update columns and adds
+    its values to the accumulate columns, or is skipped when both are empty.
+    Returns the number of rows inserted or updated.
+    """
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    if conflict:
+        assignments = ', '.join([f"{column} = excluded.{column}" for column in update] +
+                                [f"{column} = {column} + excluded.{column}" for column in accumulate])
+        sql += f" ON CONFLICT({', '.join(conflict)}) DO " + (f"UPDATE SET {assignments}" if assignments else "NOTHING")
+    before = db.total_changes
+    if rows_per_transaction is None:
+        # Rows given as a generator are produced inside this span
+        with span('db.insert', table=table) as current:
+            db.executemany(sql, rows)
+            current.add(items=db.total_changes - before)
+        return db.total_changes - before
+    pending = []
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= rows_per_transaction:
+            _commit_rows(db, table, sql, pending)
+            pending = []
+    if pending:
+        _commit_rows(db, table, sql, pending)
+    return db.total_changes - before
+
+def _commit_rows(db, table, sql, rows):
+    with span('db.commit', table=table) as current, db:
+        db.executemany(sql, rows)
+        current.add(items=len(rows))
@@ -0,0 +1,115 @@
+"""
+Import-time budget check for the mitre-tc command.
+
+Runs `python -X importtime -m mitre_tc <command> --help` for every subcommand in a fresh interpreter and fails if
+a heavy dependency is imported or the cumulative import time exceeds the command's budget.
+
+Example:
+    python -m mitre_tc.import_budget
+    python -m mitre_tc.import_budget --runs 5 ingest classify
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from mitre_tc.cli import COMMANDS
+
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'transformers', 'sklearn', 'pandas', 'openai', 'stix2', 'onnxruntime')
+BUDGET_MS = 80.0 # Import budget of the stdlib-only subcommands
+ASYNC_BUDGET_MS = 150.0 # generate and fetch-citations import asyncio before parsing arguments
+ML_BUDGET_MS = 250.0 # ML subcommands import numpy before parsing arguments
+COMMAND_BUDGETS = {
+    'generate': ASYNC_BUDGET_MS,
+    'fetch-citations': ASYNC_BUDGET_MS,
+    'embed': ML_BUDGET_MS,
+    'bulk-embed': ML_BUDGET_MS,
+    'dedup': ML_BUDGET_MS,
+    'classify': ML_BUDGET_MS,
+    'serve': ML_BUDGET_MS,
+    'evaluate': ML_BUDGET_MS,
+    'export-onnx': ML_BUDGET_MS,
+    'encoder-parity': ML_BUDGET_MS,
+    'train': ML_BUDGET_MS,
+    'classify-model': ML_BUDGET_MS,
+    'build-prototypes': ML_BUDGET_MS,
+    'build-lexical': ML_BUDGET_MS,
+    'fit-reducer': ML_BUDGET_MS,
+    'reduction-report': ML_BUDGET_MS,
+    'industry-ingest': ML_BUDGET_MS,
+    'industry-report': ML_BUDGET_MS,
+    'bench': ML_BUDGET_MS,
+}
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def measure_imports(command, cwd):
+    """
+    Runs one subcommand's --help with -X importtime.
+    Returns (total import microseconds of top-level imports, set of imported module names, exit code).
+    """
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    env.pop('MITRE_TC_CONFIG', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'mitre_tc', command, '--help'],
+        capture_output=True, text=True, cwd=cwd, env=env,
+    )
+    total_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        modules.add(match.group(4))
+        if len(match.group(3)) == 1: # Top-level imports only; nested ones are inside their cumulative time
+            total_us += int(match.group(2))
+    return total_us, modules, result.returncode
+
+def check_command(command, runs, cwd):
+    """
+    Returns (best import time in ms over runs, heavy modules imported, exit code) for one subcommand.
+    """
+    best_us, heavy, returncode = None, set(), 0
+    for _ in range(runs):
+        total_us, modules, returncode = measure_imports(command, cwd)
+        heavy |= {module for module in modules if module.split('.')[0] in HEAVY_MODULES}
+        best_us = total_us if best_us is None else min(best_us, total_us)
+    return best_us / 1000.0, heavy, returncode
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every mitre-tc subcommand starts within its import budget.")
+    parser.add_argument('commands', nargs='*', help="Subcommands to check (default: all).")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per subcommand; the fastest counts (default: 3).")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiplies every budget, for slow or heavily loaded machines (default: 1.0).")
+    args = parser.parse_args()
+
+    unknown = set(args.commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"Unknown subcommand(s): {', '.join(sorted(unknown))}")
+
+    failures = 0
+    print(f"{'command':<16} {'imports ms':>10} {'budget':>8}  result")
+    # Run from an empty directory so a local mitre-tc.toml cannot change what is measured
+    with tempfile.TemporaryDirectory() as cwd:
+        results = {command: check_command(command, args.runs, cwd) for command in args.commands or list(COMMANDS)}
+    for command, (elapsed_ms, heavy, returncode) in results.items():
+        budget = COMMAND_BUDGETS.get(command, BUDGET_MS) * args.scale
+        problems = []
+        if returncode != 0:
+            problems.append(f"exit code {returncode}")
+        if heavy:
+            problems.append(f"imported {', '.join(sorted(heavy))}")
+        if elapsed_ms > budget:
+            problems.append("over budget")
+        failures += bool(problems)
+        print(f"{command:<16} {elapsed_ms:>10.1f} {budget:>8.0f}  {'; '.join(problems) or 'ok'}")
+
+    if failures:
+        print(f"\n{failures} subcommand(s) failed the import budget.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
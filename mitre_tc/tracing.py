@@ -0,0 +1,242 @@
+"""
+Timed spans around the pipeline stages, written as a Chrome trace (chrome://tracing, ui.perfetto.dev).
+
+Stages wrap their work in span('stage.step'), and may add counts such as items or bytes to the open span:
+
+    with span('score.chunk') as current:
+        ...
+        current.add(items=len(chunk))
+
+Until enable() is called, span() returns one shared no-op object, so instrumented code costs a function call
+and an attribute check per span and the spans can stay in place for production runs. `mitre-tc --profile`
+enables tracing for one command and writes the trace, a per-stage summary and optionally cProfile statistics
+or sampled stacks next to it.
+Only the standard library is used, so importing this module costs nothing measurable.
+"""
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+MAX_EVENTS = 1_000_000 # Spans kept as trace events; later spans only count towards the summary
+SAMPLE_HZ = 100 # Default stack samples per second of --profile-sample
+
+_tracer = None
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+NO_SPAN = _NoSpan()
+
+def span(name, **attributes):
+    """
+    Returns a context manager timing the enclosed block under name, with attributes recorded as its arguments.
+    Returns the shared no-op span while tracing is disabled.
+    """
+    if _tracer is None:
+        return NO_SPAN
+    return Span(_tracer, name, attributes)
+
+def enabled():
+    return _tracer is not None
+
+def peak_rss_mib():
+    """
+    Returns the peak resident set size of this process in MiB, or None where the resource module is missing.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _track():
+    # Concurrent asyncio tasks get their own track, since spans on one track must nest
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task)
+    return threading.get_ident()
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.args = attributes
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def add(self, **counts):
+        """
+        Adds counts such as items=, bytes= or requests= to the span.
+        """
+        for key, value in counts.items():
+            self.args[key] = self.args.get(key, 0) + value
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.tracer.record(self, time.perf_counter_ns(), exc_type)
+        return False
+
+class Tracer:
+    """
+    Collects finished spans as Chrome trace events and running totals per span name.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.origin = time.perf_counter_ns()
+        self.started_at = time.time()
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.totals = collections.defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'counts': collections.Counter(), 'errors': 0})
+        self.peak_rss_mib = None
+        self._lock = threading.Lock()
+        self._tracks = {}
+
+    def record(self, current, end, error=None):
+        args = current.args
+        rss = peak_rss_mib()
+        if rss is not None:
+            args['peak_rss_mib'] = round(rss, 1)
+        if error is not None:
+            args['error'] = error.__name__
+        track = _track()
+        with self._lock:
+            total = self.totals[current.name]
+            total['calls'] += 1
+            total['seconds'] += (end - current.start) / 1e9
+            total['counts'].update({key: value for key, value in args.items()
+                                    if isinstance(value, (int, float)) and not isinstance(value, bool) and key != 'peak_rss_mib'})
+            total['errors'] += error is not None
+            self.peak_rss_mib = rss if rss is not None else self.peak_rss_mib
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append({
+                'name': current.name, 'cat': current.name.split('.', 1)[0], 'ph': 'X',
+                'ts': (current.start - self.origin) / 1000, 'dur': (end - current.start) / 1000,
+                'pid': os.getpid(), 'tid': self._tracks.setdefault(track, len(self._tracks) + 1), 'args': args,
+            })
+
+    def summary(self):
+        """
+        Returns one dict per span name, in order of first completion: calls, total seconds, summed counts
+        and, for items and bytes, the rate per second.
+        """
+        with self._lock:
+            rows = []
+            for name, total in self.totals.items():
+                row = {'name': name, 'calls': total['calls'], 'seconds': round(total['seconds'], 6), 'errors': total['errors']}
+                row.update(total['counts'])
+                for key in ('items', 'bytes'):
+                    if key in total['counts'] and total['seconds'] > 0:
+                        row[f'{key}_per_second'] = round(total['counts'][key] / total['seconds'], 1)
+                rows.append(row)
+            return rows
+
+    def write(self, path, metadata=None):
+        """
+        Writes the trace events with the summary and metadata to path as Chrome trace JSON.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': (metadata or {}).get('command', 'mitre-tc')}})
+        trace = {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': dict(metadata or {}, started_at=self.started_at, peak_rss_mib=self.peak_rss_mib,
+                              dropped_events=self.dropped),
+            'stages': self.summary(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+
+def enable(max_events=MAX_EVENTS):
+    """
+    Starts collecting spans in a new Tracer and returns it.
+    """
+    global _tracer
+    _tracer = Tracer(max_events)
+    return _tracer
+
+def disable():
+    """
+    Stops collecting spans. Returns the Tracer that collected them, or None if tracing was not enabled.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+class StackSampler:
+    """
+    Samples the Python stacks of all other threads hz times per second and counts them as folded stacks,
+    the text format of py-spy record --format raw, readable by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, hz=SAMPLE_HZ):
+        self.interval = 1.0 / hz
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def print_summary(rows, file=None):
+    """
+    Prints a per-stage table of calls, seconds, items and bytes with their rates.
+    """
+    file = file or sys.stderr
+    print(f"\n{'stage':<28} {'calls':>7} {'seconds':>9} {'items':>10} {'items/s':>10} {'MiB':>9} {'MiB/s':>8}", file=file)
+    for row in sorted(rows, key=lambda row: -row['seconds']):
+        mib = mib_per_second = ''
+        if 'bytes' in row:
+            mib = f"{row['bytes'] / (1024 * 1024):.1f}"
+            mib_per_second = f"{row.get('bytes_per_second', 0) / (1024 * 1024):.1f}"
+        print(f"{row['name']:<28} {row['calls']:>7} {row['seconds']:>9.3f} {row.get('items', ''):>10} "
+              f"{row.get('items_per_second', ''):>10} {mib:>9} {mib_per_second:>8}", file=file)
@@ -0,0 +1,434 @@
+import contextlib
+import datetime
+import gc
+import importlib.metadata
+import importlib.util
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join('data', 'benchmarks')
+RESULTS_FORMAT = 1 # Bumped when the results file layout changes
+STIX_DIR = os.path.join('data', 'attack-stix-data-master')
+STIX_DOMAINS = ('ics-attack', 'mobile-attack')
+BATCH_OUTPUT_FILE = os.path.join('data', 'openai-batches', 'batch_6859b0f79a9c8190bdf0d62ff7903192_output.jsonl')
+TECHNIQUE_EMBEDDINGS_FILE = 'technique_embeddings.npy'
+SYNTHETIC_EMBEDDINGS_FILE = 'synthetic_embeddings.npy'
+SCALES = (1, 10)
+SEED = 1234 # Seed of every scale-up generator, so a scale means the same data on every run
+NOISE = 0.05 # Standard deviation of the noise added to each tiled copy of an embedding
+ITERATION_STRIDE = 1000 # Copy c of a batch output line gets iteration c * ITERATION_STRIDE + its own
+TOP_K = 5
+ENCODE_TEXTS = 256 # Sample texts encoded per encoder benchmark; encoding is not scaled
+ENCODE_BATCH_SIZE = 64
+REPORTED_PACKAGES = ('numpy', 'onnxruntime', 'torch', 'sentence-transformers', 'transformers', 'scikit-learn')
+ITERATION_SUFFIX = re.compile(r'_iteration_(\d+)$')
+
+_tools = {}
+
+def load_tool(path):
+    """
+    Imports a tool script (relative to the tools directory) as a module, with its directory on sys.path so its
+    sibling modules import as usual. Scripts are loaded once; the bench_ prefix keeps them apart from the
+    modules of the same name they sit next to.
+    """
+    if path not in _tools:
+        full_path = os.path.join(TOOLS_DIR, path)
+        name = 'bench_' + os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+        if os.path.dirname(full_path) not in sys.path:
+            sys.path.insert(0, os.path.dirname(full_path))
+        spec = importlib.util.spec_from_file_location(name, full_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        _tools[path] = module
+    return _tools[path]
+
+class Context:
+    """
+    Inputs and options shared by every benchmark of a run, plus the fixtures built from them.
+    Fixtures are generated once per scale into workdir and reused by the benchmarks that need them.
+    """
+
+    def __init__(self, workdir, stix_dir=STIX_DIR, batch_output=BATCH_OUTPUT_FILE,
+                 technique_embeddings=TECHNIQUE_EMBEDDINGS_FILE, synthetic_embeddings=SYNTHETIC_EMBEDDINGS_FILE,
+                 backends=('torch', 'onnx'), onnx_dir=None, threads=None, encode_texts=ENCODE_TEXTS):
+        self.workdir = workdir
+        self.stix_dir = stix_dir
+        self.batch_output = batch_output
+        self.technique_embeddings = technique_embeddings
+        self.synthetic_embeddings = synthetic_embeddings
+        self.backends = backends
+        self.onnx_dir = onnx_dir
+        self.threads = threads
+        self.encode_texts = encode_texts
+        self._fixtures = {}
+
+    def path(self, *parts):
+        path = os.path.join(self.workdir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def fixture(self, name, scale, build):
+        key = (name, scale)
+        if key not in self._fixtures:
+            self._fixtures[key] = build(self, scale)
+        return self._fixtures[key]
+
+# Scale-up generators. Each writes or returns scale copies of a real input, changed just enough that the
+# copies are distinct rows to the stage under test, and is deterministic for a given scale.
+
+def write_scaled_bundle(bundle_file, scale, output_file):
+    """
+    Writes a bundle holding the collection object and scale copies of every attack-pattern of bundle_file.
+    Copies after the first get their own STIX id, so the ingest upserts each of them.
+    Returns the number of attack-patterns written.
+    """
+    stix_stream = load_tool(os.path.join('data-scraper', 'stix_stream.py'))
+    objects = list(stix_stream.iter_bundle_objects(bundle_file, types=('x-mitre-collection', 'attack-pattern')))
+    written = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('{"type": "bundle", "id": "bundle--benchmark", "objects": [\n')
+        separator = ''
+        for copy in range(scale):
+            for stix_object in objects:
+                if stix_object['type'] != 'attack-pattern':
+                    if copy:
+                        continue
+                elif copy:
+                    stix_object = dict(stix_object, id=f"{stix_object['id'][:-8]}{copy:08x}")
+                f.write(separator + json.dumps(stix_object))
+                separator = ',\n'
+                written += stix_object['type'] == 'attack-pattern'
+        f.write('\n]}\n')
+    return written
+
+def write_scaled_batch_output(batch_file, scale, output_file):
+    """
+    Writes scale copies of a batch output file; copy c shifts every custom_id's iteration by c * ITERATION_STRIDE
+    so no two lines share a custom_id. Returns the number of lines written.
+    """
+    with open(batch_file, 'r', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for copy in range(scale):
+            for data in lines:
+                custom_id = ITERATION_SUFFIX.sub(
+                    lambda match: f"_iteration_{copy * ITERATION_STRIDE + int(match.group(1))}", data.get('custom_id') or '')
+                f.write(json.dumps(dict(data, custom_id=custom_id)) + '\n')
+    return len(lines) * scale
+
+def scaled_embeddings(embeddings, scale, seed=SEED, noise=NOISE):
+    """
+    Returns scale copies of embeddings stacked row-wise; copies after the first get gaussian noise so they
+    do not score identically. Rows keep their unit length.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    copies = [embeddings]
+    for _ in range(scale - 1):
+        copy = embeddings + rng.normal(0.0, noise, embeddings.shape).astype(np.float32)
+        copies.append(copy / np.linalg.norm(copy, axis=1, keepdims=True))
+    return np.vstack(copies)
+
+# Fixtures
+
+def _bundles(context, scale):
+    bundles = []
+    for domain in STIX_DOMAINS:
+        bundle_file = os.path.join(context.stix_dir, domain, f"{domain}.json")
+        if not os.path.exists(bundle_file):
+            raise FileNotFoundError(f"{bundle_file} not found")
+        output_file = context.path(f"stix-x{scale}", f"{domain}.json")
+        bundles.append((output_file, write_scaled_bundle(bundle_file, scale, output_file)))
+    return bundles
+
+def _technique_db(context, scale):
+    # The unscaled ICS techniques, the input the batch builder reads
+    ingest = load_tool(os.path.join('data-scraper', 'mitre-stix-ingest.py'))
+    db_file = context.path('techniques.db')
+    db = ingest.open_ingest_db(db_file)
+    try:
+        with db:
+            ingest.ingest_bundle(db, os.path.join(context.stix_dir, 'ics-attack', 'ics-attack.json'), {},
+                                 {'seen': 0, 'upserted': 0, 'references': 0})
+    finally:
+        db.close()
+    return db_file
+
+def _batch_output(context, scale):
+    if not os.path.exists(context.batch_output):
+        raise FileNotFoundError(f"{context.batch_output} not found")
+    output_file = context.path(f"batch-output-x{scale}.jsonl")
+    return output_file, write_scaled_batch_output(context.batch_output, scale, output_file)
+
+def _embeddings(context, scale):
+    scoring = load_tool(os.path.join('cosine-similarity', 'scoring.py'))
+    technique_matrix = scoring.normalize_embeddings(np.load(context.technique_embeddings))
+    corpus = scaled_embeddings(scoring.normalize_embeddings(np.load(context.synthetic_embeddings)), scale)
+    return technique_matrix, corpus
+
+# Benchmarks. Each prepares its inputs outside the timed region and returns (run, items, unit): run() is the
+# timed call, and items counts the units it processes, for the throughput column.
+
+def bench_stix_ingest(context, scale):
+    ingest = load_tool(os.path.join('data-scraper', 'mitre-stix-ingest.py'))
+    bundles = context.fixture('bundles', scale, _bundles)
+    db_file = context.path(f"stix-ingest-x{scale}.db")
+
+    def run():
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        db = ingest.open_ingest_db(db_file)
+        stats = {'seen': 0, 'upserted': 0, 'references': 0}
+        try:
+            with db:
+                for bundle_file, _ in bundles:
+                    ingest.ingest_bundle(db, bundle_file, {}, stats)
+        finally:
+            db.close()
+    return run, sum(count for _, count in bundles), 'techniques'
+
+def bench_batch_build(context, scale):
+    batch = load_tool(os.path.join('synthetic-data-generator', 'mitre-technique-human-text-generator-batch.py'))
+    prompt_variants = load_tool(os.path.join('synthetic-data-generator', 'prompt_variants.py'))
+    db_file = context.fixture('technique-db', 1, _technique_db)
+    techniques = list(batch.iter_technique_data(db_file, batch.TABLE_NAME))
+    variants = prompt_variants.all_variants()
+    output_dir = context.path(f"batch-input-x{scale}", '')
+
+    def run():
+        shutil.rmtree(output_dir, ignore_errors=True)
+        batch.build_batch_inputs(techniques, variants, scale, output_dir)
+    return run, len(techniques) * len(variants) * scale, 'requests'
+
+def bench_batch_ingest(context, scale):
+    parser = load_tool(os.path.join('synthetic-data-generator', 'mitre-technique-human-text-generator-batch-parser.py'))
+    batch_file, lines = context.fixture('batch-output', scale, _batch_output)
+    db_file = context.path(f"batch-ingest-x{scale}.db")
+
+    def run():
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        parser.ingest_batch_files(db_file, [batch_file])
+    return run, lines, 'responses'
+
+def _bench_encode(backend):
+    def bench(context, scale):
+        if backend not in context.backends:
+            raise LookupError(f"backend {backend} not selected")
+        encoder_backends = load_tool(os.path.join('cosine-similarity', 'encoder_backends.py'))
+        parser = load_tool(os.path.join('synthetic-data-generator', 'mitre-technique-human-text-generator-batch-parser.py'))
+        if not os.path.exists(context.batch_output):
+            raise FileNotFoundError(f"{context.batch_output} not found")
+        # The synthetic texts of the batch output, the kind of text the encoder sees in production
+        stats = {'read': 0, 'malformed': 0, 'unknown_id': 0, 'failed': 0}
+        texts = [row[3] for row in parser.iter_batch_rows(context.batch_output, {}, stats)][:context.encode_texts]
+        encoder = encoder_backends.load_encoder(backend, onnx_dir=context.onnx_dir or encoder_backends.ONNX_MODEL_DIR,
+                                                threads=context.threads)
+
+        def run():
+            encoder.encode(texts, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True)
+        return run, len(texts), 'texts'
+    return bench
+
+def bench_similarity_matrix(context, scale):
+    technique_matrix, corpus = context.fixture('embeddings', scale, _embeddings)
+
+    def run():
+        corpus @ technique_matrix.T
+    return run, corpus.shape[0], 'texts'
+
+def bench_top_k(context, scale):
+    scoring = load_tool(os.path.join('cosine-similarity', 'scoring.py'))
+    technique_matrix, corpus = context.fixture('embeddings', scale, _embeddings)
+
+    def run():
+        for _ in scoring.iter_top_k(technique_matrix, corpus, TOP_K):
+            pass
+    return run, corpus.shape[0], 'texts'
+
+def _bench_store_scan(layout):
+    def bench(context, scale):
+        embedding_store = load_tool(os.path.join('cosine-similarity', 'embedding_store.py'))
+        scoring = load_tool(os.path.join('cosine-similarity', 'scoring.py'))
+        technique_matrix, corpus = context.fixture('embeddings', scale, _embeddings)
+        store_dir = context.path(f"store-{layout}-x{scale}", '')
+        shutil.rmtree(store_dir, ignore_errors=True)
+        store = embedding_store.EmbeddingStore.create(store_dir, corpus.shape[1], layout)
+        store.append(corpus)
+
+        def run():
+            for _, scores in store.iter_scores(technique_matrix):
+                scoring.top_k_rows(scores, TOP_K)
+        return run, corpus.shape[0], 'texts'
+    return bench
+
+def bench_evaluate(context, scale):
+    scoring = load_tool(os.path.join('cosine-similarity', 'scoring.py'))
+    evaluation = load_tool(os.path.join('cosine-similarity', 'evaluation.py'))
+    technique_matrix, corpus = context.fixture('embeddings', scale, _embeddings)
+    # The n-th synthetic text describes the n-th technique, so copy c of text n is labelled technique n
+    labels = [f"T{i:04d}" for i in range(technique_matrix.shape[0])]
+    gold = [labels[i % len(labels)] for i in range(corpus.shape[0])]
+    chunks = list(scoring.iter_top_k(technique_matrix, corpus, TOP_K))
+
+    def run():
+        results = evaluation.Evaluation(gold)
+        for _ in results.observe(iter(chunks), labels):
+            pass
+        results.threshold_curve()
+        results.per_technique()
+    return run, corpus.shape[0], 'texts'
+
+# name: (pipeline stage, prepare function, whether the benchmark runs at every scale or only once)
+BENCHMARKS = {
+    'stix-ingest': ('ingest', bench_stix_ingest, True),
+    'batch-build': ('batch', bench_batch_build, True),
+    'batch-ingest': ('batch', bench_batch_ingest, True),
+    'encode-torch': ('encode', _bench_encode('torch'), False),
+    'encode-onnx': ('encode', _bench_encode('onnx'), False),
+    'similarity-matrix': ('scoring', bench_similarity_matrix, True),
+    'top-k': ('scoring', bench_top_k, True),
+    'store-scan-float32': ('scoring', _bench_store_scan('float32'), True),
+    'store-scan-int8': ('scoring', _bench_store_scan('int8'), True),
+    'evaluate': ('evaluation', bench_evaluate, True),
+}
+
+def select_benchmarks(patterns=None):
+    """
+    Returns the benchmark names matching any of patterns (a name or a stage), or all of them.
+    """
+    if not patterns:
+        return list(BENCHMARKS)
+    unknown = [pattern for pattern in patterns
+               if pattern not in BENCHMARKS and pattern not in {stage for stage, _, _ in BENCHMARKS.values()}]
+    if unknown:
+        raise ValueError(f"Unknown benchmark or stage: {', '.join(unknown)}")
+    return [name for name, (stage, _, _) in BENCHMARKS.items() if name in patterns or stage in patterns]
+
+def run_benchmark(name, context, scale, repeats=3, warmup=1):
+    """
+    Prepares one benchmark at one scale, runs it warmup times untimed and repeats times timed.
+    Returns its result dict; a benchmark whose inputs or optional dependencies are missing is reported as
+    skipped with the reason instead of failing the run.
+    """
+    stage, prepare, _ = BENCHMARKS[name]
+    result = {'benchmark': name, 'stage': stage, 'scale': scale}
+    # The tools report progress on stdout; it is dropped so only the results are printed
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            run, items, unit = prepare(context, scale)
+        except (ImportError, FileNotFoundError, LookupError) as e:
+            return dict(result, status='skipped', reason=str(e))
+
+        for _ in range(warmup):
+            run()
+        seconds = []
+        for _ in range(repeats):
+            gc.collect()
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+    median = statistics.median(seconds)
+    return dict(result, status='ok', items=items, unit=unit, seconds=seconds, median_s=median, min_s=min(seconds),
+                items_per_s=items / median if median > 0 else None)
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, cwd=TOOLS_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """
+    Returns what a result depends on besides the code: interpreter, package versions and hardware.
+    """
+    packages = {}
+    for package in REPORTED_PACKAGES:
+        try:
+            packages[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            packages[package] = None
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': cpus,
+        'packages': packages,
+        'thread_env': {name: os.environ[name] for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+                       if name in os.environ},
+    }
+
+def run_suite(context, names, scales=SCALES, repeats=3, warmup=1, report=print):
+    """
+    Runs the named benchmarks at every scale (unscaled ones once, at scale 1) and returns the results document.
+    report is called with each result as it finishes.
+    """
+    results = []
+    for name in names:
+        _, _, scaled = BENCHMARKS[name]
+        for scale in (scales if scaled else (1,)):
+            result = run_benchmark(name, context, scale, repeats, warmup)
+            results.append(result)
+            report(result)
+    commit = _git('rev-parse', 'HEAD')
+    return {
+        'format': RESULTS_FORMAT,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')) if commit else None,
+        'environment': environment(),
+        'options': {'repeats': repeats, 'warmup': warmup, 'scales': list(scales), 'seed': SEED,
+                    'encode_texts': context.encode_texts, 'threads': context.threads},
+        'results': results,
+    }
+
+def save_results(document, output=None):
+    """
+    Writes a results document as JSON, by default to data/benchmarks/<timestamp>-<commit>.json.
+    Returns the path written.
+    """
+    if output is None:
+        stamp = document['created'].replace(':', '').replace('-', '').split('+')[0]
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{(document['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    return output
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"{path} has results format {document.get('format')}, expected {RESULTS_FORMAT}.")
+    return document
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Matches the benchmarks two results documents both ran successfully, by name and scale.
+    Returns a list of (benchmark, scale, baseline median, current median, ratio, regressed) where regressed
+    means the current median is more than tolerance slower than the baseline's.
+    """
+    previous = {(result['benchmark'], result['scale']): result for result in baseline['results'] if result['status'] == 'ok'}
+    rows = []
+    for result in current['results']:
+        old = previous.get((result['benchmark'], result['scale']))
+        if result['status'] != 'ok' or old is None:
+            continue
+        ratio = result['median_s'] / old['median_s'] if old['median_s'] > 0 else float('inf')
+        rows.append((result['benchmark'], result['scale'], old['median_s'], result['median_s'], ratio, ratio > 1 + tolerance))
+    return rows
@@ -0,0 +1,96 @@
+import argparse
+import shutil
+import sys
+import tempfile
+from benchmark_suite import (BATCH_OUTPUT_FILE, BENCHMARKS, ENCODE_TEXTS, SCALES, STIX_DIR, SYNTHETIC_EMBEDDINGS_FILE,
+                             TECHNIQUE_EMBEDDINGS_FILE, Context, compare_results, load_results, run_suite,
+                             save_results, select_benchmarks)
+
+def print_result(result):
+    label = f"{result['benchmark']} x{result['scale']}"
+    if result['status'] != 'ok':
+        print(f"{label:<28} skipped: {result['reason']}")
+        return
+    rate = f"{result['items_per_s']:.1f} {result['unit']}/s" if result['items_per_s'] else '-'
+    print(f"{label:<28} median {result['median_s']:>9.4f}s  min {result['min_s']:>9.4f}s  "
+          f"{result['items']:>8} {result['unit']:<11} {rate}")
+
+def main():
+    benchmarks = '\n'.join(f"  {name:<20} {stage}" for name, (stage, _, _) in BENCHMARKS.items())
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Time every pipeline stage offline on the repository's own data and synthetic scale-ups of it, "
+                    "and write the results as JSON that can be compared across commits.",
+        epilog=f"benchmarks (stage):\n{benchmarks}",
+    )
+    parser.add_argument('benchmarks', nargs='*',
+                        help="Optional: Benchmarks or stages to run. Defaults to all of them.")
+    parser.add_argument('--scale', type=int, nargs='+', default=list(SCALES),
+                        help=f"Scale-up factors of the data-dependent benchmarks (default: {' '.join(map(str, SCALES))}).")
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help="Timed runs per benchmark; the median is reported (default: 3).")
+    parser.add_argument('--warmup', type=int, default=1,
+                        help="Untimed runs before the timed ones (default: 1).")
+    parser.add_argument('--stix-dir', type=str, default=STIX_DIR,
+                        help=f"Directory holding the per-domain bundle folders (default: {STIX_DIR}).")
+    parser.add_argument('--batch-output', type=str, default=BATCH_OUTPUT_FILE,
+                        help=f"Batch output file scaled up for the batch ingest and used for encoder texts (default: {BATCH_OUTPUT_FILE}).")
+    parser.add_argument('--techniques', type=str, default=TECHNIQUE_EMBEDDINGS_FILE,
+                        help=f"Technique embeddings (.npy) scored against (default: {TECHNIQUE_EMBEDDINGS_FILE}).")
+    parser.add_argument('--corpus', type=str, default=SYNTHETIC_EMBEDDINGS_FILE,
+                        help=f"Corpus embeddings (.npy) scaled up for the scoring benchmarks (default: {SYNTHETIC_EMBEDDINGS_FILE}).")
+    parser.add_argument('--backend', choices=('torch', 'onnx'), action='append',
+                        help="Optional: Encoder backend(s) to benchmark. Defaults to both; missing ones are skipped.")
+    parser.add_argument('--onnx-dir', type=str,
+                        help="Optional: Directory written by export-onnx-model.py (default: the encoder's default).")
+    parser.add_argument('--threads', type=int,
+                        help="Optional: Intra-op threads of the encoders (default: all available CPUs).")
+    parser.add_argument('--encode-texts', type=int, default=ENCODE_TEXTS,
+                        help=f"Texts encoded per encoder benchmark (default: {ENCODE_TEXTS}).")
+    parser.add_argument('--workdir', type=str,
+                        help="Optional: Directory for generated fixtures, kept afterwards (default: a temporary directory).")
+    parser.add_argument('-o', '--output', type=str,
+                        help="Optional: Results file (default: data/benchmarks/<timestamp>-<commit>.json).")
+    parser.add_argument('--compare', type=str,
+                        help="Optional: Earlier results file to compare against; exits with status 1 on a regression.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Slowdown of the median tolerated by --compare, as a fraction (default: 0.2).")
+    args = parser.parse_args()
+
+    try:
+        names = select_benchmarks(args.benchmarks)
+    except ValueError as e:
+        parser.error(str(e))
+    if any(scale < 1 for scale in args.scale):
+        parser.error("--scale factors must be at least 1.")
+    baseline = None
+    if args.compare:
+        try:
+            baseline = load_results(args.compare)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mitre-benchmarks-')
+    context = Context(workdir, args.stix_dir, args.batch_output, args.techniques, args.corpus,
+                      tuple(args.backend or ('torch', 'onnx')), args.onnx_dir, args.threads, args.encode_texts)
+    try:
+        document = run_suite(context, names, args.scale, args.repeats, args.warmup, print_result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    output = save_results(document, args.output)
+    print(f"\nResults written to {output}")
+
+    if baseline is not None:
+        rows = compare_results(baseline, document, args.tolerance)
+        print(f"\nCompared with {args.compare} (commit {(baseline.get('commit') or 'unknown')[:10]}):")
+        print(f"{'benchmark':<28} {'baseline s':>11} {'current s':>11} {'ratio':>7}")
+        for name, scale, old, new, ratio, regressed in rows:
+            print(f"{f'{name} x{scale}':<28} {old:>11.4f} {new:>11.4f} {ratio:>7.2f}{'  REGRESSION' if regressed else ''}")
+        if baseline.get('environment') != document['environment']:
+            print("Note: the baseline was recorded in a different environment; compare with care.")
+        if any(row[5] for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
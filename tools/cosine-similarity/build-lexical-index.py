@@ -0,0 +1,38 @@
+import argparse
+import os
+import time
+from lexical_index import B, DEFAULT_SOURCES, INDEX_DIR, K1, NAME_WEIGHT, SOURCES, LexicalIndex, iter_source_documents
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the BM25 index used by cosine-similarity.py --hybrid: one document per technique from "
+                    "its name, description and augmented texts."
+    )
+    parser.add_argument('--source', choices=list(SOURCES), action='append',
+                        help=f"Optional: Text source(s) to build from. Repeat to select several (default: {', '.join(DEFAULT_SOURCES)}).")
+    parser.add_argument('--index', type=str, default=INDEX_DIR,
+                        help=f"Index directory; an existing index is replaced (default: {INDEX_DIR}).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--k1', type=float, default=K1,
+                        help=f"BM25 term frequency saturation (default: {K1}).")
+    parser.add_argument('--b', type=float, default=B,
+                        help=f"BM25 document length normalization (default: {B}).")
+    parser.add_argument('--name-weight', type=int, default=NAME_WEIGHT,
+                        help=f"Times a technique's name is counted in its document (default: {NAME_WEIGHT}).")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"Database {args.db} not found")
+
+    sources = args.source or list(DEFAULT_SOURCES)
+    start = time.perf_counter()
+    index = LexicalIndex.build(iter_source_documents(args.db, sources), k1=args.k1, b=args.b, name_weight=args.name_weight)
+    index.meta['sources'] = sources
+    index.save(args.index)
+    print(f"{args.index}: {index.meta['documents']} technique documents, {index.meta['terms']} terms, "
+          f"{index.weights.nnz} weights in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
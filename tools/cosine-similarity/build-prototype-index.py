@@ -0,0 +1,87 @@
+import argparse
+import os
+import shutil
+import time
+from embedding_cache import EmbeddingCache, CACHE_FILE
+from encoder_backends import BACKENDS, MODEL_NAME, ONNX_MODEL_DIR, cache_model_name, load_encoder
+from prototype_index import (DEFAULT_SOURCES, INDEX_ROOT, MEDOIDS, META_FILE, MODES, SOURCES, PrototypeIndex,
+                             update_index)
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+
+class LazyEncoder:
+    """
+    Loads the encoder on the first encode call, so an update whose texts are all cached never loads the model.
+    """
+
+    def __init__(self, backend, threads, onnx_dir):
+        self.args = (backend, MODEL_NAME, onnx_dir, threads)
+        self.model = None
+
+    def encode(self, texts, **kwargs):
+        if self.model is None:
+            self.model = load_encoder(*self.args)
+        return self.model.encode(texts, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or update the prototype index: a few vectors per technique from its description and "
+                    "synthetic texts, scored by cosine-similarity.py --prototypes. Rerunning adds only new rows."
+    )
+    parser.add_argument('--mode', choices=MODES, default='centroid',
+                        help="Prototypes per technique: one centroid, one centroid per description/style variant, "
+                             "or k-medoids (default: centroid).")
+    parser.add_argument('--medoids', type=int, default=MEDOIDS,
+                        help=f"Medoids per technique in kmedoids mode (default: {MEDOIDS}).")
+    parser.add_argument('--source', choices=list(SOURCES), action='append',
+                        help=f"Optional: Text source(s) to build from. Repeat to select several (default: {', '.join(DEFAULT_SOURCES)}).")
+    parser.add_argument('--index', type=str,
+                        help=f"Index directory (default: {os.path.join(INDEX_ROOT, '<mode>')}).")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Discard an existing index and build it from scratch, e.g. after technique descriptions changed.")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--cache', type=str, default=CACHE_FILE,
+                        help=f"Embedding cache file; only texts not already cached are encoded (default: {CACHE_FILE}).")
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help="Texts per model.encode batch (default: 64).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend: PyTorch SentenceTransformer or the ONNX Runtime int8 export (default: torch).")
+    parser.add_argument('--threads', type=int,
+                        help="Optional: Intra-op threads used by the encoder (default: all available CPUs).")
+    parser.add_argument('--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory written by export-onnx-model.py, used by --backend onnx (default: {ONNX_MODEL_DIR}).")
+    args = parser.parse_args()
+
+    index_dir = args.index or os.path.join(INDEX_ROOT, args.mode)
+    sources = args.source or list(DEFAULT_SOURCES)
+    encoder_name = cache_model_name(args.backend, MODEL_NAME)
+    if args.rebuild and os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+
+    if os.path.exists(os.path.join(index_dir, META_FILE)):
+        try:
+            index = PrototypeIndex.load(index_dir)
+        except ValueError as e:
+            parser.error(f"{e} Use --rebuild.")
+        settings = (index.mode, index.medoids if index.mode == 'kmedoids' else None, index.encoder)
+        requested = (args.mode, args.medoids if args.mode == 'kmedoids' else None, encoder_name)
+        if settings != requested:
+            parser.error(f"{index_dir} holds a {settings} index, not {requested}; use --rebuild or another --index.")
+    else:
+        index = PrototypeIndex(args.mode, encoder_name, args.medoids)
+
+    model = LazyEncoder(args.backend, args.threads, args.onnx_dir)
+    start = time.perf_counter()
+    with EmbeddingCache(args.cache, model_name=encoder_name) as cache:
+        added = update_index(index, args.db, sources, lambda texts: cache.encode(model, texts, batch_size=args.batch_size)[0])
+        print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses")
+    index.save(index_dir)
+
+    print(", ".join(f"{count} new {source} row(s)" for source, count in added.items()) + f" in {time.perf_counter() - start:.2f}s")
+    techniques = len(index.technique_ids)
+    print(f"{index_dir}: {len(index)} {index.mode} prototypes for {techniques} techniques "
+          f"({len(index) / max(techniques, 1):.1f} per technique)")
+
+if __name__ == "__main__":
+    main()
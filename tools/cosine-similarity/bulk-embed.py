@@ -0,0 +1,64 @@
+import argparse
+import os
+from bulk_embed import SOURCES, STORE_ROOT, CHUNK_TEXTS, TASK_TEXTS, bulk_embed
+from embedding_store import LAYOUTS
+from encoder_backends import BACKENDS, MODEL_NAME, ONNX_MODEL_DIR
+from reduction import Reducer
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Embed a whole text source into an embedding store with a pool of encoder processes. "
+                    "Rerunning the same command resumes after the last stored row and picks up new rows."
+    )
+    parser.add_argument('source', choices=list(SOURCES),
+                        help="Texts to embed: techniques, synthetic (synthetic_texts_test), variants (synthetic_texts) or articles (cited_article_texts).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--store', type=str,
+                        help=f"Embedding store directory (default: {os.path.join(STORE_ROOT, '<source>')}).")
+    parser.add_argument('--layout', choices=LAYOUTS, default='float32',
+                        help="Storage layout of a new store (default: float32).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend: PyTorch SentenceTransformer or the ONNX Runtime int8 export (default: torch).")
+    parser.add_argument('--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory written by export-onnx-model.py, used by --backend onnx (default: {ONNX_MODEL_DIR}).")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="Encoder processes (default: CPUs divided by --threads-per-worker).")
+    parser.add_argument('--threads-per-worker', type=int, default=1,
+                        help="Intra-op threads of each worker's model (default: 1).")
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help="Texts per model.encode batch (default: 64).")
+    parser.add_argument('--chunk-texts', type=int, default=CHUNK_TEXTS,
+                        help=f"Texts bucketed and written to the store together (default: {CHUNK_TEXTS}).")
+    parser.add_argument('--task-texts', type=int, default=TASK_TEXTS,
+                        help=f"Texts of similar length sent to a worker at once (default: {TASK_TEXTS}).")
+    parser.add_argument('--skip-near-duplicates', action='store_true',
+                        help="Leave out rows flagged by find-near-duplicates.py; rows flagged after they were embedded stay in the store.")
+    parser.add_argument('--reducer', type=str,
+                        help="Optional: Reducer written by fit-reducer.py; a new store keeps it and stores the reduced vectors.")
+    args = parser.parse_args()
+
+    store_dir = args.store or os.path.join(STORE_ROOT, args.source)
+    try:
+        reducer = Reducer.load(args.reducer) if args.reducer else None
+        totals = bulk_embed(args.db, args.source, store_dir, args.backend, MODEL_NAME, args.onnx_dir,
+                            args.workers, args.threads_per_worker, args.batch_size, args.layout,
+                            args.chunk_texts, args.task_texts, skip_near_duplicates=args.skip_near_duplicates,
+                            reducer=reducer)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rate = totals['embedded'] / totals['seconds'] if totals['seconds'] > 0 else 0.0
+    print(f"Embedded {totals['embedded']} new text(s) ({totals['tokens']} tokens) in {totals['seconds']:.2f}s, "
+          f"{rate:.1f} texts/s; {totals['resumed']} were already stored, {totals['stored']} now in {store_dir}")
+    if totals['workers']:
+        print(f"{'worker':>8} {'texts':>8} {'tokens':>10} {'busy s':>8} {'texts/s':>9} {'tokens/s':>10}")
+        for pid, stats in sorted(totals['workers'].items()):
+            seconds = stats['seconds'] or float('inf')
+            print(f"{pid:>8} {stats['texts']:>8} {stats['tokens']:>10} {stats['seconds']:>8.2f} "
+                  f"{stats['texts'] / seconds:>9.1f} {stats['tokens'] / seconds:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from embedding_store import EmbeddingStore, META_FILE
+from encoder_backends import MODEL_NAME, ONNX_MODEL_DIR, cache_model_name, default_threads, load_encoder, load_tokenizer
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect, table_columns
+from mitre_tc.tracing import span
+
+STORE_ROOT = os.path.join('data', 'embedding-store')
+SOURCES = {
+    # name: (table, text column); rows are embedded in rowid order
+    'techniques': ('mitre_technique_descriptions', 'description'),
+    'synthetic': ('synthetic_texts_test', 'text'),
+    'variants': ('synthetic_texts', 'text'),
+    'articles': ('cited_article_texts', 'text'),
+}
+JOB_FILE = 'job.json'
+ROW_IDS_FILE = 'row_ids.bin'
+ROW_HASHES_FILE = 'row_hashes.bin' # 8-byte BLAKE2b hash of each stored row's text, to detect rows changed since they were embedded
+CHUNK_TEXTS = 8192 # Texts read, length-bucketed and written to the store together
+TASK_TEXTS = 512 # Texts of similar length sent to a worker per task
+MAX_CHUNKS_IN_FLIGHT = 2 # Chunks whose tasks are queued at once, so workers never wait on the writer
+
+_encoder = None
+
+def _init_worker(backend, model_name, onnx_dir, threads):
+    # Each worker process loads its own model once; threads is per worker, so workers x threads <= cores
+    global _encoder
+    _encoder = load_encoder(backend, model_name, onnx_dir, threads)
+
+def _encode_task(texts, batch_size):
+    start = time.perf_counter()
+    embeddings = _encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32), time.perf_counter() - start, os.getpid()
+
+def iter_source_chunks(db_file, source, after_rowid=0, chunk_texts=CHUNK_TEXTS, skip_near_duplicates=False):
+    """
+    Streams (rowids, texts) chunks of a source with rowid greater than after_rowid. With skip_near_duplicates,
+    rows flagged by find-near-duplicates.py are left out, so each duplicate cluster is embedded once.
+    """
+    table, column = SOURCES[source]
+    db = connect(db_file)
+    try:
+        where = "rowid > ?"
+        if table == 'mitre_technique_descriptions':
+            where += f" AND {active_techniques(db)}"
+        if skip_near_duplicates and table_columns(db, 'near_duplicates'):
+            where += (f" AND NOT EXISTS (SELECT 1 FROM near_duplicates d "
+                      f"WHERE d.source_table = '{table}' AND d.row_id = {table}.rowid)")
+        cursor = db.execute(f"SELECT rowid, {column} FROM {table} WHERE {where} ORDER BY rowid", (after_rowid,))
+        while True:
+            rows = cursor.fetchmany(chunk_texts)
+            if not rows:
+                return
+            yield np.array([rowid for rowid, _ in rows], dtype=np.int64), [text or '' for _, text in rows]
+    finally:
+        db.close()
+
+def text_hashes(texts):
+    """
+    Returns an int64 array of 8-byte BLAKE2b hashes of texts, recorded per stored row so that a resumed run
+    can tell whether the rows it already embedded still hold the same text.
+    """
+    digests = b''.join(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest() for text in texts)
+    return np.frombuffer(digests, dtype=np.int64)
+
+def bucket_tasks(token_counts, task_texts=TASK_TEXTS):
+    """
+    Sorts a chunk by token count and cuts it into tasks of task_texts neighbouring lengths, so every batch a
+    worker encodes is padded to about the length of its members rather than to the longest text of the chunk.
+    Returns a list of position arrays into the chunk, longest texts first.
+    """
+    order = np.argsort(-np.asarray(token_counts), kind='stable')
+    return [order[start:start + task_texts] for start in range(0, len(order), task_texts)]
+
+class StoreWriter:
+    """
+    Appends embeddings with their source rowids and text hashes to an EmbeddingStore directory.
+    The store's own count is the checkpoint: rowids and hashes are written before the vectors, so after a
+    crash those files may run ahead of the store but never behind it, and resuming continues after the rowid
+    of the last stored vector.
+    """
+
+    def __init__(self, path, job, layout='float32', reducer=None):
+        self.path = path
+        self.job = job
+        self.layout = layout
+        self.reducer = reducer
+        self.store = None
+        job_file = os.path.join(path, JOB_FILE)
+        if os.path.exists(job_file):
+            with open(job_file, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            if existing != job:
+                raise ValueError(f"{path} was written by a different job ({existing}); use another --store or remove it.")
+            if os.path.exists(os.path.join(path, META_FILE)):
+                self.store = EmbeddingStore(path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(job_file, 'w', encoding='utf-8') as f:
+                json.dump(job, f, indent=2)
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else 0
+
+    def last_rowid(self):
+        """
+        Returns the source rowid of the last stored vector, or 0 for an empty store.
+        """
+        count = len(self)
+        if not count:
+            return 0
+        row_ids = np.memmap(os.path.join(self.path, ROW_IDS_FILE), dtype=np.int64, mode='r', shape=(count,))
+        return int(row_ids[-1])
+
+    def stale_rows(self, db_file, source, skip_near_duplicates=False):
+        """
+        Compares the stored rows with the source up to the last stored rowid and returns how many no longer
+        match: rows whose text changed (e.g. a technique description upserted in place), rows that left the
+        source and rows that entered it below the checkpoint. Resuming would keep or skip all of them.
+        """
+        count = len(self)
+        if not count:
+            return 0
+        hashes_file = os.path.join(self.path, ROW_HASHES_FILE)
+        if not os.path.exists(hashes_file):
+            raise ValueError(f"{self.path} records no text hashes, so its rows cannot be checked against the source; "
+                             f"remove it to embed {source} again.")
+        row_ids = np.memmap(os.path.join(self.path, ROW_IDS_FILE), dtype=np.int64, mode='r', shape=(count,))
+        hashes = np.memmap(hashes_file, dtype=np.int64, mode='r', shape=(count,))
+        last_rowid = int(row_ids[-1])
+        stale = seen = 0
+        for rowids, texts in iter_source_chunks(db_file, source, skip_near_duplicates=skip_near_duplicates):
+            keep = rowids <= last_rowid
+            rowids, chunk_hashes = rowids[keep], text_hashes([text for text, kept in zip(texts, keep) if kept])
+            # Stored rowids are ascending, so each source row finds its stored position by binary search
+            positions = np.minimum(np.searchsorted(row_ids, rowids), count - 1)
+            present = row_ids[positions] == rowids
+            stale += int((~present).sum() + (hashes[positions[present]] != chunk_hashes[present]).sum())
+            seen += int(present.sum())
+            if not keep.all():
+                break
+        return stale + count - seen
+
+    def append(self, rowids, embeddings, hashes):
+        if self.store is None:
+            self.store = EmbeddingStore.create(self.path, embeddings.shape[1], self.layout, self.reducer)
+        for file_name, values in ((ROW_IDS_FILE, rowids), (ROW_HASHES_FILE, hashes)):
+            mode = 'r+b' if os.path.exists(os.path.join(self.path, file_name)) else 'wb'
+            with open(os.path.join(self.path, file_name), mode) as f:
+                f.seek(len(self.store) * 8)
+                f.write(values.astype(np.int64).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        self.store.append(embeddings)
+
+def bulk_embed(db_file, source, store_dir, backend='torch', model_name=MODEL_NAME, onnx_dir=ONNX_MODEL_DIR,
+               workers=None, threads_per_worker=1, batch_size=64, layout='float32', chunk_texts=CHUNK_TEXTS,
+               task_texts=TASK_TEXTS, progress_every=10.0, skip_near_duplicates=False, reducer=None):
+    """
+    Embeds every row of a source not yet in the store at store_dir.
+    Texts are read in chunks and bucketed by token count; the buckets of up to MAX_CHUNKS_IN_FLIGHT chunks are
+    spread over a process pool with one model per worker, and each chunk is appended to the store in rowid
+    order as soon as all its buckets are back. An interrupted run resumes after the last stored row, and
+    refuses to when stored rows no longer match the source, since they would never be embedded again.
+    With skip_near_duplicates, rows flagged as near-duplicates of an earlier row are not embedded. With a
+    reduction.Reducer, a new store keeps it and holds the reduced vectors.
+    Returns a dict with totals and per-worker {texts, tokens, seconds}.
+    """
+    job = {'source': source, 'model': cache_model_name(backend, model_name), 'layout': layout}
+    if skip_near_duplicates:
+        job['skip_near_duplicates'] = True
+    if reducer is not None:
+        job['reducer'] = reducer.fingerprint()
+    writer = StoreWriter(store_dir, job, layout, reducer)
+    resumed = len(writer)
+    stale = writer.stale_rows(db_file, source, skip_near_duplicates)
+    if stale:
+        raise ValueError(f"{stale} of the {resumed} rows in {store_dir} changed in {source} since they were "
+                         f"embedded; remove the store or use another --store to embed {source} again.")
+    tokenizer, max_seq_length = load_tokenizer(backend, model_name, onnx_dir)
+    workers = workers or max(1, default_threads() // threads_per_worker)
+    per_worker = collections.defaultdict(lambda: {'texts': 0, 'tokens': 0, 'seconds': 0.0})
+    totals = {'resumed': resumed, 'embedded': 0, 'tokens': 0}
+    chunks = iter_source_chunks(db_file, source, writer.last_rowid(), chunk_texts, skip_near_duplicates)
+    pending = collections.deque() # [rowids, output array, outstanding task count, text hashes] per chunk, in rowid order
+    futures = {}
+    start = last_report = time.perf_counter()
+
+    # Workers are spawned rather than forked: the parent has already run the (multi-threaded) tokenizer, and
+    # forking a process with live thread pools can deadlock the child's tokenizer or PyTorch
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(backend, model_name, onnx_dir, threads_per_worker)) as executor:
+        def submit_next_chunk():
+            for rowids, texts in chunks:
+                with span('encode.tokenize') as current:
+                    encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_seq_length)
+                    token_counts = np.fromiter((len(ids) for ids in encoded['input_ids']), dtype=np.int64, count=len(texts))
+                    current.add(items=len(texts), tokens=int(token_counts.sum()))
+                entry = [rowids, None, 0, text_hashes(texts)]
+                pending.append(entry)
+                for positions in bucket_tasks(token_counts, task_texts):
+                    future = executor.submit(_encode_task, [texts[i] for i in positions], batch_size)
+                    futures[future] = (entry, positions, int(token_counts[positions].sum()))
+                    entry[2] += 1
+                return True
+            return False
+
+        while len(pending) < MAX_CHUNKS_IN_FLIGHT and submit_next_chunk():
+            pass
+
+        while futures:
+            with span('encode.wait_workers'):
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry, positions, tokens = futures.pop(future)
+                embeddings, seconds, pid = future.result()
+                if entry[1] is None:
+                    entry[1] = np.empty((len(entry[0]), embeddings.shape[1]), dtype=np.float32)
+                entry[1][positions] = embeddings
+                entry[2] -= 1
+                stats = per_worker[pid]
+                stats['texts'] += len(positions)
+                stats['tokens'] += tokens
+                stats['seconds'] += seconds
+                totals['tokens'] += tokens
+
+            # Write finished chunks in order, then keep the pool fed
+            while pending and pending[0][2] == 0:
+                rowids, embeddings, _, hashes = pending.popleft()
+                with span('store.append') as current:
+                    writer.append(rowids, embeddings, hashes)
+                    current.add(items=len(rowids), bytes=embeddings.nbytes)
+                totals['embedded'] += len(rowids)
+            while len(pending) < MAX_CHUNKS_IN_FLIGHT and submit_next_chunk():
+                pass
+
+            now = time.perf_counter()
+            if progress_every and now - last_report >= progress_every:
+                last_report = now
+                print(f"{totals['embedded']} texts stored ({totals['embedded'] / (now - start):.1f} texts/s)")
+
+    totals['seconds'] = time.perf_counter() - start
+    totals['stored'] = len(writer)
+    totals['workers'] = dict(per_worker)
+    return totals
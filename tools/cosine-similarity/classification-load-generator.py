@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import random
+import time
+import numpy as np
+import aiohttp
+
+SYNTHETIC_DATA_FILE = 'synthetic_data.txt'
+
+def load_sample_texts(file_path, limit=None):
+    """
+    Reads the synthetic texts out of synthetic_data.txt, one per '--- MITRE Technique' block.
+    """
+    texts = []
+    current = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('--- MITRE Technique:'):
+                if current:
+                    texts.append(' '.join(current).strip())
+                current = []
+            elif line.strip():
+                current.append(line.strip())
+    if current:
+        texts.append(' '.join(current).strip())
+    return texts[:limit] if limit else texts
+
+async def run_load(url, texts, concurrency, requests, texts_per_request, unix_socket=None):
+    """
+    Sends requests classify calls from concurrency parallel clients.
+    Returns the list of request latencies in seconds, the elapsed wall time and the error count.
+    """
+    connector = aiohttp.UnixConnector(path=unix_socket) if unix_socket else aiohttp.TCPConnector(limit=concurrency)
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def client():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                payload = {'texts': random.sample(texts, texts_per_request)}
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, json=payload) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        async with session.get(url.rsplit('/', 1)[0] + '/stats') as response:
+            server_stats = await response.json()
+    return latencies, elapsed, errors, server_stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the classification server with concurrent clients.")
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8080/classify')
+    parser.add_argument('--unix-socket', type=str, help="Optional: Connect through this Unix socket.")
+    parser.add_argument('-c', '--concurrency', type=int, default=32, help="Parallel clients (default: 32).")
+    parser.add_argument('-n', '--requests', type=int, default=2000, help="Total requests (default: 2000).")
+    parser.add_argument('--texts-per-request', type=int, default=1, help="Texts sent in each request (default: 1).")
+    parser.add_argument('--texts', type=str, default=SYNTHETIC_DATA_FILE,
+                        help=f"File providing sample texts (default: {SYNTHETIC_DATA_FILE}).")
+    args = parser.parse_args()
+
+    texts = load_sample_texts(args.texts)
+    url = 'http://localhost/classify' if args.unix_socket else args.url
+    latencies, elapsed, errors, server_stats = asyncio.run(
+        run_load(url, texts, args.concurrency, args.requests, args.texts_per_request, args.unix_socket)
+    )
+
+    latencies_ms = np.array(latencies) * 1000.0
+    print(f"{len(latencies)} requests ok, {errors} errors in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} req/s, {len(latencies) * args.texts_per_request / elapsed:.1f} texts/s)")
+    if latencies_ms.size:
+        print("client latency ms: " + ', '.join(
+            f"p{p}={np.percentile(latencies_ms, p):.1f}" for p in (50, 90, 95, 99)) + f", max={latencies_ms.max():.1f}")
+    print(f"server stats: {server_stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import time
+import numpy as np
+from embedding_cache import EmbeddingCache, CACHE_FILE
+from encoder_backends import BACKENDS, ONNX_MODEL_DIR, cache_model_name, load_encoder
+from scoring import TOP_K, normalize_embeddings, top_k_rows
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, iter_techniques
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+THRESHOLD = 0.7
+MAX_BATCH = 64 # Texts encoded together at most
+MAX_WAIT_MS = 5.0 # Longest a request waits for others to join its batch
+LATENCY_WINDOW = 10000 # Most recent requests kept for the percentile report
+
+def load_technique_matrix(db_file, model, cache_file=CACHE_FILE, cache_model=MODEL_NAME):
+    """
+    Loads technique IDs and names and builds the normalized technique matrix, reusing cached embeddings.
+    """
+    db = connect(db_file)
+    try:
+        rows = list(iter_techniques(db))
+    finally:
+        db.close()
+    with EmbeddingCache(cache_file, model_name=cache_model) as cache:
+        embeddings, stats = cache.encode(model, [description or '' for _, _, description in rows])
+    print(f"Technique embeddings: {stats['hits']} cached, {stats['misses']} encoded")
+    return [row[0] for row in rows], [row[1] for row in rows], normalize_embeddings(embeddings)
+
+class Metrics:
+    """
+    Rolling latency and throughput statistics for the /stats endpoint.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.completions = collections.deque(maxlen=LATENCY_WINDOW) # (finish time, texts)
+        self.batch_sizes = collections.deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.texts = 0
+
+    def record_request(self, latency, texts):
+        self.requests += 1
+        self.texts += texts
+        self.latencies.append(latency)
+        self.completions.append((time.monotonic(), texts))
+
+    def report(self):
+        latencies_ms = np.array(self.latencies) * 1000.0
+        now = time.monotonic()
+        recent = [texts for finished, texts in self.completions if now - finished <= 10.0]
+        report = {
+            'uptime_s': round(now - self.started, 1),
+            'requests': self.requests,
+            'texts': self.texts,
+            'texts_per_s_last_10s': round(sum(recent) / min(10.0, max(now - self.started, 1e-3)), 1),
+            'mean_batch_size': round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0.0,
+        }
+        if latencies_ms.size:
+            for percentile in (50, 90, 95, 99):
+                report[f'latency_p{percentile}_ms'] = round(float(np.percentile(latencies_ms, percentile)), 2)
+        return report
+
+class MicroBatcher:
+    """
+    Gathers texts from concurrent requests into one encode call.
+    A batch is closed when it reaches max_batch texts or when max_wait_ms has passed since its first
+    request arrived; encoding runs in a worker thread so the event loop keeps accepting requests.
+    """
+
+    def __init__(self, model, technique_matrix, metrics, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.technique_matrix = technique_matrix
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def classify(self, texts, k):
+        """
+        Queues texts and waits for their (top_indices, top_scores).
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, k, future))
+        return await future
+
+    def _score(self, texts):
+        embeddings = self.model.encode(texts, batch_size=self.max_batch, convert_to_numpy=True)
+        return normalize_embeddings(embeddings) @ self.technique_matrix.T
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item in batch for text in item[0]]
+            self.metrics.batch_sizes.append(len(texts))
+            try:
+                scores = await loop.run_in_executor(None, self._score, texts)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for item_texts, k, future in batch:
+                block = scores[start:start + len(item_texts)]
+                start += len(item_texts)
+                if future.done():
+                    continue
+                # An error here fails only this request; the loop must keep serving the others
+                try:
+                    future.set_result(top_k_rows(block, k))
+                except Exception as e:
+                    future.set_exception(e)
+
+def make_app(batcher, metrics, technique_ids, technique_names, threshold=THRESHOLD):
+    """
+    Builds the aiohttp application exposing /classify, /stats and /health.
+    """
+    from aiohttp import web
+    routes = web.RouteTableDef()
+
+    @routes.post('/classify')
+    async def classify(request):
+        started = time.monotonic()
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'Request body must be JSON.'}, status=400)
+        if not isinstance(payload, dict):
+            return web.json_response({'error': 'Request body must be a JSON object.'}, status=400)
+        texts = payload.get('texts')
+        if isinstance(payload.get('text'), str):
+            texts = [payload['text']]
+        if not texts or not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return web.json_response({'error': "Provide 'text' or a non-empty list of strings in 'texts'."}, status=400)
+        k = payload.get('k', TOP_K)
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            return web.json_response({'error': "'k' must be an integer of at least 1."}, status=400)
+
+        top_indices, top_scores = await batcher.classify(texts, k)
+        results = []
+        for indices, scores in zip(top_indices, top_scores):
+            results.append({
+                'passed': bool(scores[0] >= threshold),
+                'techniques': [
+                    {'technique_id': technique_ids[i], 'name': technique_names[i], 'score': round(float(score), 6)}
+                    for i, score in zip(indices, scores)
+                ],
+            })
+        metrics.record_request(time.monotonic() - started, len(texts))
+        return web.json_response({'results': results})
+
+    @routes.get('/stats')
+    async def stats(request):
+        return web.json_response(metrics.report())
+
+    @routes.get('/health')
+    async def health(request):
+        return web.json_response({'status': 'ok', 'techniques': len(technique_ids)})
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.add_routes(routes)
+
+    async def on_startup(app):
+        batcher.start()
+
+    async def on_cleanup(app):
+        await batcher.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve MITRE technique classification over HTTP with the model and technique matrix kept in memory."
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', type=str,
+                        help="Optional: Listen on this Unix socket instead of TCP.")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--cache', type=str, default=CACHE_FILE,
+                        help=f"Embedding cache used for the technique matrix (default: {CACHE_FILE}).")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH,
+                        help=f"Maximum texts per encode call (default: {MAX_BATCH}).")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help=f"Maximum time a request waits for its batch to fill (default: {MAX_WAIT_MS}).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend: PyTorch SentenceTransformer or the ONNX Runtime int8 export (default: torch).")
+    parser.add_argument('--threads', type=int,
+                        help="Optional: Intra-op threads used by the encoder (default: all available CPUs).")
+    parser.add_argument('--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory written by export-onnx-model.py, used by --backend onnx (default: {ONNX_MODEL_DIR}).")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"Minimum top-1 score for a text to pass (default: {THRESHOLD}).")
+    args = parser.parse_args()
+
+    from aiohttp import web
+    model = load_encoder(args.backend, MODEL_NAME, args.onnx_dir, args.threads)
+    technique_ids, technique_names, technique_matrix = load_technique_matrix(
+        args.db, model, args.cache, cache_model_name(args.backend, MODEL_NAME))
+    # Warm up so the first request does not pay for lazy initialisation
+    model.encode(['warm up'], convert_to_numpy=True)
+
+    metrics = Metrics()
+    batcher = MicroBatcher(model, technique_matrix, metrics, args.max_batch, args.max_wait_ms)
+    app = make_app(batcher, metrics, technique_ids, technique_names, args.threshold)
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        web.run_app(app, path=args.unix_socket)
+    else:
+        web.run_app(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,38 @@
-import sqlite3
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import sys
+import argparse
+import os
 import numpy as np
-import pandas as pd
+from embedding_cache import EmbeddingCache, CACHE_FILE
+from encoder_backends import BACKENDS, ONNX_MODEL_DIR, cache_model_name, load_encoder
+from scoring import TOP_K, CHUNK_SIZE, normalize_embeddings, iter_top_k, write_top_k
+from document_encoder import POOLING_STRATEGIES, encode_documents, iter_document_top_k
+from prototype_index import PrototypeIndex
+from lexical_index import ALPHA, SHORTLIST, LexicalIndex, iter_hybrid_top_k
+from evaluation import Evaluation, print_report
+from reduction import Reducer
 
-DB_FILE = 'data\\sqlite3\\mitre_data.db'
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect
+from mitre_tc.tracing import span
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+THRESHOLD = 0.7 # Minimum top-1 score for a text to count as classified
+
+# pandas, scikit-learn and sentence-transformers are imported inside the functions that use them,
+# so argument parsing and --help do not pay several seconds of import time.
 
 def load_mitre_techniques(db_file):
     """
-    Connects to the SQLite database and retrieves MITRE techniques.
+    Connects to the SQLite database and retrieves the active MITRE techniques (not revoked or deprecated).
     Returns a DataFrame with technique_id, name, and description.
     """
-    db = sqlite3.connect(db_file)
+    import pandas as pd
+    db = connect(db_file)
     cursor = db.cursor()
-    cursor.execute('SELECT technique_id, name, description FROM mitre_technique_descriptions')
+    cursor.execute(f'SELECT technique_id, name, description FROM mitre_technique_descriptions WHERE {active_techniques(db)}')
     data = cursor.fetchall()
     db.close()
     return pd.DataFrame(data, columns=['technique_id', 'name', 'description'])
@@ -23,31 +42,40 @@ def load_synthetic_texts(db_file):
     Connects to the SQLite database and retrieves synthetic texts.
     Returns a DataFrame with technique_id, name, and text.
     """
-    db = sqlite3.connect(db_file)
+    import pandas as pd
+    db = connect(db_file)
     cursor = db.cursor()
     cursor.execute('SELECT technique_id, name, text FROM synthetic_texts_test')
     data = cursor.fetchall()
     db.close()
     return pd.DataFrame(data, columns=['technique_id', 'name', 'text'])
 
-def load_model():
+def load_model(backend='torch', threads=None, onnx_dir=ONNX_MODEL_DIR):
     """
-    Loads the SentenceTransformer model for embedding generation.
+    Loads the encoder for embedding generation: the PyTorch SentenceTransformer model or its ONNX Runtime int8 export.
     """
-    return SentenceTransformer('all-MiniLM-L6-v2')
+    return load_encoder(backend, MODEL_NAME, onnx_dir, threads)
 
-def encode_texts(model, texts, save_to_file=None, load_from_file=None):
+def encode_texts(model, texts, save_to_file=None, load_from_file=None, cache=None):
     """
     Encodes a list of texts into embeddings using the provided model.
+    If an EmbeddingCache is given, only texts missing from the cache are encoded and the
+    embeddings are returned in the order of texts.
     Returns a NumPy array of embeddings.
     """
+    if cache is not None:
+        embeddings, stats = cache.encode(model, texts)
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
+        return embeddings
     if load_from_file:
         try:
             return np.load(load_from_file)
         except Exception as e:
             print(f"Error loading embeddings from file: {e}")
     else:
-        embeddings = model.encode(texts, convert_to_tensor=True)
+        with span('encode.model') as current:
+            embeddings = model.encode(texts, convert_to_tensor=True)
+            current.add(items=len(texts))
         if save_to_file:
             try:
                 np.save(save_to_file, embeddings.cpu().numpy())
@@ -60,24 +88,265 @@ def calculate_cosine_similarity(embeddings1, embeddings2):
     Calculates cosine similarity between two sets of embeddings.
     Returns a DataFrame with cosine similarity scores.
     """
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
     if embeddings1.shape[0] == 0 or embeddings2.shape[0] == 0:
         return pd.DataFrame(columns=['technique_id', 'name', 'similarity'])
     
     similarities = cosine_similarity(embeddings1, embeddings2)
     return pd.DataFrame(similarities)
 
+def classify_top_k(technique_ids, technique_embeddings, query_embeddings, output_file,
+                   k=TOP_K, chunk_size=CHUNK_SIZE, threshold=THRESHOLD, evaluation=None, reducer=None):
+    """
+    Classifies each query embedding against the techniques and streams the top-k results to a CSV file.
+    Each row holds the query index, whether the best score passes the threshold,
+    and the k best technique IDs with their scores. If an Evaluation is given, every chunk is also scored
+    against the gold technique IDs as it is written. With a Reducer, scores are computed in its reduced space.
+    Returns the number of classified texts.
+    """
+    technique_matrix = normalize_embeddings(technique_embeddings)
+    chunks = iter_top_k(technique_matrix, query_embeddings, k, chunk_size, reducer)
+    if evaluation is not None:
+        chunks = evaluation.observe(chunks, technique_ids, threshold)
+    return write_top_k(technique_ids, chunks, output_file, min(k, technique_matrix.shape[0]), threshold)
+
+def classify_documents(technique_ids, technique_matrix, model, documents, output_file, k=TOP_K,
+                       chunk_size=CHUNK_SIZE, threshold=THRESHOLD, cache=None, strategy='max', top_n=3, evaluation=None):
+    """
+    Classifies documents of any length by splitting them into overlapping token windows and pooling
+    the window scores per document, then streams the top-k results to a CSV file like classify_top_k.
+    Returns the number of classified documents.
+    """
+    chunks = iter_document_top_k(model, documents, technique_matrix, k, chunk_size,
+                                 strategy=strategy, top_n=top_n, cache=cache)
+    if evaluation is not None:
+        chunks = evaluation.observe(chunks, technique_ids, threshold)
+    return write_top_k(technique_ids, chunks, output_file, min(k, technique_matrix.shape[0]), threshold)
+
+def classify_prototypes(index, query_embeddings, output_file, k=TOP_K, chunk_size=CHUNK_SIZE, threshold=THRESHOLD,
+                        evaluation=None):
+    """
+    Classifies each query embedding against the prototypes of a PrototypeIndex, scoring a technique by its
+    best prototype, and streams the top-k results to a CSV file like classify_top_k.
+    Returns the number of classified texts.
+    """
+    chunks = index.iter_top_k(query_embeddings, k, chunk_size)
+    if evaluation is not None:
+        chunks = evaluation.observe(chunks, index.technique_ids, threshold)
+    return write_top_k(index.technique_ids, chunks, output_file, min(k, len(index.technique_ids)), threshold)
+
+def classify_hybrid(index, technique_ids, technique_embeddings, texts, query_embeddings, output_file, k=TOP_K,
+                    chunk_size=CHUNK_SIZE, threshold=THRESHOLD, shortlist=SHORTLIST, alpha=ALPHA, evaluation=None,
+                    reducer=None):
+    """
+    Classifies each text by scoring only the techniques its BM25 shortlist from a LexicalIndex names, fusing
+    the cosine and BM25 scores, and streams the top-k results to a CSV file like classify_top_k.
+    Returns the number of classified texts and the share of (text, technique) pairs scored densely.
+    """
+    technique_matrix = normalize_embeddings(technique_embeddings)
+    stats = {}
+    chunks = iter_hybrid_top_k(index, technique_ids, technique_matrix, texts, query_embeddings, k, chunk_size,
+                               shortlist=shortlist, alpha=alpha, stats=stats, reducer=reducer)
+    if evaluation is not None:
+        chunks = evaluation.observe(chunks, technique_ids, threshold)
+    count = write_top_k(technique_ids, chunks, output_file, min(k, shortlist, len(technique_ids)), threshold)
+    return count, stats.get('dense_scores', 0) / max(count * len(technique_ids), 1)
+
 def main():
+    parser = argparse.ArgumentParser(
+        description="Compare MITRE technique descriptions against synthetic texts using cosine similarity."
+    )
+    parser.add_argument(
+        '--db', type=str, default=DB_FILE,
+        help=f"SQLite database file (default: {DB_FILE})."
+    )
+    parser.add_argument(
+        '-o', '--output', type=str,
+        help="Optional: Stream top-k classifications to this CSV file instead of printing the full similarity matrix."
+    )
+    parser.add_argument(
+        '-k', '--top-k', type=int, default=TOP_K,
+        help=f"Number of techniques to keep per text in top-k mode (default: {TOP_K})."
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=CHUNK_SIZE,
+        help=f"Number of texts scored per matrix product in top-k mode (default: {CHUNK_SIZE})."
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=THRESHOLD,
+        help=f"Minimum top-1 score for a text to pass in top-k mode (default: {THRESHOLD}). With --hybrid it applies "
+             "to the fused score, alpha * cosine + (1 - alpha) * normalized BM25, where the best BM25 match of a "
+             "text counts 1; texts sharing no term with any technique keep their plain cosine score."
+    )
+    parser.add_argument(
+        '--cache', type=str, default=CACHE_FILE,
+        help=f"Embedding cache file; only texts not already cached are encoded (default: {CACHE_FILE})."
+    )
+    parser.add_argument(
+        '--backend', choices=BACKENDS, default='torch',
+        help="Encoder backend: PyTorch SentenceTransformer or the ONNX Runtime int8 export (default: torch)."
+    )
+    parser.add_argument(
+        '--threads', type=int,
+        help="Optional: Intra-op threads used by the encoder (default: all available CPUs)."
+    )
+    parser.add_argument(
+        '--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+        help=f"Directory written by export-onnx-model.py, used by --backend onnx (default: {ONNX_MODEL_DIR})."
+    )
+    parser.add_argument(
+        '--from-npy', action='store_true',
+        help="Load the fixed technique_embeddings.npy/synthetic_embeddings.npy files instead of using the cache."
+    )
+    parser.add_argument(
+        '--long-documents', action='store_true',
+        help="Split texts into overlapping token windows instead of truncating them, and pool the window scores (top-k mode only)."
+    )
+    parser.add_argument(
+        '--pooling', choices=POOLING_STRATEGIES, default='max',
+        help="How window scores are combined per document with --long-documents (default: max)."
+    )
+    parser.add_argument(
+        '--top-n', type=int, default=3,
+        help="Number of best windows averaged by --pooling topn (default: 3)."
+    )
+    parser.add_argument(
+        '--prototypes', type=str,
+        help="Optional: Score against a prototype index built by build-prototype-index.py instead of the technique descriptions (top-k mode only)."
+    )
+    parser.add_argument(
+        '--hybrid', type=str,
+        help="Optional: Shortlist techniques per text with a BM25 index built by build-lexical-index.py, score only the shortlist densely and rank by the fused score (top-k mode only)."
+    )
+    parser.add_argument(
+        '--shortlist', type=int, default=SHORTLIST,
+        help=f"Techniques per text shortlisted by BM25 with --hybrid (default: {SHORTLIST})."
+    )
+    parser.add_argument(
+        '--alpha', type=float, default=ALPHA,
+        help=f"Weight of the cosine score in the fused --hybrid score; the rest goes to the normalized BM25 score (default: {ALPHA})."
+    )
+    parser.add_argument(
+        '--reducer', type=str,
+        help="Optional: Score in the reduced space of a reducer written by fit-reducer.py, or of the embedding store directory holding one (top-k and --hybrid modes only)."
+    )
+    parser.add_argument(
+        '--evaluate', action='store_true',
+        help="Score the top-k results against the texts' technique IDs and print accuracy and precision/recall/coverage per threshold (top-k mode only)."
+    )
+
+    args = parser.parse_args()
+    if args.prototypes and not args.output:
+        parser.error("--prototypes requires --output")
+    if args.evaluate and not args.output:
+        parser.error("--evaluate requires --output")
+    if args.prototypes and args.long_documents:
+        parser.error("--prototypes cannot be combined with --long-documents")
+    if args.hybrid and not args.output:
+        parser.error("--hybrid requires --output")
+    if args.hybrid and (args.prototypes or args.long_documents):
+        parser.error("--hybrid cannot be combined with --prototypes or --long-documents")
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.top_n < 1:
+        parser.error("--top-n must be at least 1")
+    if args.shortlist < 1 or not 0 <= args.alpha <= 1:
+        parser.error("--shortlist must be positive and --alpha between 0 and 1")
+    if args.reducer and not args.output:
+        parser.error("--reducer requires --output")
+    if args.reducer and (args.prototypes or args.long_documents):
+        parser.error("--reducer cannot be combined with --prototypes or --long-documents")
+
+    reducer = None
+    if args.reducer:
+        try:
+            reducer = Reducer.load(args.reducer)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    lexical_index = None
+    if args.hybrid:
+        try:
+            lexical_index = LexicalIndex.load(args.hybrid)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    if args.prototypes:
+        try:
+            index = PrototypeIndex.load(args.prototypes)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if index.encoder != cache_model_name(args.backend, MODEL_NAME):
+            parser.error(f"{args.prototypes} was built from {index.encoder} vectors, not {cache_model_name(args.backend, MODEL_NAME)}.")
+        model = load_model(args.backend, args.threads, args.onnx_dir)
+        synthetic_texts_df = load_synthetic_texts(args.db)
+        evaluation = Evaluation(synthetic_texts_df['technique_id'].tolist()) if args.evaluate else None
+        with EmbeddingCache(args.cache, model_name=index.encoder) as cache:
+            synthetic_embeddings = encode_texts(model, synthetic_texts_df['text'].tolist(), cache=cache)
+        count = classify_prototypes(index, synthetic_embeddings, args.output, k=args.top_k,
+                                    chunk_size=args.chunk_size, threshold=args.threshold, evaluation=evaluation)
+        print(f"Classified {count} texts against {len(index)} {index.mode} prototypes. "
+              f"Top-{args.top_k} results saved to {args.output}")
+        if evaluation is not None:
+            print_report(evaluation)
+        return
+
     # Load data
-    techniques_df = load_mitre_techniques(DB_FILE)
-    synthetic_texts_df = load_synthetic_texts(DB_FILE)
+    techniques_df = load_mitre_techniques(args.db)
+    synthetic_texts_df = load_synthetic_texts(args.db)
+    evaluation = Evaluation(synthetic_texts_df['technique_id'].tolist()) if args.evaluate else None
 
     # Load model
-    model = load_model()
+    model = load_model(args.backend, args.threads, args.onnx_dir)
+
+    if args.long_documents:
+        if not args.output:
+            parser.error("--long-documents requires --output")
+        with EmbeddingCache(args.cache, model_name=cache_model_name(args.backend, MODEL_NAME)) as cache:
+            technique_matrix = encode_documents(model, techniques_df['description'].tolist(), cache=cache)
+            count = classify_documents(techniques_df['technique_id'].tolist(), technique_matrix, model,
+                                       synthetic_texts_df['text'].tolist(), args.output, k=args.top_k,
+                                       chunk_size=args.chunk_size, threshold=args.threshold, cache=cache,
+                                       strategy=args.pooling, top_n=args.top_n, evaluation=evaluation)
+        print(f"Classified {count} documents with {args.pooling} pooling. Top-{args.top_k} results saved to {args.output}")
+        if evaluation is not None:
+            print_report(evaluation)
+        return
 
     # Encode techniques and synthetic texts
-    # Remove save_to_file parameter and replace with load_from_file if you've already saved embeddings
-    technique_embeddings = encode_texts(model, techniques_df['description'].tolist(), load_from_file='technique_embeddings.npy')
-    synthetic_embeddings = encode_texts(model, synthetic_texts_df['text'].tolist(), load_from_file='synthetic_embeddings.npy')
+    if args.from_npy:
+        technique_embeddings = encode_texts(model, techniques_df['description'].tolist(), load_from_file='technique_embeddings.npy')
+        synthetic_embeddings = encode_texts(model, synthetic_texts_df['text'].tolist(), load_from_file='synthetic_embeddings.npy')
+    else:
+        with EmbeddingCache(args.cache, model_name=cache_model_name(args.backend, MODEL_NAME)) as cache:
+            technique_embeddings = encode_texts(model, techniques_df['description'].tolist(), cache=cache)
+            synthetic_embeddings = encode_texts(model, synthetic_texts_df['text'].tolist(), cache=cache)
+
+    if lexical_index is not None:
+        count, dense_share = classify_hybrid(lexical_index, techniques_df['technique_id'].tolist(), technique_embeddings,
+                                             synthetic_texts_df['text'].tolist(), synthetic_embeddings, args.output,
+                                             k=args.top_k, chunk_size=args.chunk_size, threshold=args.threshold,
+                                             shortlist=args.shortlist, alpha=args.alpha, evaluation=evaluation,
+                                             reducer=reducer)
+        print(f"Classified {count} texts, scoring {dense_share:.1%} of text/technique pairs densely. "
+              f"Top-{args.top_k} results saved to {args.output}")
+        if evaluation is not None:
+            print_report(evaluation)
+        return
+
+    if args.output:
+        # Score synthetic texts against techniques chunk by chunk, keeping only the top-k per text
+        count = classify_top_k(techniques_df['technique_id'].tolist(), technique_embeddings, synthetic_embeddings,
+                               args.output, k=args.top_k, chunk_size=args.chunk_size, threshold=args.threshold,
+                               evaluation=evaluation, reducer=reducer)
+        reduced = f" in {reducer.dim} {reducer.label} dimensions" if reducer is not None else ""
+        print(f"Classified {count} texts{reduced}. Top-{args.top_k} results saved to {args.output}")
+        if evaluation is not None:
+            print_report(evaluation)
+        return
 
     # Calculate cosine similarity
     similarity_df = calculate_cosine_similarity(technique_embeddings, synthetic_embeddings)
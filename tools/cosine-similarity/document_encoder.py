@@ -0,0 +1,180 @@
+import numpy as np
+from scoring import top_k_rows
+
+POOLING_STRATEGIES = ('max', 'mean', 'topn')
+WINDOW_OVERLAP = 64 # Tokens shared by consecutive windows of one document
+BUFFER_WINDOWS = 4096 # Windows gathered before each encode call; encode() length-sorts within the call
+TOKENIZE_BATCH = 64 # Documents tokenized per fast-tokenizer call
+
+def iter_windows(tokenizer, documents, window_tokens, overlap=WINDOW_OVERLAP):
+    """
+    Splits documents into overlapping windows of at most window_tokens word pieces.
+    Windows are cut from the original text using the tokenizer's character offsets, so they are
+    re-tokenized to exactly the same pieces by the model.
+    Yields (doc_index, window_text, token_count); every document yields at least one window.
+    """
+    stride = max(1, window_tokens - overlap)
+    batch = []
+    doc_index = 0
+
+    def flush():
+        nonlocal doc_index
+        encoded = tokenizer(batch, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        for text, offsets in zip(batch, encoded['offset_mapping']):
+            if len(offsets) <= window_tokens:
+                yield doc_index, text, len(offsets)
+            else:
+                for start in range(0, len(offsets), stride):
+                    piece = offsets[start:start + window_tokens]
+                    yield doc_index, text[piece[0][0]:piece[-1][1]], len(piece)
+                    if start + window_tokens >= len(offsets):
+                        break
+            doc_index += 1
+        batch.clear()
+
+    for document in documents:
+        batch.append(document or '')
+        if len(batch) >= TOKENIZE_BATCH:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+class ScorePool:
+    """
+    Running per-document aggregate of window scores against every technique.
+    'max' keeps the best window per technique, 'mean' averages all windows and 'topn' averages
+    the top_n best windows per technique.
+    """
+
+    def __init__(self, strategy='max', top_n=3):
+        if strategy not in POOLING_STRATEGIES:
+            raise ValueError(f"Unknown pooling strategy '{strategy}'. Choose one of {', '.join(POOLING_STRATEGIES)}.")
+        if top_n < 1:
+            raise ValueError("top_n must be at least 1")
+        self.strategy = strategy
+        self.top_n = top_n
+        self.state = None
+        self.count = 0
+
+    def add(self, scores):
+        """
+        Adds a (windows x techniques) block of scores belonging to this document.
+        """
+        self.count += scores.shape[0]
+        if self.strategy == 'max':
+            block = scores.max(axis=0)
+            self.state = block if self.state is None else np.maximum(self.state, block)
+        elif self.strategy == 'mean':
+            block = scores.sum(axis=0)
+            self.state = block if self.state is None else self.state + block
+        else:
+            stacked = scores if self.state is None else np.vstack([self.state, scores])
+            if stacked.shape[0] > self.top_n:
+                stacked = -np.partition(-stacked, self.top_n - 1, axis=0)[:self.top_n]
+            self.state = stacked
+
+    def result(self):
+        if self.strategy == 'max':
+            return self.state
+        if self.strategy == 'mean':
+            return self.state / self.count
+        return self.state.mean(axis=0)
+
+def _encode_windows(model, texts, batch_size, cache=None):
+    if cache is not None:
+        embeddings, _ = cache.encode(model, texts, batch_size=batch_size)
+    else:
+        embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+def iter_window_buffers(model, documents, overlap=WINDOW_OVERLAP, buffer_windows=BUFFER_WINDOWS, batch_size=64, cache=None):
+    """
+    Streams the windows of all documents in buffers of buffer_windows and encodes each buffer in one call,
+    which length-sorts it into batches so short windows are not padded to the length of long ones.
+    Yields (doc_indices, unit-normalized window embeddings) per buffer.
+    """
+    window_tokens = model.max_seq_length - 2 # Room for [CLS] and [SEP]
+    windows = iter_windows(model.tokenizer, documents, window_tokens, overlap)
+    while True:
+        buffer = []
+        for item in windows:
+            buffer.append(item)
+            if len(buffer) >= buffer_windows:
+                break
+        if not buffer:
+            return
+        embeddings = _encode_windows(model, [text for _, text, _ in buffer], batch_size, cache)
+        yield np.fromiter((doc for doc, _, _ in buffer), dtype=np.int64, count=len(buffer)), embeddings
+
+def _split_documents(doc_indices):
+    # Windows of a document are contiguous, so a buffer splits at the points where the index changes
+    boundaries = np.flatnonzero(np.diff(doc_indices)) + 1
+    return zip(np.r_[0, boundaries], np.r_[boundaries, len(doc_indices)])
+
+def encode_documents(model, documents, cache=None, **options):
+    """
+    Returns one unit-normalized embedding per document: the mean of its window embeddings.
+    Used for long reference texts such as MITRE descriptions, which would otherwise be truncated.
+    """
+    vectors = []
+    partial_doc, partial_sum = None, None
+    for doc_indices, embeddings in iter_window_buffers(model, documents, cache=cache, **options):
+        for start, stop in _split_documents(doc_indices):
+            doc = int(doc_indices[start])
+            block = embeddings[start:stop].sum(axis=0)
+            if doc == partial_doc:
+                partial_sum += block
+                continue
+            if partial_doc is not None:
+                vectors.append(partial_sum)
+            partial_doc, partial_sum = doc, block
+    if partial_doc is not None:
+        vectors.append(partial_sum)
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = np.vstack(vectors)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def iter_document_scores(model, documents, technique_matrix, strategy='max', top_n=3,
+                         overlap=WINDOW_OVERLAP, buffer_windows=BUFFER_WINDOWS, batch_size=64, cache=None):
+    """
+    Scores documents of any length against a unit-normalized technique matrix by pooling the scores
+    of their windows with a ScorePool.
+    Yields (doc_index, scores) in document order, holding at most one buffer of windows in memory.
+    """
+    pool = None
+    pool_doc = None
+    for doc_indices, embeddings in iter_window_buffers(model, documents, overlap, buffer_windows, batch_size, cache):
+        scores = embeddings @ technique_matrix.T
+        for start, stop in _split_documents(doc_indices):
+            doc = int(doc_indices[start])
+            if doc != pool_doc:
+                if pool is not None:
+                    yield pool_doc, pool.result()
+                pool, pool_doc = ScorePool(strategy, top_n), doc
+            pool.add(scores[start:stop])
+
+    if pool is not None:
+        yield pool_doc, pool.result()
+
+def iter_document_top_k(model, documents, technique_matrix, k=5, chunk_size=1024, **pooling):
+    """
+    Groups pooled document scores into chunks and keeps the k best techniques per document.
+    Yields (start_row, top_indices, top_scores) like iter_top_k in scoring.py.
+    """
+    chunk = []
+    start = 0
+    scored = iter_document_scores(model, documents, technique_matrix, **pooling)
+    while True:
+        for _, scores in scored:
+            chunk.append(scores)
+            if len(chunk) >= chunk_size:
+                break
+        if not chunk:
+            return
+        yield (start,) + top_k_rows(np.vstack(chunk), k)
+        start += len(chunk)
+        chunk = []
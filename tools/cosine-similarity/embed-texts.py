@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from embedding_cache import EmbeddingCache, CACHE_FILE
+from encoder_backends import BACKENDS, ONNX_MODEL_DIR, cache_model_name, load_encoder
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import load_texts
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+SOURCES = {
+    # name: (query returning the texts in classification order, .npy file written by --save-npy)
+    'techniques': ('SELECT description FROM mitre_technique_descriptions WHERE {active}', 'technique_embeddings.npy'),
+    'synthetic': ('SELECT text FROM synthetic_texts_test', 'synthetic_embeddings.npy'),
+    # Training sources of train-models.py, read in rowid order like bulk-embed.py
+    'variants': ('SELECT text FROM synthetic_texts ORDER BY rowid', 'variant_embeddings.npy'),
+    'articles': ('SELECT text FROM cited_article_texts ORDER BY rowid', 'article_embeddings.npy'),
+}
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Encode technique descriptions, synthetic texts, variant texts and cited articles into the embedding "
+                    "cache ahead of classification and model training."
+    )
+    parser.add_argument('--source', choices=list(SOURCES), action='append',
+                        help="Optional: Text source(s) to encode. Repeat to select several; defaults to all.")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--cache', type=str, default=CACHE_FILE,
+                        help=f"Embedding cache file receiving the vectors (default: {CACHE_FILE}).")
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help="Texts per model.encode batch (default: 64).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend: PyTorch SentenceTransformer or the ONNX Runtime int8 export (default: torch).")
+    parser.add_argument('--threads', type=int,
+                        help="Optional: Intra-op threads used by the encoder (default: all available CPUs).")
+    parser.add_argument('--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory written by export-onnx-model.py, used by --backend onnx (default: {ONNX_MODEL_DIR}).")
+    parser.add_argument('--save-npy', action='store_true',
+                        help=f"Also write each source to its fixed .npy file ({', '.join(npy_file for _, npy_file in SOURCES.values())}).")
+    args = parser.parse_args()
+
+    model = load_encoder(args.backend, MODEL_NAME, args.onnx_dir, args.threads)
+
+    with EmbeddingCache(args.cache, model_name=cache_model_name(args.backend, MODEL_NAME)) as cache:
+        for source in args.source or list(SOURCES):
+            query, npy_file = SOURCES[source]
+            texts = load_texts(args.db, query)
+            start = time.perf_counter()
+            embeddings, stats = cache.encode(model, texts, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(f"{source}: {len(texts)} texts, {stats['hits']} cached, {stats['misses']} encoded in {elapsed:.2f}s")
+            if args.save_npy:
+                np.save(npy_file, embeddings)
+                print(f"{source}: saved {embeddings.shape[0]} x {embeddings.shape[1] if embeddings.size else 0} embeddings to {npy_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import sqlite3
+import hashlib
+import os
+import sys
+import numpy as np
+
+# The shared tracing layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.tracing import span
+
+CACHE_FILE = os.path.join('data', 'embedding-cache', 'embeddings.db')
+PREPROCESS_VERSION = '1' # Bump whenever the text preprocessing changes so old vectors are not reused
+LOOKUP_BATCH = 500 # Keys per SELECT ... IN (...) query, kept below SQLite's variable limit
+
+def preprocess_text(text):
+    """
+    Applies the preprocessing tied to PREPROCESS_VERSION before a text is encoded.
+    Version 1 encodes texts exactly as stored in the database.
+    """
+    return text
+
+def cache_key(model_name, text, preprocess_version=PREPROCESS_VERSION):
+    """
+    Returns the content address of a text: a SHA-256 over model name, preprocessing version and text.
+    Raises TypeError for anything but a string, such as the NULL description of a revoked technique.
+    """
+    if not isinstance(text, str):
+        raise TypeError(f"Embedding cache keys need a text string, got {type(text).__name__}.")
+    digest = hashlib.sha256()
+    for part in (model_name, preprocess_version, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embeddings in a SQLite file.
+    Each vector is keyed by cache_key(), so the same text is encoded at most once per model and
+    preprocessing version no matter which table or row order it comes from.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE, model_name='all-MiniLM-L6-v2', preprocess_version=PREPROCESS_VERSION):
+        self.cache_file = cache_file
+        self.model_name = model_name
+        self.preprocess_version = preprocess_version
+        self.hits = 0
+        self.misses = 0
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(cache_file)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY,
+            model_name TEXT,
+            dim INTEGER,
+            vector BLOB
+        )
+        """)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key(self, text):
+        return cache_key(self.model_name, text, self.preprocess_version)
+
+    def get_many(self, keys):
+        """
+        Looks up a collection of keys.
+        Returns a dict of key -> float32 vector for the keys that are cached.
+        """
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, keys, vectors):
+        """
+        Stores vectors under their keys in a single transaction.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_name, dim, vector) VALUES (?, ?, ?, ?)",
+                ((key, self.model_name, vector.shape[0], vector.tobytes()) for key, vector in zip(keys, vectors))
+            )
+
+    def encode(self, model, texts, batch_size=64):
+        """
+        Returns embeddings for texts in the caller's row order, encoding only texts not seen before.
+        Duplicate texts within one call are encoded once.
+        Hit and miss counts for the call are returned alongside the embeddings and added to the running totals.
+        """
+        with span('encode.cache_lookup') as current:
+            keys = [self.key(text) for text in texts]
+            found = self.get_many(set(keys))
+            current.add(items=len(texts))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = preprocess_text(text)
+
+        if missing:
+            with span('encode.model') as current:
+                new_vectors = model.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+                current.add(items=len(missing))
+            with span('encode.cache_write') as current:
+                self.put_many(missing.keys(), new_vectors)
+                current.add(items=len(missing))
+            found.update(zip(missing.keys(), np.asarray(new_vectors, dtype=np.float32)))
+
+        stats = {'hits': len(texts) - len(missing), 'misses': len(missing)}
+        self.hits += stats['hits']
+        self.misses += stats['misses']
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32), stats
+        return np.vstack([found[key] for key in keys]), stats
@@ -0,0 +1,213 @@
+import json
+import os
+import numpy as np
+from reduction import REDUCER_FILE, Reducer
+
+LAYOUTS = ('float32', 'float16', 'int8')
+BLOCK_ROWS = 65536 # Stored vectors converted to float32 at a time while scoring
+META_FILE = 'meta.json'
+VECTORS_FILE = 'vectors.bin'
+SCALES_FILE = 'scales.bin'
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def quantize_int8(vectors):
+    """
+    Quantizes each row to int8 with its own scale (max absolute value / 127).
+    Returns (codes, scales) such that codes * scales[:, None] approximates vectors.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding matrix that is memory-mapped for reading.
+    Vectors are unit-normalized on append, so scores are cosine similarities.
+    The float16 layout halves the size of float32 and the int8 layout stores one byte per
+    dimension plus a float32 scale per vector; scoring multiplies by the scale after the
+    matrix product instead of materializing a dequantized copy of the store.
+    A store created with a Reducer keeps it in reducer.npz and stores reduced vectors: appended
+    vectors and the matrices and queries it is scored against are given in encoder dimensions
+    and reduced on the way in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.layout = meta['layout']
+        self.count = meta['count']
+        self.reducer = Reducer.load(path) if os.path.exists(os.path.join(path, REDUCER_FILE)) else None
+        self._codes = None
+        self._scales = None
+
+    @classmethod
+    def create(cls, path, dim, layout='float32', reducer=None):
+        """
+        Creates an empty store at path (a directory) and returns it opened. dim is the dimension of the
+        appended vectors; with a reducer, the store holds its reduced dimension instead.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}'. Choose one of {', '.join(LAYOUTS)}.")
+        if reducer is not None and reducer.source_dim != dim:
+            raise ValueError(f"The reducer expects vectors of dimension {reducer.source_dim}, not {dim}.")
+        os.makedirs(path, exist_ok=True)
+        # The reducer is written before meta.json, so a store that has its meta always has its reducer
+        if reducer is not None:
+            reducer.save(os.path.join(path, REDUCER_FILE))
+            dim = reducer.dim
+        open(os.path.join(path, VECTORS_FILE), 'wb').close()
+        if layout == 'int8':
+            open(os.path.join(path, SCALES_FILE), 'wb').close()
+        cls._write_meta(path, dim, layout, 0)
+        return cls(path)
+
+    @staticmethod
+    def _write_meta(path, dim, layout, count):
+        # The count in meta.json is only advanced after the data is flushed, so a crash mid-append
+        # leaves trailing bytes that are ignored and overwritten by the next append
+        tmp_file = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'dim': dim, 'layout': layout, 'count': count}, f)
+        os.replace(tmp_file, os.path.join(path, META_FILE))
+
+    @property
+    def dtype(self):
+        return np.dtype(self.layout)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def shape(self):
+        return (self.count, self.dim)
+
+    @property
+    def input_dim(self):
+        """
+        Dimension of the vectors appended to and scored against the store.
+        """
+        return self.reducer.source_dim if self.reducer is not None else self.dim
+
+    def reduce(self, vectors):
+        """
+        Returns vectors unit-normalized in the store's dimensions, reduced if the store has a reducer.
+        """
+        if self.reducer is not None:
+            vectors = self.reducer.transform(vectors)
+        return _normalize(vectors)
+
+    def __getitem__(self, rows):
+        # Slicing returns dequantized float32 rows, so a store can stand in for a NumPy array of embeddings
+        if not isinstance(rows, slice) or rows.step not in (None, 1):
+            raise TypeError("EmbeddingStore only supports contiguous row slices.")
+        return self.vectors(rows.start or 0, rows.stop)
+
+    def nbytes(self):
+        """
+        Returns the number of bytes the stored vectors (and int8 scales) occupy.
+        """
+        total = self.count * self.dim * self.dtype.itemsize
+        if self.layout == 'int8':
+            total += self.count * 4
+        return total
+
+    def append(self, vectors):
+        """
+        Normalizes (and reduces), encodes and appends vectors to the store.
+        Returns the row index of the first appended vector.
+        """
+        vectors = self.reduce(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}.")
+        start = self.count
+
+        if self.layout == 'int8':
+            codes, scales = quantize_int8(vectors)
+            self._write_at(SCALES_FILE, start * 4, scales.tobytes())
+        else:
+            codes = vectors.astype(self.dtype)
+        self._write_at(VECTORS_FILE, start * self.dim * self.dtype.itemsize, codes.tobytes())
+
+        self.count += vectors.shape[0]
+        self._write_meta(self.path, self.dim, self.layout, self.count)
+        self._codes = None
+        self._scales = None
+        return start
+
+    def _write_at(self, file_name, offset, data):
+        with open(os.path.join(self.path, file_name), 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _mapped(self):
+        if self._codes is None and self.count:
+            self._codes = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=self.dtype,
+                                    mode='r', shape=(self.count, self.dim))
+            if self.layout == 'int8':
+                self._scales = np.memmap(os.path.join(self.path, SCALES_FILE), dtype=np.float32,
+                                         mode='r', shape=(self.count,))
+        return self._codes, self._scales
+
+    def vectors(self, start=0, stop=None):
+        """
+        Returns rows start:stop as a float32 array (dequantized for int8).
+        """
+        codes, scales = self._mapped()
+        if codes is None:
+            return np.empty((0, self.dim), dtype=np.float32)
+        block = np.asarray(codes[start:stop], dtype=np.float32)
+        if scales is not None:
+            block *= scales[start:stop, np.newaxis]
+        return block
+
+    def iter_scores(self, matrix, block_rows=BLOCK_ROWS):
+        """
+        Scores stored vectors against a matrix of unit-normalized float32 vectors, one block of rows at a time.
+        With a reducer, the matrix is reduced and renormalized first.
+        Yields (start_row, scores) where scores has shape (rows in block, len(matrix)).
+        """
+        codes, scales = self._mapped()
+        if codes is None:
+            return
+        if self.reducer is not None:
+            matrix = self.reduce(matrix)
+        matrix_t = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32).T)
+        for start in range(0, self.count, block_rows):
+            block = np.asarray(codes[start:start + block_rows], dtype=np.float32)
+            scores = block @ matrix_t
+            if scales is not None:
+                scores *= scales[start:start + block_rows, np.newaxis]
+            yield start, scores
+
+    def top_k(self, queries, k=5, block_rows=BLOCK_ROWS):
+        """
+        Finds the k stored vectors most similar to each query, scanning the store block by block.
+        Returns (indices, scores) arrays of shape (len(queries), k), best match first.
+        """
+        queries = _normalize(queries)
+        k = min(k, self.count)
+        best_indices = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+        for start, scores in self.iter_scores(queries, block_rows):
+            # Merge this block's candidates with the running best and keep the k highest
+            scores = scores.T
+            candidates = np.concatenate([best_scores, scores], axis=1)
+            indices = np.concatenate([best_indices, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)], axis=1)
+            keep = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidates, keep, axis=1)
+            best_indices = np.take_along_axis(indices, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_indices, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from encoder_backends import MODEL_NAME, ONNX_MODEL_DIR, default_threads, load_encoder
+from scoring import normalize_embeddings, top_k_rows
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import load_texts
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+
+def resident_mb():
+    """
+    Returns the current resident set size of this process in MB (Linux), or NaN where /proc is unavailable.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return float('nan')
+
+def timed_encode(encoder, texts, batch_size):
+    encoder.encode(texts[:batch_size], batch_size=batch_size, convert_to_numpy=True) # Warm up
+    start = time.perf_counter()
+    embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the ONNX int8 encoder against the PyTorch encoder on the synthetic corpus: "
+                    "embedding cosine agreement, top-1/top-k classification agreement, throughput and memory."
+    )
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--onnx-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory written by export-onnx-model.py (default: {ONNX_MODEL_DIR}).")
+    parser.add_argument('--float', action='store_true',
+                        help="Compare the unquantized ONNX model instead of the int8 one.")
+    parser.add_argument('--limit', type=int,
+                        help="Optional: Only use the first N synthetic texts.")
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help="Size of the top-k set compared between backends (default: 5).")
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help="Texts per encode batch (default: 64).")
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, default_threads()}),
+                        help="Intra-op thread counts to measure throughput at (default: 1 and all CPUs).")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    techniques = load_texts(args.db, 'SELECT description FROM mitre_technique_descriptions WHERE {active}')
+    texts = load_texts(args.db, 'SELECT text FROM synthetic_texts_test')[:args.limit]
+    k = min(args.top_k, len(techniques))
+    print(f"Corpus: {len(texts)} synthetic texts scored against {len(techniques)} techniques\n")
+
+    # The ONNX backend is loaded first so its memory is measured before PyTorch is imported
+    baseline_mb = resident_mb()
+    onnx = load_encoder('onnx', onnx_dir=args.onnx_dir, quantized=not args.float)
+    onnx_mb = resident_mb() - baseline_mb
+    torch_model = load_encoder('torch', MODEL_NAME)
+    torch_mb = resident_mb() - baseline_mb - onnx_mb
+
+    encoded = {}
+    for name, encoder in (('torch', torch_model), ('onnx', onnx)):
+        technique_matrix = normalize_embeddings(encoder.encode(techniques, batch_size=args.batch_size, convert_to_numpy=True))
+        queries = normalize_embeddings(encoder.encode(texts, batch_size=args.batch_size, convert_to_numpy=True))
+        encoded[name] = (queries, top_k_rows(queries @ technique_matrix.T, k)[0])
+
+    (torch_queries, torch_top), (onnx_queries, onnx_top) = encoded['torch'], encoded['onnx']
+    cosines = np.sum(torch_queries * onnx_queries, axis=1)
+    top1_agreement = np.mean(torch_top[:, 0] == onnx_top[:, 0])
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(torch_top, onnx_top)])
+    print(f"Embedding cosine torch vs {onnx.name}: mean {cosines.mean():.5f}, p1 {np.percentile(cosines, 1):.5f}, min {cosines.min():.5f}")
+    print(f"Classification agreement: top-1 {top1_agreement:.4f}, top-{k} overlap {overlap:.4f}")
+    print(f"Resident memory added by loading: torch {torch_mb:.0f} MB, onnx {onnx_mb:.0f} MB\n")
+
+    print(f"{'backend':<8} {'threads':>7} {'texts/s':>10} {'texts/s/thread':>15}")
+    for threads in args.threads:
+        for name in ('torch', 'onnx'):
+            encoder = load_encoder(name, MODEL_NAME, args.onnx_dir, threads=threads, quantized=not args.float)
+            _, seconds = timed_encode(encoder, texts, args.batch_size)
+            rate = len(texts) / seconds if seconds > 0 else float('inf')
+            print(f"{name:<8} {threads:>7} {rate:>10.1f} {rate / threads:>15.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import numpy as np
+
+# The shared tracing layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.tracing import span
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+BACKENDS = ('torch', 'onnx')
+ONNX_MODEL_DIR = os.path.join('data', 'onnx-models', MODEL_NAME)
+FLOAT_MODEL_FILE = 'model.onnx'
+INT8_MODEL_FILE = 'model.int8.onnx'
+META_FILE = 'encoder.json'
+ONNX_OPSET = 14
+TORCH_MAX_SEQ_LENGTH = 256 # max_seq_length sentence-transformers uses for all-MiniLM-L6-v2
+
+# Every backend returns an object with encode(texts, batch_size=..., convert_to_numpy=True), tokenizer and
+# max_seq_length, which is all encode_texts, EmbeddingCache and document_encoder rely on.
+# onnxruntime, transformers, torch and sentence-transformers are imported only by the backend that needs them.
+
+def default_threads():
+    """
+    Returns the number of CPUs this process may run on, used as the default intra-op thread count.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def cache_model_name(backend='torch', model_name=MODEL_NAME, quantized=True):
+    """
+    Returns the model name embeddings of a backend are cached under.
+    ONNX int8 vectors differ slightly from PyTorch ones, so they get their own cache entries; the PyTorch
+    backend keeps the plain model name so existing cache files stay valid.
+    """
+    if backend == 'torch':
+        return model_name
+    return f"{model_name}-onnx-int8" if quantized else f"{model_name}-onnx"
+
+def export_onnx(model_name=MODEL_NAME, output_dir=ONNX_MODEL_DIR, opset=ONNX_OPSET):
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX and writes a dynamically int8-quantized copy,
+    the tokenizer files and the pooling settings next to it.
+    Returns the paths of the float and int8 models.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = SentenceTransformer(model_name, device='cpu')
+    pooling = next((module for module in model if isinstance(module, models.Pooling)), None)
+    if pooling is None or not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name} does not use mean pooling, which is the only pooling the ONNX backend implements.")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    sample = tokenizer(['An example sentence to trace the graph.'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    float_path = os.path.join(output_dir, FLOAT_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in input_names), float_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True)
+
+    int8_path = os.path.join(output_dir, INT8_MODEL_FILE)
+    quantize_dynamic(float_path, int8_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    meta = {
+        'model_name': model_name,
+        'dim': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'normalize': any(isinstance(module, models.Normalize) for module in model),
+        'inputs': input_names,
+        'opset': opset,
+    }
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return float_path, int8_path
+
+class OnnxEncoder:
+    """
+    Sentence encoder running an exported transformer through ONNX Runtime on the CPU, with the mean pooling
+    (and normalization, when the original model has it) of the SentenceTransformer pipeline done in numpy.
+    Texts are sorted by length before batching, as SentenceTransformer does, so batches are padded little.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=True, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        meta_path = os.path.join(model_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"{meta_path} not found. Export the model first with export-onnx-model.py.")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or default_threads()
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = INT8_MODEL_FILE if quantized else FLOAT_MODEL_FILE
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.meta['max_seq_length']
+        self.threads = options.intra_op_num_threads
+        self.name = cache_model_name('onnx', self.meta['model_name'], quantized)
+
+    def _encode_batch(self, texts):
+        with span('encode.tokenize') as current:
+            encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors='np')
+            current.add(items=len(texts))
+        feeds = {}
+        for name in self.input_names:
+            values = encoded.get(name)
+            feeds[name] = (values if values is not None else np.zeros_like(encoded['input_ids'])).astype(np.int64)
+        with span('encode.forward', padded_length=int(encoded['input_ids'].shape[1])) as current:
+            hidden = self.session.run(None, feeds)[0]
+            current.add(items=len(texts), tokens=int(encoded['attention_mask'].sum()))
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.meta['normalize']:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def encode(self, texts, batch_size=64, convert_to_numpy=True, **kwargs):
+        """
+        Returns a float32 array with one embedding per text, in the order of texts.
+        Accepts the keyword arguments of SentenceTransformer.encode; only batch_size is used.
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        embeddings = np.empty((len(texts), self.meta['dim']), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            embeddings[indices] = self._encode_batch([texts[i] for i in indices])
+        return embeddings[0] if single else embeddings
+
+def load_tokenizer(backend='torch', model_name=MODEL_NAME, onnx_dir=ONNX_MODEL_DIR):
+    """
+    Loads only the tokenizer of a backend's model, for callers that need token counts without the model.
+    Returns (tokenizer, max_seq_length).
+    """
+    from transformers import AutoTokenizer
+    if backend == 'onnx':
+        with open(os.path.join(onnx_dir, META_FILE), 'r', encoding='utf-8') as f:
+            max_seq_length = json.load(f)['max_seq_length']
+        return AutoTokenizer.from_pretrained(onnx_dir), max_seq_length
+    repo_id = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+    return AutoTokenizer.from_pretrained(repo_id), TORCH_MAX_SEQ_LENGTH
+
+def load_encoder(backend='torch', model_name=MODEL_NAME, onnx_dir=ONNX_MODEL_DIR, threads=None, quantized=True):
+    """
+    Returns the encoder of a backend: a SentenceTransformer for 'torch', an OnnxEncoder for 'onnx'.
+    threads sets the intra-op thread count of either backend; by default it uses every available CPU.
+    """
+    with span('encode.load_model', backend=backend):
+        if backend == 'torch':
+            from sentence_transformers import SentenceTransformer
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            return SentenceTransformer(model_name)
+        if backend == 'onnx':
+            return OnnxEncoder(onnx_dir, quantized=quantized, threads=threads)
+    raise ValueError(f"Unknown encoder backend '{backend}'. Choose one of {', '.join(BACKENDS)}.")
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import numpy as np
+from evaluation import (CREDITS, READ_ROWS, REPORT_THRESHOLDS, Evaluation, iter_top_k_csv, print_report,
+                        top_k_csv_columns, write_table)
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+TABLE_NAME = 'synthetic_texts_test'
+
+def load_gold_labels(db_file, table_name=TABLE_NAME):
+    """
+    Returns the technique_id of every text in the order cosine-similarity.py classifies them.
+    """
+    db = connect(db_file)
+    try:
+        return [technique_id for (technique_id,) in db.execute(f"SELECT technique_id FROM {table_name}")]
+    finally:
+        db.close()
+
+def load_gold_rows(db_file, table_name=TABLE_NAME):
+    """
+    Returns (rowids in ascending order, technique_id per rowid) of every text, for CSVs keyed by row_id.
+    """
+    db = connect(db_file)
+    try:
+        rows = db.execute(f"SELECT rowid, technique_id FROM {table_name} ORDER BY rowid").fetchall()
+    finally:
+        db.close()
+    return np.array([rowid for rowid, _ in rows], dtype=np.int64), [technique_id for _, technique_id in rows]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score a top-k classification CSV against the gold technique IDs of the classified texts."
+    )
+    parser.add_argument('predictions', help="Top-k CSV written by cosine-similarity.py --output or classify-with-model.py.")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--table', type=str, default=TABLE_NAME,
+                        help=f"Table holding the classified texts and their technique IDs (default: {TABLE_NAME}).")
+    parser.add_argument('--credit', choices=CREDITS, default='exact',
+                        help="Whether a prediction must match the gold technique exactly, or only its parent "
+                             "technique (T1059.003 for T1059.001), in the threshold and per-technique reports (default: exact).")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=list(REPORT_THRESHOLDS),
+                        help=f"Thresholds printed from the precision/recall/coverage curve (default: {' '.join(map(str, REPORT_THRESHOLDS))}).")
+    parser.add_argument('--curve', type=str,
+                        help="Optional: Write the full curve, one row per distinct top-1 score, to this CSV file.")
+    parser.add_argument('--per-technique', type=str,
+                        help="Optional: Write per-technique precision and recall to this CSV file.")
+    parser.add_argument('--technique-threshold', type=float,
+                        help="Optional: Only count top-1 predictions scoring at least this in --per-technique (default: all).")
+    parser.add_argument('--read-rows', type=int, default=READ_ROWS,
+                        help=f"CSV rows evaluated per chunk (default: {READ_ROWS}).")
+    args = parser.parse_args()
+
+    # CSVs written by classify-with-model.py name each text by its rowid; others by its position in the table
+    by_row_id = 'row_id' in top_k_csv_columns(args.predictions)
+    if by_row_id:
+        rowids, gold = load_gold_rows(args.db, args.table)
+        evaluation = Evaluation(gold)
+    else:
+        evaluation = Evaluation(load_gold_labels(args.db, args.table))
+    index_column = 'row_id' if by_row_id else 'query_index'
+    for query_indices, passed, predicted, scores in iter_top_k_csv(args.predictions, args.read_rows, index_column):
+        if predicted.shape[1] == 0:
+            parser.error(f"{args.predictions} has no technique_id_<rank> columns.")
+        if by_row_id:
+            positions = np.minimum(np.searchsorted(rowids, query_indices), max(len(rowids) - 1, 0))
+            if query_indices.size and (not len(rowids) or (rowids[positions] != query_indices).any()):
+                parser.error(f"{args.predictions} has row IDs that are not in {args.table}.")
+            query_indices = positions
+        elif query_indices.size and query_indices.max() >= len(evaluation.gold):
+            parser.error(f"{args.predictions} has rows beyond the {len(evaluation.gold)} texts in {args.table}.")
+        evaluation.add_ids(query_indices, predicted, scores, passed)
+
+    curve = print_report(evaluation, args.credit, args.thresholds)
+    if args.curve:
+        write_table(curve, args.curve)
+        print(f"Curve with {curve['threshold'].size} points written to {args.curve}")
+    if args.per_technique:
+        table = evaluation.per_technique(args.credit, args.technique_threshold)
+        write_table(table, args.per_technique)
+        print(f"Per-technique precision/recall for {len(table['technique_id'])} techniques written to {args.per_technique} "
+              f"(macro precision {table['precision'].mean() if table['precision'].size else 0.0:.4f}, "
+              f"macro recall {table['recall'].mean() if table['recall'].size else 0.0:.4f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import csv
+import os
+import sys
+import numpy as np
+
+# The shared tracing layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.tracing import span
+
+CREDITS = ('exact', 'parent')
+READ_ROWS = 65536 # CSV rows parsed per chunk
+REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+def parent_technique(technique_id):
+    """
+    Returns the parent technique of a sub-technique ID (T1059.001 -> T1059); other IDs are returned unchanged.
+    """
+    return technique_id.split('.', 1)[0]
+
+def first_hit_rank(predicted, gold):
+    """
+    Returns the 0-based rank of the first prediction in each row equal to its gold value, or -1 for rows
+    without one.
+    """
+    hits = predicted == gold[:, None]
+    return np.where(hits.any(axis=1), hits.argmax(axis=1), -1).astype(np.int16)
+
+def top_k_csv_columns(csv_file):
+    """
+    Returns the header of a top-k CSV.
+    """
+    with open(csv_file, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+def iter_top_k_csv(csv_file, read_rows=READ_ROWS, index_column='query_index'):
+    """
+    Streams a top-k CSV written by cosine-similarity.py --output in chunks of read_rows rows.
+    Yields (values of index_column, passed flags, predicted technique IDs per rank, scores per rank) as arrays;
+    index_column='row_id' reads the source rowids written by classify-with-model.py.
+    """
+    with open(csv_file, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        index = header.index(index_column)
+        id_columns = [i for i, name in enumerate(header) if name.startswith('technique_id_')]
+        score_columns = [i for i, name in enumerate(header) if name.startswith('score_')]
+        while True:
+            with span('evaluate.read') as current:
+                rows = [row for _, row in zip(range(read_rows), reader)]
+                if not rows:
+                    return
+                columns = list(zip(*rows))
+                chunk = (np.array(columns[index], dtype=np.int64),
+                         np.array(columns[1], dtype=object) == '1',
+                         np.array([columns[i] for i in id_columns], dtype=object).T.reshape(len(rows), len(id_columns)),
+                         np.array([columns[i] for i in score_columns], dtype=np.float32).T.reshape(len(rows), len(score_columns)))
+                current.add(items=len(rows))
+            yield chunk
+
+class Evaluation:
+    """
+    Accumulates top-k classifications chunk by chunk against the gold technique IDs of every text, keeping only
+    a few values per text: the top-1 prediction and score and the rank of the first exact and parent-level hit.
+    Metrics for any threshold come from these arrays with one sort, so a score stream never needs to be held
+    as a full matrix.
+    Under 'parent' credit a prediction counts when it shares the parent technique of the gold label, so
+    predicting T1059 or T1059.003 for a T1059.001 text is a hit.
+    """
+
+    def __init__(self, gold_ids):
+        self._codes = {}
+        self.technique_ids = []
+        self._parent_index = {}
+        self._parents = [] # Parent code per technique code; IDs without a parent get a unique negative code
+        self.gold = self.encode(gold_ids)
+        count = len(self.gold)
+        self.seen = np.zeros(count, dtype=bool)
+        self.top_1 = np.full(count, -1, dtype=np.int32)
+        self.top_1_score = np.full(count, -np.inf, dtype=np.float32)
+        self.hit_rank = {credit: np.full(count, -1, dtype=np.int16) for credit in CREDITS}
+        self.passed = np.zeros(count, dtype=bool)
+        self.k = 0
+
+    def encode(self, technique_ids):
+        """
+        Maps technique IDs to integer codes, growing the vocabulary with unseen IDs. Missing labels (None)
+        get their own code, which never equals a prediction.
+        """
+        values = np.array(['' if technique_id is None else technique_id for technique_id in technique_ids], dtype=object)
+        if not values.size:
+            return np.empty(0, dtype=np.int32)
+        unique, inverse = np.unique(values, return_inverse=True)
+        for technique_id in unique.tolist():
+            if technique_id not in self._codes:
+                self._codes[technique_id] = len(self.technique_ids)
+                self.technique_ids.append(technique_id)
+                parent = parent_technique(technique_id)
+                self._parents.append(self._parent_index.setdefault(parent, len(self._parent_index)) if parent else -len(self._parents) - 1)
+        return np.array([self._codes[technique_id] for technique_id in unique.tolist()], dtype=np.int32)[inverse.reshape(-1)]
+
+    def add(self, query_indices, predicted_codes, scores, passed=None):
+        """
+        Records a chunk of classifications: predicted_codes and scores are (texts x k), best first, with codes
+        from encode(). passed marks texts that passed the threshold when they were written, if known.
+        """
+        with span('evaluate.add') as current:
+            query_indices = np.asarray(query_indices, dtype=np.int64)
+            predicted_codes = np.asarray(predicted_codes, dtype=np.int32)
+            gold = self.gold[query_indices]
+            parents = np.array(self._parents, dtype=np.int32)
+            self.seen[query_indices] = True
+            self.k = max(self.k, predicted_codes.shape[1])
+            if predicted_codes.shape[1]:
+                self.top_1[query_indices] = predicted_codes[:, 0]
+                self.top_1_score[query_indices] = scores[:, 0]
+            self.hit_rank['exact'][query_indices] = first_hit_rank(predicted_codes, gold)
+            self.hit_rank['parent'][query_indices] = first_hit_rank(parents[predicted_codes], parents[gold])
+            if passed is not None:
+                self.passed[query_indices] = passed
+            current.add(items=len(query_indices))
+
+    def add_ids(self, query_indices, predicted_ids, scores, passed=None):
+        """
+        Records a chunk whose predictions are technique IDs, as read by iter_top_k_csv.
+        """
+        codes = self.encode(predicted_ids.reshape(-1)).reshape(predicted_ids.shape)
+        self.add(query_indices, codes, scores, passed)
+
+    def observe(self, chunks, technique_ids, threshold=None):
+        """
+        Wraps a stream of (start_row, top_indices, top_scores) chunks, such as scoring.iter_top_k, recording
+        each chunk before passing it on unchanged. top_indices point into technique_ids; rows whose top-1 score
+        reaches threshold are recorded as passed.
+        """
+        codes = self.encode(technique_ids)
+        for start, top_indices, top_scores in chunks:
+            passed = top_scores[:, 0] >= threshold if threshold is not None else None
+            self.add(np.arange(start, start + top_indices.shape[0]), codes[top_indices], top_scores, passed)
+            yield start, top_indices, top_scores
+
+    def summary(self):
+        """
+        Returns top-1 and top-k accuracy per credit over the recorded texts, and the share of texts marked as
+        passed with the top-1 accuracy among them.
+        """
+        count = int(self.seen.sum())
+        passed = self.passed[self.seen]
+        results = {'texts': count, 'k': self.k, 'coverage': float(passed.mean()) if count else 0.0}
+        for credit in CREDITS:
+            rank = self.hit_rank[credit][self.seen]
+            results[f'{credit}_top_1_accuracy'] = float((rank == 0).mean()) if count else 0.0
+            results[f'{credit}_top_k_accuracy'] = float((rank >= 0).mean()) if count else 0.0
+            results[f'{credit}_passed_top_1_accuracy'] = float((rank[passed] == 0).mean()) if passed.any() else 0.0
+        return results
+
+    def threshold_curve(self, credit='exact'):
+        """
+        Returns precision, recall and coverage of the top-1 prediction at every distinct top-1 score, from one
+        descending sort. At threshold t, coverage is the share of texts whose top-1 score is at least t,
+        precision the top-1 accuracy among them and recall the share of all texts classified correctly.
+        Returns a dict of arrays ordered by decreasing threshold.
+        """
+        scores = self.top_1_score[self.seen]
+        correct = self.hit_rank[credit][self.seen] == 0
+        order = np.argsort(-scores, kind='stable')
+        scores, correct = scores[order], correct[order]
+        # Texts with equal scores pass or fail together, so the curve has a point at the last of each run
+        last = np.flatnonzero(np.r_[scores[1:] != scores[:-1], True]) if scores.size else np.empty(0, dtype=np.int64)
+        passing = (last + 1).astype(np.float64)
+        true_positives = np.cumsum(correct, dtype=np.float64)[last]
+        total = max(scores.size, 1)
+        precision = true_positives / passing
+        recall = true_positives / total
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(precision), where=precision + recall > 0)
+        return {'threshold': scores[last], 'coverage': passing / total, 'precision': precision,
+                'recall': recall, 'f1': f1}
+
+    def at_thresholds(self, thresholds, credit='exact', curve=None):
+        """
+        Reads the threshold curve at the given thresholds. Returns a dict of arrays like threshold_curve.
+        """
+        curve = curve or self.threshold_curve(credit)
+        # Compared in float32 like the scores, as write_top_k does when it marks passing rows
+        thresholds = np.asarray(thresholds, dtype=np.float32)
+        # The curve point of threshold t is the lowest curve threshold that is still >= t
+        points = np.searchsorted(-curve['threshold'], -thresholds, side='right') - 1
+        results = {'threshold': thresholds}
+        for name in ('coverage', 'precision', 'recall', 'f1'):
+            values = curve[name][np.maximum(points, 0)] if curve[name].size else np.zeros(len(points))
+            results[name] = np.where(points >= 0, values, 0.0)
+        return results
+
+    def per_technique(self, credit='exact', threshold=None):
+        """
+        Returns per gold technique the number of texts, top-1 predictions, correct top-1 predictions,
+        precision and recall, counting only predictions whose score reaches threshold when one is given.
+        Under parent credit a prediction is attributed to the gold technique it was credited to.
+        """
+        seen = self.seen
+        gold = self.gold[seen]
+        predicted = self.top_1[seen]
+        correct = self.hit_rank[credit][seen] == 0
+        if threshold is not None:
+            predicted = np.where(self.top_1_score[seen] >= threshold, predicted, -1)
+            correct &= predicted >= 0
+        predicted = np.where(correct, gold, predicted)
+        size = len(self.technique_ids)
+        texts = np.bincount(gold, minlength=size)
+        predictions = np.bincount(predicted[predicted >= 0], minlength=size)
+        hits = np.bincount(gold[correct], minlength=size)
+        labelled = np.flatnonzero((texts > 0) | (predictions > 0))
+        labelled = labelled[np.array([self.technique_ids[code] != '' for code in labelled], dtype=bool)] if labelled.size else labelled
+        return {
+            'technique_id': [self.technique_ids[code] for code in labelled],
+            'texts': texts[labelled],
+            'predictions': predictions[labelled],
+            'correct': hits[labelled],
+            'precision': np.divide(hits[labelled], predictions[labelled], out=np.zeros(labelled.size), where=predictions[labelled] > 0),
+            'recall': np.divide(hits[labelled], texts[labelled], out=np.zeros(labelled.size), where=texts[labelled] > 0),
+        }
+
+def write_table(table, output_file):
+    """
+    Writes a dict of equally long columns, as returned by threshold_curve or per_technique, to a CSV file.
+    """
+    names = list(table)
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for row in zip(*(table[name] for name in names)):
+            writer.writerow([f'{value:.6f}' if isinstance(value, (float, np.floating)) else value for value in row])
+
+def print_report(evaluation, credit='exact', thresholds=REPORT_THRESHOLDS):
+    """
+    Prints the accuracy summary, the curve read at the given thresholds and the threshold with the best F1.
+    Returns the curve.
+    """
+    results = evaluation.summary()
+    print(f"Texts evaluated: {results['texts']}")
+    print(f"Top-1 accuracy: {results['exact_top_1_accuracy']:.4f} (parent technique credit: {results['parent_top_1_accuracy']:.4f})")
+    print(f"Top-{results['k']} accuracy: {results['exact_top_k_accuracy']:.4f} (parent technique credit: {results['parent_top_k_accuracy']:.4f})")
+    print(f"Passing threshold: {results['coverage']:.4f} (top-1 accuracy among them: {results[f'{credit}_passed_top_1_accuracy']:.4f})")
+
+    curve = evaluation.threshold_curve(credit)
+    points = evaluation.at_thresholds(sorted(thresholds), credit, curve)
+    print(f"\n{'threshold':>9} {'coverage':>9} {'precision':>9} {'recall':>9} {'f1':>9}   ({credit} credit)")
+    for row in zip(*(points[name] for name in ('threshold', 'coverage', 'precision', 'recall', 'f1'))):
+        print(' '.join(f"{value:>9.4f}" for value in row))
+    if curve['f1'].size:
+        best = int(np.argmax(curve['f1']))
+        print(f"Best F1 {curve['f1'][best]:.4f} at threshold {curve['threshold'][best]:.4f} "
+              f"(coverage {curve['coverage'][best]:.4f}, precision {curve['precision'][best]:.4f})")
+    return curve
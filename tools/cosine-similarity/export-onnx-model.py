@@ -0,0 +1,22 @@
+import argparse
+import os
+from encoder_backends import MODEL_NAME, ONNX_MODEL_DIR, ONNX_OPSET, export_onnx
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the sentence encoder to ONNX with a dynamically int8-quantized copy for the onnx backend."
+    )
+    parser.add_argument('--model', type=str, default=MODEL_NAME,
+                        help=f"SentenceTransformer model to export (default: {MODEL_NAME}).")
+    parser.add_argument('-o', '--output-dir', type=str, default=ONNX_MODEL_DIR,
+                        help=f"Directory receiving the ONNX models and tokenizer (default: {ONNX_MODEL_DIR}).")
+    parser.add_argument('--opset', type=int, default=ONNX_OPSET,
+                        help=f"ONNX opset version (default: {ONNX_OPSET}).")
+    args = parser.parse_args()
+
+    float_path, int8_path = export_onnx(args.model, args.output_dir, args.opset)
+    print(f"Exported {args.model}: {float_path} ({os.path.getsize(float_path) / 1e6:.1f} MB), "
+          f"{int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
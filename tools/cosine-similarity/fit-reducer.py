@@ -0,0 +1,71 @@
+import argparse
+import os
+import numpy as np
+from embedding_store import BLOCK_ROWS, EmbeddingStore
+from reduction import DIM, FIT_ROWS, METHODS, REDUCER_ROOT, SEED, fit_reducer
+
+TECHNIQUE_EMBEDDINGS_FILE = 'technique_embeddings.npy'
+SYNTHETIC_EMBEDDINGS_FILE = 'synthetic_embeddings.npy'
+
+def load_samples(npy_files, store_dirs, fit_rows=FIT_ROWS):
+    """
+    Stacks the vectors of the .npy files with up to fit_rows rows taken evenly from each embedding store.
+    """
+    samples = [np.load(path, mmap_mode='r').astype(np.float32) for path in npy_files]
+    for store_dir in store_dirs:
+        store = EmbeddingStore(store_dir)
+        if store.reducer is not None:
+            raise ValueError(f"{store_dir} already holds reduced vectors; fit on a full-dimension store.")
+        # Every step-th row, read block by block so only the sample is held in memory
+        step = max(1, -(-len(store) // fit_rows))
+        samples += [store.vectors(start, start + BLOCK_ROWS)[(-start) % step::step] for start in range(0, len(store), BLOCK_ROWS)]
+    samples = [sample for sample in samples if len(sample)]
+    if not samples:
+        raise ValueError("No vectors to fit on.")
+    if len({sample.shape[1] for sample in samples}) > 1:
+        raise ValueError("The inputs have different dimensions.")
+    return np.vstack(samples)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit a reducer that maps encoder vectors to fewer dimensions: PCA on the technique and "
+                    "synthetic embeddings, or a fit-free sparse random projection. Pass it to bulk-embed.py or "
+                    "cosine-similarity.py with --reducer."
+    )
+    parser.add_argument('--method', choices=METHODS, default='pca',
+                        help="Reduction method (default: pca).")
+    parser.add_argument('--dim', type=int, default=DIM,
+                        help=f"Number of dimensions kept (default: {DIM}).")
+    parser.add_argument('--center', action='store_true',
+                        help="Center the vectors before PCA. Removes the direction all embeddings share, which "
+                             "changes the score scale, so thresholds must be chosen again.")
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help=f"Seed of the random projection (default: {SEED}).")
+    parser.add_argument('--npy', type=str, action='append',
+                        help=f"Optional: Embeddings (.npy) to fit on. Repeat to add several (default: {TECHNIQUE_EMBEDDINGS_FILE} "
+                             f"and {SYNTHETIC_EMBEDDINGS_FILE} unless --store is given).")
+    parser.add_argument('--store', type=str, action='append', default=[],
+                        help=f"Optional: Embedding store to fit on, sampling up to {FIT_ROWS} rows. Repeat to add several.")
+    parser.add_argument('-o', '--output', type=str,
+                        help=f"Reducer file (default: {os.path.join(REDUCER_ROOT, '<method>-<dim>.npz')}).")
+    args = parser.parse_args()
+    if args.dim < 1:
+        parser.error("--dim must be positive")
+    if args.center and args.method != 'pca':
+        parser.error("--center only applies to --method pca")
+
+    npy_files = args.npy if args.npy is not None else ([] if args.store else [TECHNIQUE_EMBEDDINGS_FILE, SYNTHETIC_EMBEDDINGS_FILE])
+    try:
+        samples = load_samples(npy_files, args.store)
+        reducer = fit_reducer(args.method, samples, args.dim, args.seed, args.center)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    output = args.output or os.path.join(REDUCER_ROOT, f"{reducer.label}-{reducer.dim}.npz")
+    reducer.save(output)
+    kept = f", keeping {reducer.explained_variance:.1%} of the fitted vectors' energy" if reducer.explained_variance is not None else ""
+    print(f"Fitted a {reducer.label} reducer on {len(samples)} vectors: {reducer.source_dim} -> {reducer.dim} dimensions{kept}. "
+          f"Saved to {output}")
+
+if __name__ == "__main__":
+    main()
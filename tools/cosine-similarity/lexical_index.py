@@ -0,0 +1,242 @@
+import collections
+import json
+import os
+import re
+import sys
+import numpy as np
+from scoring import CHUNK_SIZE, TOP_K, reduce_embeddings, top_k_rows
+
+# The shared database and tracing layers live in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect, retired_techniques, table_columns
+from mitre_tc.tracing import span
+
+# scipy.sparse is imported inside the functions that use it, so --help stays fast.
+
+INDEX_DIR = os.path.join('data', 'lexical-index')
+META_FILE = 'meta.json'
+WEIGHTS_FILE = 'weights.npz'
+K1 = 1.2 # BM25 term frequency saturation
+B = 0.75 # BM25 document length normalization
+NAME_WEIGHT = 3 # Times a technique's name is counted, so its words outweigh the same words in running text
+SHORTLIST = 50 # Lexical candidates per query that are scored densely
+ALPHA = 0.7 # Weight of the dense score in the fused score; the rest goes to the normalized BM25 score
+GATHER_ROWS = 128 # Queries whose candidate vectors are gathered at once (rows x shortlist x dim floats)
+# Gathering candidate vectors costs about as much per score as GEMM over GATHER_RATIO times more techniques, so
+# shortlists longer than techniques / GATHER_RATIO are scored by one product over all techniques instead
+GATHER_RATIO = 64
+DENSE_WEIGHTS_BYTES = 256 * 1024 * 1024 # Term matrices up to this size are kept dense for the BM25 product
+# Lowercased words, keeping dotted, dashed and underscored names such as cmd.exe, t1059.001 or mimikatz_x64 whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+STOP_WORDS = frozenset("""
+a about after all also an and any are as at be been before being between both but by can could did do does
+during each either for from had has have having he her his how however i if in into is it its may might more
+most must no not of on once only or other our out over own same she should so some such than that the their
+them then there these they this those through to too under until up use used uses using very was we were what
+when where which while who will with within without would you your
+""".split())
+SOURCES = {
+    # name: query returning (technique_id, name, text) rows; a name is counted NAME_WEIGHT times.
+    # {active} is replaced by the condition selecting techniques that are not revoked or deprecated
+    'techniques': "SELECT technique_id, name, description FROM mitre_technique_descriptions WHERE {active}",
+    'variants': "SELECT technique_id, NULL, text FROM synthetic_texts",
+    'synthetic': "SELECT technique_id, NULL, text FROM synthetic_texts_test",
+    'articles': "SELECT a.technique_id, NULL, t.text FROM cited_articles a JOIN cited_article_texts t USING (content_sha256)",
+}
+DEFAULT_SOURCES = ('techniques', 'variants')
+
+def tokenize(text):
+    """
+    Splits text into lowercased terms without stop words or single characters.
+    """
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if len(token) > 1 and token not in STOP_WORDS]
+
+def iter_source_documents(db_file, sources):
+    """
+    Streams (technique_id, name, text) rows of the given sources, skipping sources whose tables do not exist and
+    rows labelled with a revoked or deprecated technique.
+    """
+    db = connect(db_file)
+    try:
+        retired = retired_techniques(db)
+        for source in sources:
+            tables = re.findall(r"(?:FROM|JOIN) (\w+)", SOURCES[source])
+            if not all(table_columns(db, table) for table in tables):
+                print(f"Skipping {source}: table(s) {', '.join(tables)} not found")
+                continue
+            for row in db.execute(SOURCES[source].format(active=active_techniques(db))):
+                if row[0] not in retired:
+                    yield row
+    finally:
+        db.close()
+
+class LexicalIndex:
+    """
+    BM25 index with one document per technique: its name, description and augmented texts together.
+    The term weights are kept as a sparse (techniques x terms) matrix, so scoring a batch of queries is one
+    sparse matrix product whose cost grows with the query terms rather than with the corpus.
+    """
+
+    def __init__(self, technique_ids, vocabulary, weights, meta=None):
+        self.technique_ids = list(technique_ids)
+        self.vocabulary = vocabulary
+        self.weights = weights.tocsr()
+        self.meta = meta or {}
+        self._columns = {}
+
+    @classmethod
+    def build(cls, documents, k1=K1, b=B, name_weight=NAME_WEIGHT, technique_ids=None):
+        """
+        Builds the index from (technique_id, name, text) rows. Rows of techniques outside technique_ids are
+        skipped when it is given.
+        """
+        import scipy.sparse as sp
+        allowed = set(technique_ids) if technique_ids is not None else None
+        counts = collections.defaultdict(collections.Counter)
+        for technique_id, name, text in documents:
+            if not technique_id or (allowed is not None and technique_id not in allowed):
+                continue
+            counts[technique_id].update(tokenize(text))
+            for _ in range(name_weight if name else 0):
+                counts[technique_id].update(tokenize(name))
+
+        ids = sorted(counts)
+        vocabulary = {}
+        rows, columns, values = [], [], []
+        for row, technique_id in enumerate(ids):
+            for term, count in counts[technique_id].items():
+                rows.append(row)
+                columns.append(vocabulary.setdefault(term, len(vocabulary)))
+                values.append(count)
+        tf = sp.csr_matrix((np.array(values, dtype=np.float32), (rows, columns)), shape=(len(ids), len(vocabulary)))
+
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        document_frequency = np.bincount(tf.indices, minlength=len(vocabulary))
+        idf = np.log1p((len(ids) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0)) if len(ids) else lengths
+        # Saturated term frequency per stored entry: tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+        row_norm = np.repeat(norm, np.diff(tf.indptr)).astype(np.float32)
+        tf.data = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + row_norm)
+        meta = {'k1': k1, 'b': b, 'name_weight': name_weight, 'documents': len(ids), 'terms': len(vocabulary)}
+        return cls(ids, vocabulary, tf, meta)
+
+    def transform(self, texts):
+        """
+        Returns a sparse (texts x terms) matrix with 1 for every indexed term a text contains.
+        """
+        import scipy.sparse as sp
+        vocabulary = self.vocabulary
+        terms = vocabulary.keys()
+        indptr, indices = [0], []
+        for text in texts:
+            # Stop words and single characters are never in the vocabulary, so intersecting with it filters them
+            indices.extend(map(vocabulary.__getitem__, terms & TOKEN_PATTERN.findall((text or '').lower())))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        return sp.csr_matrix((data, np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                             shape=(len(texts), len(self.vocabulary)))
+
+    def _term_matrix(self, technique_ids):
+        # (terms x techniques) weights with columns in the order of technique_ids; unindexed techniques score 0.
+        # Returns (sparse matrix, dense copy or None when larger than DENSE_WEIGHTS_BYTES)
+        key = tuple(technique_ids) if technique_ids is not None else None
+        if key not in self._columns:
+            import scipy.sparse as sp
+            matrix = self.weights.T.tocsr()
+            if technique_ids is not None:
+                position = {technique_id: column for column, technique_id in enumerate(self.technique_ids)}
+                padded = sp.hstack([matrix, sp.csr_matrix((matrix.shape[0], 1), dtype=np.float32)]).tocsc()
+                columns = [position.get(technique_id, len(self.technique_ids)) for technique_id in technique_ids]
+                matrix = padded[:, columns].tocsr()
+            dense = matrix.toarray() if matrix.shape[0] * matrix.shape[1] * 4 <= DENSE_WEIGHTS_BYTES else None
+            self._columns = {key: (matrix, dense)}
+        return self._columns[key]
+
+    def scores(self, texts, technique_ids=None):
+        """
+        Returns the dense (texts x techniques) BM25 scores, with columns in the order of technique_ids if
+        given, else of self.technique_ids.
+        Technique documents are long, so nearly every technique shares some term with a text and the scores are
+        dense anyway; multiplying the sparse queries by dense weights (only the rows of the terms the texts
+        contain, for large vocabularies) avoids a sparse-sparse product that would be several times slower.
+        """
+        queries = self.transform(texts)
+        matrix, dense = self._term_matrix(technique_ids)
+        if dense is None:
+            terms = np.unique(queries.indices)
+            queries, dense = queries[:, terms], matrix[terms].toarray()
+        return np.asarray(queries @ dense, dtype=np.float32)
+
+    def save(self, path):
+        import scipy.sparse as sp
+        os.makedirs(path, exist_ok=True)
+        sp.save_npz(os.path.join(path, WEIGHTS_FILE), self.weights)
+        meta = dict(self.meta, technique_ids=self.technique_ids, vocabulary=self.vocabulary)
+        tmp_meta = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, os.path.join(path, META_FILE))
+
+    @classmethod
+    def load(cls, path):
+        import scipy.sparse as sp
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        technique_ids = meta.pop('technique_ids')
+        vocabulary = meta.pop('vocabulary')
+        return cls(technique_ids, vocabulary, sp.load_npz(os.path.join(path, WEIGHTS_FILE)), meta)
+
+def iter_hybrid_top_k(index, technique_ids, technique_matrix, texts, query_embeddings, k=TOP_K, chunk_size=CHUNK_SIZE,
+                      shortlist=SHORTLIST, alpha=ALPHA, stats=None, reducer=None):
+    """
+    Classifies texts in two stages: BM25 picks the shortlist best techniques per text, and only those are
+    scored against the text's embedding. The fused score is alpha * cosine + (1 - alpha) * BM25 / the text's
+    best BM25 score. Texts sharing no term with any technique are shortlisted and scored by cosine alone, so
+    their scores stay on the plain cosine scale instead of being scaled down by alpha.
+    technique_matrix is pre-normalized with rows in the order of technique_ids. With a reducer, the cosine scores
+    are computed in its reduced space.
+    The shortlist's cosine scores are gathered from candidate vectors only when it is far smaller than the
+    technique count (see GATHER_RATIO); otherwise one matrix product over all techniques is cheaper.
+    Yields (start_row, top technique indices, top fused scores) per chunk like scoring.iter_top_k.
+    """
+    count = len(technique_ids)
+    shortlist = min(shortlist, count)
+    k = min(k, shortlist)
+    gather = shortlist * GATHER_RATIO < count
+    if reducer is not None:
+        technique_matrix = reduce_embeddings(technique_matrix, reducer)
+    for start in range(0, len(texts), chunk_size):
+        with span('score.lexical') as current:
+            lexical = index.scores(texts[start:start + chunk_size], technique_ids)
+            current.add(items=lexical.shape[0])
+        chunk = reduce_embeddings(query_embeddings[start:start + lexical.shape[0]], reducer)
+        best_lexical = lexical.max(axis=1)
+        candidates = np.argpartition(-lexical, shortlist - 1, axis=1)[:, :shortlist]
+        no_match = np.flatnonzero(best_lexical <= 0)
+
+        with span('score.dense_shortlist') as current:
+            if gather:
+                if no_match.size:
+                    candidates[no_match] = np.argpartition(-(chunk[no_match] @ technique_matrix.T), shortlist - 1, axis=1)[:, :shortlist]
+                dense = np.empty(candidates.shape, dtype=np.float32)
+                for row in range(0, len(chunk), GATHER_ROWS):
+                    rows = slice(row, row + GATHER_ROWS)
+                    dense[rows] = np.einsum('qd,qmd->qm', chunk[rows], technique_matrix[candidates[rows]])
+            else:
+                cosine = chunk @ technique_matrix.T
+                if no_match.size:
+                    candidates[no_match] = np.argpartition(-cosine[no_match], shortlist - 1, axis=1)[:, :shortlist]
+                dense = np.take_along_axis(cosine, candidates, axis=1)
+            current.add(items=len(chunk))
+        lexical = np.take_along_axis(lexical, candidates, axis=1) / np.where(best_lexical > 0, best_lexical, 1.0)[:, None]
+        fused = alpha * dense + (1 - alpha) * lexical.astype(np.float32)
+        fused[no_match] = dense[no_match]
+
+        top, top_scores = top_k_rows(fused, k)
+        if stats is not None:
+            stats['texts'] = stats.get('texts', 0) + len(chunk)
+            stats['dense_scores'] = stats.get('dense_scores', 0) + (candidates.size + no_match.size * count if gather
+                                                                    else len(chunk) * count)
+            stats['no_match'] = stats.get('no_match', 0) + no_match.size
+        yield start, np.take_along_axis(candidates, top, axis=1), top_scores
@@ -0,0 +1,266 @@
+import fnmatch
+import json
+import os
+import sys
+import uuid
+import numpy as np
+from scoring import CHUNK_SIZE, TOP_K, normalize_embeddings, top_k_rows
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect, retired_techniques, table_columns
+
+INDEX_ROOT = os.path.join('data', 'prototype-index')
+META_FILE = 'meta.json'
+ARRAYS_FILE = 'arrays.npz' # Name used by indexes saved before arrays files carried a generation
+GENERATION_ARRAYS_FILE = 'arrays-{}.npz'
+INDEX_FORMAT = 1 # Bumped when the saved layout changes; older indexes must be rebuilt
+MODES = ('centroid', 'style', 'kmedoids')
+MEDOIDS = 3 # Prototypes per technique in kmedoids mode
+MEDOID_ITERATIONS = 20
+READ_ROWS = 8192 # Rows read from the database and encoded at a time
+SOURCES = {
+    # name: (table, text column, whether the table has technicality/style columns)
+    'techniques': ('mitre_technique_descriptions', 'description', False),
+    'variants': ('synthetic_texts', 'text', True),
+    'synthetic': ('synthetic_texts_test', 'text', True),
+}
+DEFAULT_SOURCES = ('techniques', 'variants')
+
+def iter_source_rows(db_file, source, after_rowid=0, read_rows=READ_ROWS):
+    """
+    Streams (rowids, technique_ids, groups, texts) chunks of a source's rows with rowid greater than after_rowid.
+    The group of a row is 'description' for technique descriptions, '<technicality>/<style>' for synthetic
+    texts with a variant and 'unlabelled' for synthetic texts from batches that carried none.
+    Rows of revoked or deprecated techniques are left out.
+    """
+    table, column, has_variant = SOURCES[source]
+    db = connect(db_file)
+    try:
+        if has_variant:
+            has_variant = {'technicality', 'style'} <= table_columns(db, table)
+        variant = "technicality, style" if has_variant else "NULL, NULL"
+        # Revoked and deprecated techniques are no classification targets
+        active = f" AND {active_techniques(db)}" if source == 'techniques' else ""
+        retired = retired_techniques(db)
+        cursor = db.execute(f"SELECT rowid, technique_id, {variant}, {column} FROM {table} "
+                            f"WHERE rowid > ? AND technique_id IS NOT NULL{active} ORDER BY rowid", (after_rowid,))
+        while True:
+            rows = cursor.fetchmany(read_rows)
+            if not rows:
+                return
+            rows = [row for row in rows if row[1] not in retired]
+            if not rows:
+                continue
+            groups = ['description' if source == 'techniques' else
+                      f"{technicality}/{style}" if technicality and style else 'unlabelled'
+                      for _, _, technicality, style, _ in rows]
+            yield ([row[0] for row in rows], [row[1] for row in rows], groups, [row[4] or '' for row in rows])
+    finally:
+        db.close()
+
+def select_medoids(vectors, count=MEDOIDS, iterations=MEDOID_ITERATIONS):
+    """
+    Picks up to count medoids among unit vectors by alternating assignment and medoid updates, starting from the
+    most central vector and then repeatedly the vector least similar to the medoids chosen so far.
+    Deterministic for the same input. Returns the row indices of the medoids.
+    """
+    if len(vectors) <= count:
+        return np.arange(len(vectors))
+    similarity = vectors @ vectors.T
+    medoids = [int(np.argmax(similarity.sum(axis=1)))]
+    while len(medoids) < count:
+        medoids.append(int(np.argmin(similarity[:, medoids].max(axis=1))))
+    medoids = np.array(medoids)
+    for _ in range(iterations):
+        assignment = np.argmax(similarity[:, medoids], axis=1)
+        updated = medoids.copy()
+        for cluster in range(len(medoids)):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members):
+                updated[cluster] = members[np.argmax(similarity[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return medoids
+
+class PrototypeIndex:
+    """
+    A few prototype vectors per technique built from its description and synthetic texts, so a query is scored
+    against techniques x prototypes vectors instead of every augmented sample.
+    centroid keeps one mean direction per technique, style one per description/variant group, and kmedoids up
+    to `medoids` actual member vectors per technique. Centroid and style modes keep running sums, so new rows
+    are added in O(new rows); kmedoids keeps the member vectors and re-selects medoids only for the techniques
+    that gained rows.
+    A technique's score for a query is the best score among its prototypes.
+    """
+
+    def __init__(self, mode='centroid', encoder=None, medoids=MEDOIDS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown prototype mode '{mode}'. Choose one of {', '.join(MODES)}.")
+        self.mode = mode
+        self.encoder = encoder
+        self.medoids = medoids
+        self.last_rowids = {} # source -> rowid of the last row added
+        self.technique_ids = []
+        self._technique_index = {}
+        self.groups = [] # (technique index, group) per running sum, centroid and style modes
+        self._group_index = {}
+        self.sums = None
+        self.counts = np.empty(0, dtype=np.int64)
+        self.members = None # Member vectors and their technique indexes, kmedoids mode
+        self.member_techniques = np.empty(0, dtype=np.int64)
+        self.medoid_rows = {} # technique index -> member rows of its medoids
+        self._dirty = set()
+        self._prototypes = None
+
+    def _technique(self, technique_id):
+        if technique_id not in self._technique_index:
+            self._technique_index[technique_id] = len(self.technique_ids)
+            self.technique_ids.append(technique_id)
+        return self._technique_index[technique_id]
+
+    def add(self, technique_ids, groups, vectors):
+        """
+        Adds labelled vectors to the index; prototypes are recomputed on the next score or save.
+        """
+        vectors = normalize_embeddings(vectors)
+        techniques = np.array([self._technique(technique_id) for technique_id in technique_ids], dtype=np.int64)
+        self._prototypes = None
+        if self.mode == 'kmedoids':
+            self.members = vectors if self.members is None else np.vstack([self.members, vectors])
+            self.member_techniques = np.concatenate([self.member_techniques, techniques])
+            self._dirty.update(techniques.tolist())
+            return
+
+        keys = [(technique, group if self.mode == 'style' else 'centroid') for technique, group in zip(techniques.tolist(), groups)]
+        for key in keys:
+            if key not in self._group_index:
+                self._group_index[key] = len(self.groups)
+                self.groups.append(key)
+        if self.sums is None:
+            self.sums = np.zeros((0, vectors.shape[1]), dtype=np.float64)
+        if len(self.groups) > len(self.sums):
+            grow = len(self.groups) - len(self.sums)
+            self.sums = np.vstack([self.sums, np.zeros((grow, vectors.shape[1]), dtype=np.float64)])
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int64)])
+        rows = np.array([self._group_index[key] for key in keys], dtype=np.int64)
+        np.add.at(self.sums, rows, vectors)
+        np.add.at(self.counts, rows, 1)
+
+    def _refresh(self):
+        # Builds the prototype matrix ordered by technique, with the first prototype row of every technique
+        if self._prototypes is not None:
+            return
+        if self.mode == 'kmedoids':
+            for technique in sorted(self._dirty):
+                rows = np.flatnonzero(self.member_techniques == technique)
+                self.medoid_rows[technique] = rows[select_medoids(self.members[rows], self.medoids)]
+            self._dirty.clear()
+            owners = [technique for technique in range(len(self.technique_ids)) for _ in self.medoid_rows.get(technique, ())]
+            rows = [row for technique in range(len(self.technique_ids)) for row in self.medoid_rows.get(technique, ())]
+            vectors = self.members[np.array(rows, dtype=np.int64)] if rows else np.empty((0, 0), dtype=np.float32)
+        else:
+            owners = [technique for technique, _ in self.groups]
+            vectors = normalize_embeddings(self.sums) if self.sums is not None else np.empty((0, 0), dtype=np.float32)
+        owners = np.array(owners, dtype=np.int64)
+        order = np.argsort(owners, kind='stable')
+        self._prototypes = np.ascontiguousarray(vectors[order], dtype=np.float32)
+        self._owners = owners[order]
+        self._starts = np.flatnonzero(np.r_[True, self._owners[1:] != self._owners[:-1]]) if len(owners) else owners
+
+    @property
+    def prototypes(self):
+        """
+        Returns the (prototypes x dim) matrix scored against, ordered by technique.
+        """
+        self._refresh()
+        return self._prototypes
+
+    def __len__(self):
+        return len(self.prototypes)
+
+    def iter_top_k(self, query_embeddings, k=TOP_K, chunk_size=CHUNK_SIZE):
+        """
+        Scores query embeddings against the prototypes in fixed-size chunks and keeps each technique's best
+        prototype score. Yields (start_row, top technique indices, top scores) per chunk like scoring.iter_top_k;
+        the indices point into technique_ids.
+        """
+        self._refresh()
+        k = min(k, len(self.technique_ids))
+        for start in range(0, query_embeddings.shape[0], chunk_size):
+            chunk = normalize_embeddings(query_embeddings[start:start + chunk_size])
+            scores = np.maximum.reduceat(chunk @ self._prototypes.T, self._starts, axis=1)
+            yield (start,) + top_k_rows(scores, k)
+
+    def save(self, path):
+        """
+        Writes the index to a directory: meta.json plus the running sums or member vectors in an arrays file
+        named after a fresh generation id. meta.json names its arrays file and is replaced last, so until then
+        it still points at the old arrays, which are only removed afterwards: an interrupted save keeps the old index.
+        """
+        self._refresh()
+        os.makedirs(path, exist_ok=True)
+        arrays = {'counts': self.counts, 'member_techniques': self.member_techniques,
+                  'sums': self.sums if self.sums is not None else np.empty((0, 0)),
+                  'members': self.members if self.members is not None else np.empty((0, 0), dtype=np.float32)}
+        techniques = sorted(self.medoid_rows)
+        arrays['medoid_techniques'] = np.array(techniques, dtype=np.int64)
+        arrays['medoid_counts'] = np.array([len(self.medoid_rows[technique]) for technique in techniques], dtype=np.int64)
+        arrays['medoid_rows'] = np.concatenate([self.medoid_rows[technique] for technique in techniques]) if techniques else np.empty(0, dtype=np.int64)
+        arrays_file = GENERATION_ARRAYS_FILE.format(uuid.uuid4().hex)
+        np.savez(os.path.join(path, arrays_file), **arrays)
+        meta = {
+            'format': INDEX_FORMAT,
+            'mode': self.mode,
+            'medoids': self.medoids if self.mode == 'kmedoids' else None,
+            'encoder': self.encoder,
+            'last_rowids': self.last_rowids,
+            'technique_ids': self.technique_ids,
+            'groups': [[technique, group] for technique, group in self.groups],
+            'prototypes': len(self._prototypes),
+            'arrays': arrays_file,
+        }
+        tmp_meta = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, os.path.join(path, META_FILE))
+        for name in os.listdir(path):
+            if name != arrays_file and (name == ARRAYS_FILE or fnmatch.fnmatch(name, GENERATION_ARRAYS_FILE.format('*'))):
+                os.remove(os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != INDEX_FORMAT:
+            raise ValueError(f"{path} has index format {meta.get('format')}, expected {INDEX_FORMAT}; rebuild it.")
+        index = cls(meta['mode'], meta['encoder'], meta['medoids'] or MEDOIDS)
+        index.last_rowids = meta['last_rowids']
+        for technique_id in meta['technique_ids']:
+            index._technique(technique_id)
+        index.groups = [(technique, group) for technique, group in meta['groups']]
+        index._group_index = {key: row for row, key in enumerate(index.groups)}
+        with np.load(os.path.join(path, meta.get('arrays', ARRAYS_FILE))) as arrays:
+            index.counts = arrays['counts']
+            index.member_techniques = arrays['member_techniques']
+            index.sums = arrays['sums'] if index.groups else None
+            index.members = arrays['members'] if len(index.member_techniques) else None
+            rows = np.split(arrays['medoid_rows'], np.cumsum(arrays['medoid_counts'])[:-1]) if len(arrays['medoid_counts']) else []
+            index.medoid_rows = dict(zip(arrays['medoid_techniques'].tolist(), rows))
+        return index
+
+def update_index(index, db_file, sources, encode, read_rows=READ_ROWS):
+    """
+    Adds the rows each source gained since the index last read it; encode(texts) returns their embeddings.
+    Returns source -> number of rows added.
+    """
+    added = {}
+    for source in sources:
+        added[source] = 0
+        for rowids, technique_ids, groups, texts in iter_source_rows(db_file, source, index.last_rowids.get(source, 0), read_rows):
+            index.add(technique_ids, groups, encode(texts))
+            index.last_rowids[source] = rowids[-1]
+            added[source] += len(rowids)
+    return added
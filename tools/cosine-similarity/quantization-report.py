@@ -0,0 +1,71 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from embedding_store import EmbeddingStore, LAYOUTS
+
+TECHNIQUE_EMBEDDINGS_FILE = 'technique_embeddings.npy'
+SYNTHETIC_EMBEDDINGS_FILE = 'synthetic_embeddings.npy'
+
+def top_k_indices(scores, k):
+    """
+    Returns the indices of the k highest scores per row, best first.
+    """
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+def score_layout(store_dir, layout, corpus, technique_matrix):
+    """
+    Writes the corpus into a store with the given layout and scores it against the techniques.
+    Returns (scores, store size in bytes, seconds spent scoring).
+    """
+    store = EmbeddingStore.create(os.path.join(store_dir, layout), corpus.shape[1], layout)
+    store.append(corpus)
+    start = time.perf_counter()
+    scores = np.vstack([block for _, block in store.iter_scores(technique_matrix)])
+    return scores, store.nbytes(), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report how much top-1/top-5 agreement each embedding store layout loses against float32."
+    )
+    parser.add_argument('--techniques', type=str, default=TECHNIQUE_EMBEDDINGS_FILE,
+                        help=f"Technique embeddings (.npy) scored against (default: {TECHNIQUE_EMBEDDINGS_FILE}).")
+    parser.add_argument('--corpus', type=str, default=SYNTHETIC_EMBEDDINGS_FILE,
+                        help=f"Corpus embeddings (.npy) written into each store layout (default: {SYNTHETIC_EMBEDDINGS_FILE}).")
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help="Size of the top-k set compared between layouts (default: 5).")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    technique_matrix = np.load(args.techniques).astype(np.float32)
+    technique_matrix /= np.linalg.norm(technique_matrix, axis=1, keepdims=True)
+    corpus = np.load(args.corpus, mmap_mode='r')
+    k = min(args.top_k, technique_matrix.shape[0])
+
+    store_dir = tempfile.mkdtemp(prefix='embedding-store-')
+    try:
+        results = {layout: score_layout(store_dir, layout, corpus, technique_matrix) for layout in LAYOUTS}
+    finally:
+        shutil.rmtree(store_dir)
+
+    reference_scores = results['float32'][0]
+    reference_top = top_k_indices(reference_scores, k)
+
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} scored against {technique_matrix.shape[0]} techniques\n")
+    print(f"{'layout':<8} {'bytes/vec':>10} {'MB':>8} {'top-1 agree':>12} {f'top-{k} overlap':>14} {'max |Δscore|':>13} {'vec/s':>12}")
+    for layout, (scores, nbytes, seconds) in results.items():
+        top = top_k_indices(scores, k)
+        top1_agreement = np.mean(top[:, 0] == reference_top[:, 0])
+        # Fraction of the float32 top-k set that the layout also ranks in its top-k
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+        max_error = np.abs(scores - reference_scores).max()
+        rate = corpus.shape[0] / seconds if seconds > 0 else float('inf')
+        print(f"{layout:<8} {nbytes / corpus.shape[0]:>10.1f} {nbytes / 1e6:>8.2f} {top1_agreement:>12.4f} {overlap:>14.4f} {max_error:>13.5f} {rate:>12.0f}")
+
+if __name__ == "__main__":
+    main()
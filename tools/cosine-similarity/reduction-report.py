@@ -0,0 +1,132 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from embedding_store import EmbeddingStore
+from reduction import SEED, Reducer
+from scoring import top_k_rows
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect
+
+TECHNIQUE_EMBEDDINGS_FILE = 'technique_embeddings.npy'
+SYNTHETIC_EMBEDDINGS_FILE = 'synthetic_embeddings.npy'
+DIMS = (32, 64, 96, 128, 192, 256)
+REDUCERS = ('pca', 'pca-centered', 'random')
+REPEATS = 5 # Scoring runs per setting; the fastest is reported
+
+def load_gold(db_file, technique_count, corpus_count):
+    """
+    Returns (technique IDs, gold technique ID per corpus row) read in the row order the fixtures were encoded
+    in, or raises ValueError if the database does not match the fixtures' row counts.
+    """
+    db = connect(db_file)
+    try:
+        technique_ids = [row[0] for row in
+                         db.execute(f'SELECT technique_id FROM mitre_technique_descriptions WHERE {active_techniques(db)}')]
+        gold = [row[0] for row in db.execute('SELECT technique_id FROM synthetic_texts_test')]
+    finally:
+        db.close()
+    if (len(technique_ids), len(gold)) != (technique_count, corpus_count):
+        raise ValueError(f"{db_file} holds {len(technique_ids)} techniques and {len(gold)} synthetic texts, "
+                         f"the fixtures {technique_count} and {corpus_count}.")
+    return np.array(technique_ids, dtype=object), np.array(gold, dtype=object)
+
+def score_reduced(store_dir, name, reducer, corpus, technique_matrix, repeats=REPEATS):
+    """
+    Writes the corpus into a store with the given reducer (None for full dimensions) and scores it against the
+    techniques, which the store reduces. Returns (scores, store size in bytes, fastest seconds spent scoring).
+    """
+    store = EmbeddingStore.create(os.path.join(store_dir, name), corpus.shape[1], 'float32', reducer)
+    store.append(corpus)
+    seconds = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scores = np.vstack([block for _, block in store.iter_scores(technique_matrix)])
+        seconds = min(seconds, time.perf_counter() - start)
+    return scores, store.nbytes(), seconds
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report how much top-1/top-k agreement with full-dimension scoring (and, with --db, accuracy "
+                    "against the gold techniques) each reducer keeps per dimension, with store size and scoring speed."
+    )
+    parser.add_argument('--techniques', type=str, default=TECHNIQUE_EMBEDDINGS_FILE,
+                        help=f"Technique embeddings (.npy) scored against (default: {TECHNIQUE_EMBEDDINGS_FILE}).")
+    parser.add_argument('--corpus', type=str, default=SYNTHETIC_EMBEDDINGS_FILE,
+                        help=f"Corpus embeddings (.npy) written into each reduced store (default: {SYNTHETIC_EMBEDDINGS_FILE}).")
+    parser.add_argument('--dims', type=int, nargs='+', default=list(DIMS),
+                        help=f"Dimensions to report (default: {' '.join(map(str, DIMS))}).")
+    parser.add_argument('--reducers', choices=REDUCERS, nargs='+', default=list(REDUCERS),
+                        help="Reducers to report; PCA is fitted on the techniques and the corpus (default: all).")
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help=f"Seed of the random projection (default: {SEED}).")
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help="Size of the top-k set compared with full dimensions (default: 5).")
+    parser.add_argument('--db', type=str,
+                        help="Optional: Database whose technique descriptions and synthetic_texts_test rows the fixtures "
+                             "were encoded from, to add top-1/top-k accuracy against the gold technique IDs.")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    technique_matrix = np.load(args.techniques).astype(np.float32)
+    technique_matrix /= np.linalg.norm(technique_matrix, axis=1, keepdims=True)
+    corpus = np.load(args.corpus, mmap_mode='r')
+    k = min(args.top_k, technique_matrix.shape[0])
+    gold = None
+    if args.db:
+        try:
+            technique_ids, gold = load_gold(args.db, technique_matrix.shape[0], corpus.shape[0])
+        except ValueError as e:
+            parser.error(str(e))
+
+    samples = np.vstack([technique_matrix, corpus])
+    settings = [('full', None)]
+    for dim in sorted(set(args.dims)):
+        if not 0 < dim < corpus.shape[1]:
+            parser.error(f"--dims must be between 1 and {corpus.shape[1] - 1}")
+        for name in args.reducers:
+            if name == 'random':
+                reducer = Reducer.random_projection(corpus.shape[1], dim, args.seed)
+            else:
+                reducer = Reducer.fit_pca(samples, dim, center=name == 'pca-centered')
+            settings.append((f"{name}-{dim}", reducer))
+
+    store_dir = tempfile.mkdtemp(prefix='reduced-store-')
+    try:
+        results = [(name, reducer) + score_reduced(store_dir, name, reducer, corpus, technique_matrix)
+                   for name, reducer in settings]
+    finally:
+        shutil.rmtree(store_dir)
+
+    reference_scores, _, reference_seconds = results[0][2:]
+    reference_top = top_k_rows(reference_scores, k)[0]
+
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} scored against {technique_matrix.shape[0]} techniques\n")
+    accuracy_header = f" {'top-1 acc':>10} {f'top-{k} acc':>10}" if gold is not None else ""
+    print(f"{'reducer':<17} {'dims':>5} {'kept':>6} {'bytes/vec':>10} {'top-1 agree':>12} {f'top-{k} overlap':>14} "
+          f"{'mean |Δscore|':>14}{accuracy_header} {'speedup':>8}")
+    for name, reducer, scores, nbytes, seconds in results:
+        top = top_k_rows(scores, k)[0]
+        top1_agreement = np.mean(top[:, 0] == reference_top[:, 0])
+        # Fraction of the full-dimension top-k set that the reduced scores also rank in their top-k
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+        mean_error = np.abs(scores - reference_scores).mean()
+        dims = reducer.dim if reducer is not None else corpus.shape[1]
+        kept = f"{reducer.explained_variance:.1%}" if reducer is not None and reducer.explained_variance is not None else ''
+        accuracy = ''
+        if gold is not None:
+            predicted = technique_ids[top]
+            accuracy = f" {np.mean(predicted[:, 0] == gold):>10.4f} {np.mean((predicted == gold[:, None]).any(axis=1)):>10.4f}"
+        speedup = reference_seconds / seconds if seconds > 0 else float('inf')
+        print(f"{name:<17} {dims:>5} {kept:>6} {nbytes / corpus.shape[0]:>10.1f} {top1_agreement:>12.4f} {overlap:>14.4f} "
+              f"{mean_error:>14.5f}{accuracy} {speedup:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import numpy as np
+
+METHODS = ('pca', 'random')
+DIM = 128 # Default number of dimensions kept
+SEED = 0 # Seed of the random projection, so the same dimension always gives the same projection
+REDUCER_ROOT = os.path.join('data', 'reducers')
+REDUCER_FILE = 'reducer.npz' # File name of a reducer saved in an embedding store directory
+FIT_ROWS = 100_000 # Rows sampled evenly from each embedding store a reducer is fitted on
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class Reducer:
+    """
+    Linear map from encoder vectors to fewer dimensions, applied to technique matrices and query batches alike
+    so that cosine scores are computed in the reduced space.
+    PCA keeps the directions that carry most of the vectors it was fitted on; the sparse random projection
+    (entries 0 or +-1 with density 1/sqrt(source dimensions)) needs no fitting and roughly preserves angles
+    between any vectors. The projection matrix is small (source dimensions x dimensions) and kept dense.
+    """
+
+    def __init__(self, method, components, mean, explained_variance=None):
+        self.method = method
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.explained_variance = explained_variance
+
+    @property
+    def source_dim(self):
+        return self.components.shape[0]
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    @property
+    def label(self):
+        return 'pca-centered' if self.method == 'pca' and self.mean.any() else self.method
+
+    @classmethod
+    def fit_pca(cls, samples, dim=DIM, center=False):
+        """
+        Fits PCA on unit-normalized samples (rows). Returns a Reducer keeping the dim leading components.
+        Uncentered, the components best preserve dot products, so reduced cosine scores track the full ones and
+        score thresholds keep their meaning. Centered, the direction shared by all embeddings is removed first,
+        which changes the score scale and can reorder matches.
+        """
+        samples = _normalize(samples)
+        dim = min(dim, samples.shape[1])
+        mean = samples.mean(axis=0) if center else np.zeros(samples.shape[1], dtype=np.float32)
+        # The (centered) second moment matrix is only source dimensions squared, so its eigendecomposition is
+        # cheap for any sample count
+        centered = (samples - mean).astype(np.float64)
+        moments = centered.T @ centered / max(len(samples), 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(moments)
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues, eigenvectors = np.clip(eigenvalues[order], 0, None), eigenvectors[:, order]
+        explained = float(eigenvalues[:dim].sum() / eigenvalues.sum()) if eigenvalues.sum() > 0 else 1.0
+        return cls('pca', eigenvectors[:, :dim], mean, explained)
+
+    @classmethod
+    def random_projection(cls, source_dim, dim=DIM, seed=SEED):
+        """
+        Returns a sparse random projection Reducer from source_dim to dim dimensions. Deterministic for a seed.
+        """
+        dim = min(dim, source_dim)
+        rng = np.random.default_rng(seed)
+        density = 1 / np.sqrt(source_dim)
+        signs = rng.choice(np.array([-1.0, 0.0, 1.0], dtype=np.float32), size=(source_dim, dim),
+                           p=[density / 2, 1 - density, density / 2])
+        return cls('random', signs / np.sqrt(density * dim), np.zeros(source_dim, dtype=np.float32))
+
+    def transform(self, vectors):
+        """
+        Normalizes vectors (rows) and maps them to the reduced space. The result is not normalized; scoring
+        normalizes it like any other embedding.
+        """
+        vectors = _normalize(vectors)
+        if vectors.shape[1] != self.source_dim:
+            raise ValueError(f"Reducer expects vectors of dimension {self.source_dim}, got {vectors.shape[1]}.")
+        return (vectors - self.mean) @ self.components
+
+    def fingerprint(self):
+        """
+        Returns a short hash identifying the projection, used to keep one embedding store on one reducer.
+        """
+        digest = hashlib.sha256(self.components.tobytes() + self.mean.tobytes()).hexdigest()[:16]
+        return f"{self.label}-{self.dim}-{digest}"
+
+    def save(self, path):
+        """
+        Saves the reducer to path, or to reducer.npz inside path when it is a directory.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, REDUCER_FILE)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # np.savez would append .npz to any other extension, so write through an open file
+        with open(path, 'wb') as f:
+            np.savez(f, method=np.array(self.method), components=self.components, mean=self.mean,
+                     explained_variance=np.array(np.nan if self.explained_variance is None else self.explained_variance))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a reducer saved by save(), from a file or from an embedding store directory holding reducer.npz.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, REDUCER_FILE)
+        if not os.path.exists(path):
+            raise ValueError(f"No reducer at {path}; fit one with fit-reducer.py or use a store written with --reducer.")
+        with np.load(path) as arrays:
+            method = str(arrays['method'])
+            if method not in METHODS:
+                raise ValueError(f"{path} holds an unknown reduction method '{method}'.")
+            explained = float(arrays['explained_variance'])
+            return cls(method, arrays['components'], arrays['mean'], None if np.isnan(explained) else explained)
+
+def fit_reducer(method, samples, dim=DIM, seed=SEED, center=False):
+    """
+    Fits a reducer of the given method on samples (rows of encoder vectors). The random projection only uses
+    the samples' dimension.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown reduction method '{method}'. Choose one of {', '.join(METHODS)}.")
+    if method == 'pca':
+        return Reducer.fit_pca(samples, dim, center)
+    return Reducer.random_projection(samples.shape[1], dim, seed)
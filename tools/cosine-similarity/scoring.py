@@ -0,0 +1,101 @@
+import csv
+import os
+import sys
+import numpy as np
+
+# The shared tracing layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.tracing import span
+
+TOP_K = 5 # Number of techniques kept per text in top-k mode
+CHUNK_SIZE = 1024 # Number of query texts scored per matrix product
+
+def normalize_embeddings(embeddings):
+    """
+    Converts embeddings (NumPy array or tensor) to float32 and scales each row to unit length.
+    Returns a NumPy array so that a plain dot product equals cosine similarity.
+    """
+    if hasattr(embeddings, 'cpu'):
+        embeddings = embeddings.cpu().numpy()
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+def reduce_embeddings(embeddings, reducer=None):
+    """
+    Normalizes embeddings like normalize_embeddings and, if a reduction.Reducer is given, maps them to its
+    reduced space and normalizes them again, so that dot products are cosine similarities in that space.
+    """
+    embeddings = normalize_embeddings(embeddings)
+    if reducer is not None:
+        embeddings = normalize_embeddings(reducer.transform(embeddings))
+    return embeddings
+
+def top_k_rows(scores, k):
+    """
+    Returns (top_indices, top_scores) holding the k highest scores of each row, best first.
+    Raises ValueError if k is below 1.
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}.")
+    k = min(k, scores.shape[1])
+    # argpartition finds the k best in linear time, then only those k are sorted
+    top_indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top_indices, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+def iter_top_k(technique_matrix, query_embeddings, k=TOP_K, chunk_size=CHUNK_SIZE, reducer=None):
+    """
+    Scores query embeddings against a pre-normalized technique matrix in fixed-size chunks.
+    Only one chunk_size x techniques score block is held in memory at a time. With a reducer, the technique
+    matrix and each query chunk are scored in its reduced space.
+    Yields (start_row, top_indices, top_scores) per chunk, best match first.
+    """
+    k = min(k, technique_matrix.shape[0])
+    if reducer is not None:
+        technique_matrix = reduce_embeddings(technique_matrix, reducer)
+    for start in range(0, query_embeddings.shape[0], chunk_size):
+        with span('score.chunk') as current:
+            chunk = reduce_embeddings(query_embeddings[start:start + chunk_size], reducer)
+            result = (start,) + top_k_rows(chunk @ technique_matrix.T, k)
+            current.add(items=len(chunk))
+        yield result
+
+def write_top_k(technique_ids, chunks, output_file, k, threshold, query_ids=None):
+    """
+    Writes (start_row, top_indices, top_scores) chunks to a CSV file as they arrive, marking rows whose
+    top-1 score reaches threshold as passed. query_index is the row position; with query_ids (e.g. source
+    rowids), a last row_id column holds query_ids[position].
+    Returns the number of rows written. Raises ValueError if k is below 1.
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}.")
+    technique_ids = np.asarray(technique_ids)
+    count = 0
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as f_out:
+        writer = csv.writer(f_out)
+        header = ['query_index', 'passed']
+        for rank in range(1, k + 1):
+            header += [f'technique_id_{rank}', f'score_{rank}']
+        if query_ids is not None:
+            header.append('row_id')
+        writer.writerow(header)
+
+        for start, top_indices, top_scores in chunks:
+            with span('score.write') as current:
+                top_ids = technique_ids[top_indices]
+                for row in range(top_indices.shape[0]):
+                    record = [start + row, int(top_scores[row, 0] >= threshold)]
+                    for rank in range(k):
+                        record += [top_ids[row, rank], f'{top_scores[row, rank]:.6f}']
+                    if query_ids is not None:
+                        record.append(int(query_ids[start + row]))
+                    writer.writerow(record)
+                count += top_indices.shape[0]
+                current.add(items=top_indices.shape[0])
+
+    return count
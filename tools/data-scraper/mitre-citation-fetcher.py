@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import codecs
+import gzip
+import hashlib
+import os
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema
+
+DATABASE_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+ARTICLE_STORE_DIR = os.path.join('data', 'article-store')
+MAX_CONNECTIONS = 64 # Global cap on open connections
+MAX_PER_HOST = 4 # Cap on concurrent connections to any single host
+MAX_ATTEMPTS = 3 # Failed URLs are retried on later runs until they reach this many attempts
+MAX_BODY_BYTES = 20 * 1024 * 1024
+REQUEST_TIMEOUT = 60 # Seconds per request, including the body download
+COMMIT_EVERY = 50 # Results written per transaction
+USER_AGENT = 'mitre-text-classification citation fetcher'
+
+# --- Database Interaction ---
+def open_fetch_db(db_file):
+    """
+    Opens the database and creates the fetch progress and article tables.
+    citation_fetches holds one row per URL (status and cache validators), cited_article_texts holds
+    extracted text once per distinct body, and cited_articles links each (url, technique) to it.
+    """
+    db = connect(db_file)
+    ensure_schema(db, ('mitre_technique_references', 'citation_fetches', 'cited_article_texts', 'cited_articles'))
+    return db
+
+def get_pending_urls(db, refresh=False, max_attempts=MAX_ATTEMPTS):
+    """
+    Returns (url, etag, last_modified) for every referenced URL that still needs fetching: never fetched,
+    failed fewer than max_attempts times, or, with refresh, previously fetched (re-validated conditionally).
+    """
+    rows = db.execute("""
+    SELECT DISTINCT r.url, f.etag, f.last_modified, f.status, f.attempts
+    FROM mitre_technique_references r
+    LEFT JOIN citation_fetches f ON f.url = r.url
+    WHERE r.url LIKE 'http%'
+    """)
+    pending = []
+    for url, etag, last_modified, status, attempts in rows:
+        if status is None and not attempts:
+            pending.append((url, None, None))
+        elif status in (200, 304):
+            if refresh:
+                pending.append((url, etag, last_modified))
+        elif (attempts or 0) < max_attempts:
+            pending.append((url, etag, last_modified))
+    return pending
+
+# --- Content Store ---
+def store_body(store_dir, body):
+    """
+    Writes a raw body gzip-compressed under its SHA-256 and returns the hash.
+    Identical bodies (syndicated copies, mirrored PDFs) are stored once.
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    path = os.path.join(store_dir, digest[:2], digest[2:4], digest + '.gz')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    return digest
+
+def load_body(store_dir, digest):
+    with gzip.open(os.path.join(store_dir, digest[:2], digest[2:4], digest + '.gz'), 'rb') as f:
+        return f.read()
+
+# --- Text Extraction ---
+class MainTextExtractor(HTMLParser):
+    """
+    Collects the visible text of an HTML page, skipping scripts, styles and page chrome
+    (navigation, headers, footers, forms) so that mostly the article body remains.
+    """
+    SKIP_TAGS = {'script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form', 'svg', 'template'}
+    BLOCK_TAGS = {'p', 'div', 'section', 'article', 'li', 'br', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.in_title = False
+        self.title = []
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == 'title':
+            self.in_title = True
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == 'title':
+            self.in_title = False
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title.append(data)
+        elif not self.skip_depth:
+            self.parts.append(data)
+
+    def result(self):
+        lines = (' '.join(line.split()) for line in ''.join(self.parts).split('\n'))
+        # Very short lines are mostly menus, buttons and share links
+        text = '\n'.join(line for line in lines if len(line) >= 40)
+        return ' '.join(''.join(self.title).split()), text
+
+def extract_text(body, content_type, charset=None):
+    """
+    Returns (title, text) for HTML and plain-text bodies, or (None, None) for other content types.
+    A charset Python does not know is read as UTF-8.
+    """
+    content_type = (content_type or '').lower()
+    if not (content_type.startswith('text/html') or content_type.startswith('application/xhtml') or content_type.startswith('text/plain')):
+        return None, None
+    try:
+        encoding = codecs.lookup(charset).name if charset else 'utf-8'
+    except LookupError:
+        encoding = 'utf-8'
+    decoded = body.decode(encoding, errors='replace')
+    if content_type.startswith('text/plain'):
+        return None, decoded.strip()
+    extractor = MainTextExtractor()
+    extractor.feed(decoded)
+    extractor.close()
+    return extractor.result()
+
+# --- Fetching ---
+async def fetch_url(session, url, etag, last_modified, max_body_bytes=MAX_BODY_BYTES):
+    """
+    Fetches one URL, sending cache validators when known.
+    Returns a dict with status, headers of interest and the body (None for 304 and errors).
+    """
+    import aiohttp
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    try:
+        async with session.get(url, headers=headers, allow_redirects=True) as response:
+            result = {
+                'status': response.status,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_type': response.headers.get('Content-Type'),
+                'charset': response.charset,
+                'body': None,
+                'error': None,
+            }
+            if response.status == 200:
+                body = await response.content.read(max_body_bytes + 1)
+                if len(body) > max_body_bytes:
+                    result['status'] = None
+                    result['error'] = f"body larger than {max_body_bytes} bytes"
+                else:
+                    result['body'] = body
+            return result
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeError, LookupError, ValueError) as e:
+        return {'status': None, 'error': f"{type(e).__name__}: {e}", 'etag': etag, 'last_modified': last_modified,
+                'content_type': None, 'charset': None, 'body': None}
+
+def store_article(store_dir, result):
+    """
+    Stores the body of a successful fetch and extracts its text.
+    Returns (content hash, title, text), or None when the fetch returned no body.
+    """
+    if result['body'] is None:
+        return None
+    digest = store_body(store_dir, result['body'])
+    return (digest,) + extract_text(result['body'], result['content_type'], result['charset'])
+
+def record_result(db, url, result, article):
+    """
+    Records the article returned by store_article, if any, and updates the URL's progress row.
+    """
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    digest = None
+    if article is not None:
+        digest, title, text = article
+        db.execute("INSERT OR IGNORE INTO cited_article_texts (content_sha256, title, text) VALUES (?, ?, ?)",
+                   (digest, title, text))
+        db.execute("""
+        INSERT INTO cited_articles (url, attack_pattern, technique_id, content_sha256)
+        SELECT url, attack_pattern, technique_id, ? FROM mitre_technique_references WHERE url = ?
+        ON CONFLICT(url, attack_pattern) DO UPDATE SET content_sha256 = excluded.content_sha256
+        """, (digest, url))
+
+    failed = result['status'] not in (200, 304)
+    db.execute("""
+    INSERT INTO citation_fetches (url, status, etag, last_modified, content_type, content_sha256, fetched_at, attempts, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        status = excluded.status,
+        etag = COALESCE(excluded.etag, citation_fetches.etag),
+        last_modified = COALESCE(excluded.last_modified, citation_fetches.last_modified),
+        content_type = COALESCE(excluded.content_type, citation_fetches.content_type),
+        content_sha256 = COALESCE(excluded.content_sha256, citation_fetches.content_sha256),
+        fetched_at = excluded.fetched_at,
+        attempts = CASE WHEN excluded.status IN (200, 304) THEN 0 ELSE citation_fetches.attempts + 1 END,
+        error = excluded.error
+    """, (url, result['status'], result['etag'], result['last_modified'], result['content_type'], digest, now,
+          int(failed), result['error'] or (f"HTTP {result['status']}" if failed else None)))
+
+class HostQueue:
+    """
+    Pending URLs kept in one deque per host and handed out round-robin across hosts, never more than
+    max_per_host at a time for one host. With a single FIFO queue, a run of URLs on one host would leave
+    every worker waiting for that host's connection slots while other hosts sit idle.
+    """
+
+    def __init__(self, pending, max_per_host=MAX_PER_HOST):
+        self.max_per_host = max_per_host
+        self.hosts = OrderedDict()
+        for item in pending:
+            self.hosts.setdefault(urlsplit(item[0]).netloc.lower(), deque()).append(item)
+        self.active = Counter()
+        self.changed = asyncio.Condition()
+
+    async def get(self):
+        """
+        Returns (host, item) for the next host with a free slot, waiting while every host with pending URLs
+        is at its cap, or None once no URLs are left.
+        """
+        async with self.changed:
+            while self.hosts:
+                for _ in range(len(self.hosts)):
+                    host, items = next(iter(self.hosts.items()))
+                    self.hosts.move_to_end(host)
+                    if self.active[host] < self.max_per_host:
+                        self.active[host] += 1
+                        item = items.popleft()
+                        if not items:
+                            del self.hosts[host]
+                        return host, item
+                await self.changed.wait()
+            return None
+
+    async def release(self, host):
+        async with self.changed:
+            self.active[host] -= 1
+            self.changed.notify_all()
+
+async def fetch_all(db, pending, store_dir=ARTICLE_STORE_DIR, max_connections=MAX_CONNECTIONS,
+                    max_per_host=MAX_PER_HOST, timeout=REQUEST_TIMEOUT):
+    """
+    Fetches every pending URL over one pooled keep-alive session. The connector enforces the global and
+    per-host connection caps, so the crawl is limited by bandwidth rather than by serial round-trips, and
+    URLs are interleaved by host so no single host holds up the workers.
+    Bodies are stored and their text extracted in the default executor, off the event loop.
+    Results are committed every COMMIT_EVERY URLs, which makes an interrupted crawl resumable.
+    Returns a dict of counts by outcome.
+    """
+    import aiohttp # Imported here so --help and argument errors do not load the HTTP stack
+    counts = {'fetched': 0, 'not_modified': 0, 'failed': 0}
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_per_host, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    queue = HostQueue(pending, max_per_host)
+    loop = asyncio.get_running_loop()
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers={'User-Agent': USER_AGENT}) as session:
+        done = 0
+
+        async def worker():
+            nonlocal done
+            while True:
+                next_item = await queue.get()
+                if next_item is None:
+                    return
+                host, (url, etag, last_modified) = next_item
+                try:
+                    result = await fetch_url(session, url, etag, last_modified)
+                finally:
+                    await queue.release(host)
+                try:
+                    article = await loop.run_in_executor(None, store_article, store_dir, result)
+                except Exception as e:
+                    # A body that cannot be stored or parsed counts as a failed attempt, so the crawl goes on
+                    # and the URL is retried on later runs until it reaches MAX_ATTEMPTS
+                    result = dict(result, status=None, body=None, error=f"{type(e).__name__}: {e}")
+                    article = None
+                # SQLite writes stay on the event loop thread, so the connection is never used concurrently
+                record_result(db, url, result, article)
+                if result['status'] == 200:
+                    counts['fetched'] += 1
+                elif result['status'] == 304:
+                    counts['not_modified'] += 1
+                else:
+                    counts['failed'] += 1
+                done += 1
+                if done % COMMIT_EVERY == 0:
+                    db.commit()
+                    print(f"Processed {done}/{len(pending)} URLs")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max_connections)))
+        finally:
+            db.commit()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch the articles cited by MITRE techniques and extract their text."
+    )
+    parser.add_argument('--db', type=str, default=DATABASE_FILE,
+                        help=f"SQLite database file (default: {DATABASE_FILE}).")
+    parser.add_argument('--store-dir', type=str, default=ARTICLE_STORE_DIR,
+                        help=f"Directory of the compressed, content-addressed body store (default: {ARTICLE_STORE_DIR}).")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help=f"Global connection cap (default: {MAX_CONNECTIONS}).")
+    parser.add_argument('--max-per-host', type=int, default=MAX_PER_HOST,
+                        help=f"Per-host connection cap (default: {MAX_PER_HOST}).")
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help=f"Seconds allowed per request (default: {REQUEST_TIMEOUT}).")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Re-validate already fetched URLs with ETag/Last-Modified and pick up changed articles.")
+    parser.add_argument('--limit', type=int,
+                        help="Optional: Fetch at most this many URLs in this run.")
+    args = parser.parse_args()
+
+    db = open_fetch_db(args.db)
+    try:
+        pending = get_pending_urls(db, args.refresh)
+        if args.limit:
+            pending = pending[:args.limit]
+        print(f"{len(pending)} URL(s) to fetch.")
+        start = time.perf_counter()
+        counts = asyncio.run(fetch_all(db, pending, args.store_dir, args.max_connections, args.max_per_host, args.timeout))
+    finally:
+        db.close()
+    print(f"Done in {time.perf_counter() - start:.1f}s: {counts['fetched']} fetched, "
+          f"{counts['not_modified']} not modified, {counts['failed']} failed.")
+
+if __name__ == "__main__":
+    main()
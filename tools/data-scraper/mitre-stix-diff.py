@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import json
+import os
+from stix_stream import iter_bundle_objects, technique_id_of, parse_bundle_name
+
+STIX_DIR = os.path.join('data', 'attack-stix-data-master')
+FINGERPRINT_CACHE_DIR = os.path.join('data', 'stix-fingerprints')
+FINGERPRINT_VERSION = 1 # Bump when the fingerprint fields change so cached files are rebuilt
+
+def fingerprint_bundle(bundle_file):
+    """
+    Streams a bundle and returns {stix_id: fingerprint} for every attack-pattern, where the fingerprint
+    keeps the technique ID, name, a hash of the description and the revoked/deprecated flags.
+    """
+    fingerprints = {}
+    for stix_object in iter_bundle_objects(bundle_file, types=('attack-pattern',)):
+        description = stix_object.get('description') or ''
+        fingerprints[stix_object['id']] = {
+            'technique_id': technique_id_of(stix_object),
+            'name': stix_object.get('name'),
+            'description_sha256': hashlib.sha256(description.encode('utf-8')).hexdigest(),
+            'modified': stix_object.get('modified'),
+            'revoked': bool(stix_object.get('revoked', False)),
+            'deprecated': bool(stix_object.get('x_mitre_deprecated', False)),
+        }
+    return fingerprints
+
+def load_fingerprints(bundle_file, cache_dir=FINGERPRINT_CACHE_DIR):
+    """
+    Returns the fingerprints of a bundle, reading them from the cache when the bundle's path, size and
+    mtime are unchanged and streaming the bundle (then caching the result) otherwise.
+    """
+    stat = os.stat(bundle_file)
+    key = f"{os.path.abspath(bundle_file)}|{stat.st_size}|{stat.st_mtime_ns}|{FINGERPRINT_VERSION}"
+    cache_file = os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.json')
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    fingerprints = fingerprint_bundle(bundle_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(fingerprints, f)
+    os.replace(tmp_file, cache_file)
+    return fingerprints
+
+def diff_fingerprints(old, new):
+    """
+    Compares two fingerprint maps by STIX ID.
+    Returns a dict of change lists: added, removed, revoked, deprecated, description_changed and renamed.
+    """
+    def entry(stix_id, fingerprint):
+        return {'id': stix_id, 'technique_id': fingerprint['technique_id'], 'name': fingerprint['name']}
+
+    changes = {key: [] for key in ('added', 'removed', 'revoked', 'deprecated', 'description_changed', 'renamed')}
+    for stix_id, fingerprint in new.items():
+        before = old.get(stix_id)
+        if before is None:
+            changes['added'].append(entry(stix_id, fingerprint))
+            continue
+        if fingerprint['revoked'] and not before['revoked']:
+            changes['revoked'].append(entry(stix_id, fingerprint))
+        elif fingerprint['deprecated'] and not before['deprecated']:
+            changes['deprecated'].append(entry(stix_id, fingerprint))
+        if fingerprint['description_sha256'] != before['description_sha256']:
+            changes['description_changed'].append(entry(stix_id, fingerprint))
+        if fingerprint['name'] != before['name']:
+            changes['renamed'].append(dict(entry(stix_id, fingerprint), previous_name=before['name']))
+    for stix_id, fingerprint in old.items():
+        if stix_id not in new:
+            changes['removed'].append(entry(stix_id, fingerprint))
+    for entries in changes.values():
+        entries.sort(key=lambda item: item['technique_id'] or '')
+    return changes
+
+def affected_technique_ids(changes):
+    """
+    Returns the technique IDs whose text must be re-embedded and whose synthetic data must be regenerated:
+    techniques that were added or had their description or name changed, unless they are now retired.
+    """
+    retired = {item['id'] for item in changes['revoked'] + changes['deprecated']}
+    return sorted({item['technique_id'] for key in ('added', 'description_changed', 'renamed')
+                   for item in changes[key] if item['id'] not in retired and item['technique_id']})
+
+def resolve_bundle(spec, stix_dir=STIX_DIR):
+    """
+    Accepts a bundle path or a short name such as ics-attack-10.1 and returns the bundle path.
+    """
+    if os.path.exists(spec):
+        return spec
+    file_name = spec if spec.endswith('.json') else spec + '.json'
+    domain, _ = parse_bundle_name(file_name)
+    path = os.path.join(stix_dir, domain or '', file_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Bundle not found: {spec}")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Diff two ATT&CK bundle versions and write the change set that drives selective re-embedding and regeneration."
+    )
+    parser.add_argument('old', help="Older bundle, as a path or a name like ics-attack-10.0.")
+    parser.add_argument('new', help="Newer bundle, as a path or a name like ics-attack-11.0.")
+    parser.add_argument('-o', '--output', type=str,
+                        help="Optional: Write the change set to this JSON file.")
+    parser.add_argument('--stix-dir', type=str, default=STIX_DIR,
+                        help=f"Directory holding the per-domain bundle folders (default: {STIX_DIR}).")
+    parser.add_argument('--cache-dir', type=str, default=FINGERPRINT_CACHE_DIR,
+                        help=f"Directory for cached per-version fingerprints (default: {FINGERPRINT_CACHE_DIR}).")
+    args = parser.parse_args()
+
+    old_file = resolve_bundle(args.old, args.stix_dir)
+    new_file = resolve_bundle(args.new, args.stix_dir)
+    changes = diff_fingerprints(load_fingerprints(old_file, args.cache_dir), load_fingerprints(new_file, args.cache_dir))
+    affected = affected_technique_ids(changes)
+
+    print(f"{os.path.basename(old_file)} -> {os.path.basename(new_file)}")
+    for key, entries in changes.items():
+        print(f"  {key}: {len(entries)}")
+        for item in entries[:10]:
+            print(f"    {item['technique_id']} {item['name']}")
+        if len(entries) > 10:
+            print(f"    ... and {len(entries) - 10} more")
+    print(f"  techniques to re-embed/regenerate: {len(affected)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'from': old_file, 'to': new_file, 'changes': changes,
+                       'affected_technique_ids': affected}, f, indent=2)
+        print(f"Change set saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
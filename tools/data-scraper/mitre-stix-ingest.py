@@ -0,0 +1,151 @@
+import os
+import sys
+import argparse
+import time
+from stix_stream import iter_bundle_objects, technique_id_of, parse_bundle_name, TECHNIQUE_SOURCES
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows
+from mitre_tc.tracing import span
+
+DATABASE_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+STIX_DIR = os.path.join('data', 'attack-stix-data-master')
+DOMAINS = ('enterprise-attack', 'mobile-attack', 'ics-attack')
+ROWS_PER_BATCH = 1000
+TECHNIQUE_COLUMNS = ('attack_pattern', 'technique_id', 'name', 'description', 'domain', 'attack_version', 'modified',
+                     'revoked', 'deprecated')
+REFERENCE_COLUMNS = ('source_name', 'url', 'attack_pattern', 'technique_id', 'domain')
+
+def open_ingest_db(db_file):
+    """
+    Opens the database and makes sure both technique tables exist with the domain, version and
+    modified columns the incremental upsert relies on.
+    """
+    db = connect(db_file)
+    ensure_schema(db, ('mitre_technique_descriptions', 'mitre_technique_references'))
+    return db
+
+def find_bundles(stix_dir, domains, all_versions=False):
+    """
+    Returns the bundle files to ingest: the latest bundle of each domain, or every versioned bundle
+    in ascending version order when all_versions is set.
+    """
+    bundles = []
+    for domain in domains:
+        domain_dir = os.path.join(stix_dir, domain)
+        if not os.path.isdir(domain_dir):
+            print(f"Skipping {domain}: {domain_dir} not found")
+            continue
+        if all_versions:
+            versioned = []
+            for file_name in os.listdir(domain_dir):
+                file_domain, version = parse_bundle_name(file_name)
+                if file_domain == domain and version:
+                    key = tuple(int(part) for part in version.replace('-beta', '').split('.'))
+                    versioned.append((key, os.path.join(domain_dir, file_name)))
+            bundles += [path for _, path in sorted(versioned)]
+        else:
+            bundles.append(os.path.join(domain_dir, f"{domain}.json"))
+    return bundles
+
+def ingest_bundle(db, bundle_file, stored_modified, stats):
+    """
+    Streams the attack-patterns of one bundle and upserts those whose modified timestamp differs
+    from the stored one, together with their references. Runs inside the caller's transaction.
+    """
+    domain, version = parse_bundle_name(bundle_file)
+    techniques = []
+    references = []
+    changed = []
+
+    def flush():
+        if not techniques:
+            return
+        db.executemany(
+            "DELETE FROM mitre_technique_references WHERE attack_pattern = ?",
+            ((attack_pattern,) for attack_pattern in changed)
+        )
+        insert_rows(db, 'mitre_technique_descriptions', TECHNIQUE_COLUMNS, techniques,
+                    conflict=('attack_pattern',), update=TECHNIQUE_COLUMNS[1:], rows_per_transaction=None)
+        insert_rows(db, 'mitre_technique_references', REFERENCE_COLUMNS, references,
+                    conflict=('attack_pattern', 'url'), rows_per_transaction=None)
+        stats['upserted'] += len(techniques)
+        stats['references'] += len(references)
+        techniques.clear()
+        references.clear()
+        changed.clear()
+
+    for stix_object in iter_bundle_objects(bundle_file, types=('x-mitre-collection', 'attack-pattern')):
+        if stix_object['type'] == 'x-mitre-collection':
+            # The collection object names the release of unversioned bundles such as ics-attack.json
+            version = version or stix_object.get('x_mitre_version')
+            continue
+
+        stats['seen'] += 1
+        attack_pattern = stix_object['id']
+        technique_id = technique_id_of(stix_object)
+        if technique_id is None or stored_modified.get(attack_pattern) == stix_object.get('modified'):
+            continue
+        stored_modified[attack_pattern] = stix_object.get('modified')
+
+        changed.append(attack_pattern)
+        techniques.append((
+            attack_pattern, technique_id, stix_object.get('name'), stix_object.get('description'),
+            domain, version, stix_object.get('modified'),
+            int(stix_object.get('revoked', False)), int(stix_object.get('x_mitre_deprecated', False)),
+        ))
+        for ref in stix_object.get('external_references', []):
+            if ref.get('source_name') not in TECHNIQUE_SOURCES and ref.get('url') is not None:
+                references.append((ref.get('source_name'), ref['url'], attack_pattern, technique_id, domain))
+        if len(techniques) >= ROWS_PER_BATCH:
+            flush()
+    flush()
+
+    if version:
+        # Rows written before the collection object was reached get the release it names
+        db.execute("UPDATE mitre_technique_descriptions SET attack_version = ? WHERE domain = ? AND attack_version IS NULL",
+                   (version, domain))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream ATT&CK STIX bundles into the technique and reference tables, upserting only changed techniques."
+    )
+    parser.add_argument('bundles', nargs='*',
+                        help="Optional: Bundle files to ingest. Defaults to the latest bundle of every domain.")
+    parser.add_argument('--db', type=str, default=DATABASE_FILE,
+                        help=f"SQLite database file (default: {DATABASE_FILE}).")
+    parser.add_argument('--stix-dir', type=str, default=STIX_DIR,
+                        help=f"Directory holding the per-domain bundle folders (default: {STIX_DIR}).")
+    parser.add_argument('--domain', choices=DOMAINS, action='append',
+                        help="Optional: Domain(s) to ingest. Repeat to select several; defaults to all three.")
+    parser.add_argument('--all-versions', action='store_true',
+                        help="Replay every versioned bundle in order instead of only the latest.")
+    args = parser.parse_args()
+
+    bundles = args.bundles or find_bundles(args.stix_dir, args.domain or DOMAINS, args.all_versions)
+    db = open_ingest_db(args.db)
+    stats = {'seen': 0, 'upserted': 0, 'references': 0}
+    start = time.perf_counter()
+    try:
+        stored_modified = dict(db.execute("SELECT attack_pattern, modified FROM mitre_technique_descriptions"))
+        # One transaction for the whole run: either every bundle lands or none does
+        with db:
+            for bundle_file in bundles:
+                if not os.path.exists(bundle_file):
+                    print(f"Error: Bundle not found at {bundle_file}")
+                    continue
+                before, seen = stats['upserted'], stats['seen']
+                with span('ingest.bundle', file=os.path.basename(bundle_file)) as current:
+                    ingest_bundle(db, bundle_file, stored_modified, stats)
+                    current.add(items=stats['seen'] - seen, bytes=os.path.getsize(bundle_file))
+                print(f"Ingested {bundle_file}: {stats['upserted'] - before} technique(s) changed")
+    finally:
+        db.close()
+
+    print(f"Done in {time.perf_counter() - start:.2f}s: {stats['seen']} attack-patterns seen, "
+          f"{stats['upserted']} upserted, {stats['references']} references written.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import os
+import re
+
+CHUNK_SIZE = 1 << 20 # Characters read from the bundle per refill
+TECHNIQUE_SOURCES = ('mitre-attack', 'mitre-mobile-attack', 'mitre-ics-attack')
+BUNDLE_VERSION_PATTERN = re.compile(r'^(?P<domain>[a-z]+-attack)(?:-(?P<version>\d+(?:\.\d+)*(?:-beta)?))?\.json$')
+
+def iter_bundle_objects(file_path, types=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams the objects of a STIX bundle one at a time without loading the whole file.
+    Only the raw text of the current object is decoded, and objects whose type is not in types
+    (when given) are skipped right after decoding.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        # Top-level keys before "objects" are short scalars, so the first match is the array key
+        while True:
+            match = re.search(r'"objects"\s*:\s*\[', buffer)
+            if match:
+                break
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer += more
+        pos = match.end()
+
+        while True:
+            # Skip separators between array elements
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer):
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                if not buffer:
+                    return
+            if buffer[pos] == ']':
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The object continues past the buffer; drop what was consumed and read more
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            pos = end
+            if types is None or obj.get('type') in types:
+                yield obj
+
+def technique_id_of(stix_object):
+    """
+    Returns the ATT&CK ID (e.g. T1055.011) of an attack-pattern, or None if it has none.
+    """
+    for ref in stix_object.get('external_references', []):
+        if ref.get('source_name') in TECHNIQUE_SOURCES and ref.get('external_id'):
+            return ref['external_id']
+    return None
+
+def parse_bundle_name(file_path):
+    """
+    Splits a bundle file name like ics-attack-10.1.json into ('ics-attack', '10.1').
+    The version is None for the unversioned latest bundle.
+    """
+    match = BUNDLE_VERSION_PATTERN.match(os.path.basename(file_path))
+    if not match:
+        return None, None
+    return match.group('domain'), match.group('version')
@@ -0,0 +1,123 @@
+"""
+Local stand-in for the websites cited by MITRE techniques, used to exercise the citation fetcher
+without network access.
+
+Example:
+    python tools/data-scraper/stub-article-server.py --port 8001 --seed-db test.db --count 500
+    python tools/data-scraper/mitre-citation-fetcher.py --db test.db
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows
+
+LAST_MODIFIED = 'Mon, 23 Jun 2025 10:00:00 GMT'
+
+def render_article(number):
+    """
+    Returns the HTML of stub article number, with page chrome around a few body paragraphs.
+    """
+    paragraphs = ''.join(
+        f"<p>Article {number}, paragraph {i}: the threat actor used a scheduled task to maintain persistence "
+        f"and exfiltrated data over an encrypted channel to infrastructure it controlled.</p>"
+        for i in range(5)
+    )
+    return (
+        f"<html><head><title>Stub article {number}</title><script>var tracking = 1;</script></head>"
+        f"<body><nav><a href='/'>Home</a><a href='/blog'>Blog</a></nav>"
+        f"<article><h1>Stub article {number}</h1>{paragraphs}</article>"
+        f"<footer>Copyright stub vendor</footer></body></html>"
+    ).encode('utf-8')
+
+class ArticleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.02
+    counts = None
+    lock = threading.Lock()
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'article' or not parts[1].isdigit():
+            self._count('404')
+            self._send(404, b'not found', {'Content-Type': 'text/plain'})
+            return
+
+        body = render_article(int(parts[1]))
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._count('304')
+            self._send(304, headers={'ETag': etag})
+            return
+        self._count('200')
+        self._send(200, body, {'Content-Type': 'text/html; charset=utf-8', 'ETag': etag, 'Last-Modified': LAST_MODIFIED})
+
+    def log_message(self, format, *args):
+        pass
+
+def seed_references(db_file, base_url, count):
+    """
+    Inserts count references pointing at the stub server into mitre_technique_references,
+    spread over a handful of fake techniques, plus one URL that answers 404.
+    """
+    db = connect(db_file)
+    ensure_schema(db, ('mitre_technique_references',))
+    rows = [(f"Stub {i}", f"{base_url}/article/{i}", f"attack-pattern--stub-{i % 10}", f"T{9000 + i % 10}") for i in range(count)]
+    rows.append(("Stub missing", f"{base_url}/missing", "attack-pattern--stub-0", "T9000"))
+    insert_rows(db, 'mitre_technique_references', ('source_name', 'url', 'attack_pattern', 'technique_id'), rows,
+                conflict=('attack_pattern', 'url'))
+    db.close()
+
+def make_server(host='127.0.0.1', port=0, latency=0.02):
+    """
+    Creates (but does not start) a stub article server; port 0 picks a free port.
+    """
+    handler = type('Handler', (ArticleHandler,), {'latency': latency, 'counts': {}})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub cited articles for testing the citation fetcher.")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds each response is delayed (default: 0.02).")
+    parser.add_argument('--seed-db', type=str, help="Optional: Insert references to the stub articles into this database.")
+    parser.add_argument('--count', type=int, default=200, help="Number of stub articles to reference when seeding (default: 200).")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency)
+    base_url = f"http://{args.host}:{server.server_address[1]}"
+    if args.seed_db:
+        seed_references(args.seed_db, base_url, args.count)
+        print(f"Seeded {args.count} reference(s) into {args.seed_db}")
+    print(f"Stub article server listening on {base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Responses served: {server.RequestHandlerClass.counts}")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+from near_duplicates import (BANDS, DB_FILE, DEFAULT_SOURCES, NUM_PERM, SHINGLE_WORDS, SOURCES, THRESHOLD, MinHasher,
+                             find_near_duplicates, largest_clusters, reset)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Flag near-duplicate synthetic texts and articles with MinHash signatures and LSH buckets. "
+                    "Each run hashes only rows added since the last one and compares them with every earlier row; "
+                    "flagged rows are skipped by bulk-embed --skip-near-duplicates."
+    )
+    parser.add_argument('--source', choices=list(SOURCES), action='append',
+                        help=f"Optional: Text source(s) to hash. Repeat to select several (default: {', '.join(DEFAULT_SOURCES)}).")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"Minimum estimated Jaccard similarity of word shingles for a near-duplicate (default: {THRESHOLD}).")
+    parser.add_argument('--shingle-words', type=int, default=SHINGLE_WORDS,
+                        help=f"Words per shingle; changing it requires --reset (default: {SHINGLE_WORDS}).")
+    parser.add_argument('--reset', action='store_true',
+                        help="Forget all stored signatures and flags first, e.g. after changing --threshold or --shingle-words.")
+    parser.add_argument('--clusters', type=int, default=10,
+                        help="Number of largest duplicate clusters to print (default: 10).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    args = parser.parse_args()
+    if not 0 < args.threshold <= 1:
+        parser.error("--threshold must be in (0, 1]")
+
+    if args.reset:
+        reset(args.db)
+    try:
+        stats = find_near_duplicates(args.db, args.source or list(DEFAULT_SOURCES), args.threshold,
+                                     MinHasher(NUM_PERM, args.shingle_words))
+    except ValueError as e:
+        parser.error(str(e))
+
+    for source, hashed in stats['hashed'].items():
+        print(f"{source}: {hashed} new row(s) hashed, {stats['flagged'].get(source, 0)} flagged as near-duplicates")
+    if stats['pruned']:
+        print(f"{stats['pruned']} signature(s) of deleted or superseded rows pruned")
+    print(f"Done in {stats['seconds']:.2f}s ({NUM_PERM} MinHash values in {BANDS} bands)")
+
+    clusters = largest_clusters(args.db, args.clusters)
+    if clusters:
+        print(f"\n{'table':<22} {'row_id':>8} {'duplicates':>10} {'min similarity':>15}")
+        for table, row_id, duplicates, lowest in clusters:
+            print(f"{table:<22} {row_id:>8} {duplicates:>10} {lowest:>15.3f}")
+
+if __name__ == "__main__":
+    main()
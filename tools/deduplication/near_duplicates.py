@@ -0,0 +1,305 @@
+import os
+import re
+import sys
+import time
+import zlib
+import numpy as np
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows, table_columns
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+TABLES = ('text_minhashes', 'near_duplicates')
+SOURCES = {
+    # name: (table, text column), named like the bulk-embed sources; rows are hashed in rowid order
+    'variants': ('synthetic_texts', 'text'),
+    'synthetic': ('synthetic_texts_test', 'text'),
+    'articles': ('cited_article_texts', 'text'),
+}
+DEFAULT_SOURCES = ('variants', 'synthetic', 'articles')
+NUM_PERM = 128 # MinHash values per text; the similarity estimate has a standard error of about 0.035 at 0.8
+BANDS = 32 # LSH bands of NUM_PERM // BANDS values; pairs with Jaccard 0.8 share a band with probability > 0.9999
+SHINGLE_WORDS = 3 # Words per shingle
+THRESHOLD = 0.8 # Minimum estimated Jaccard similarity of a near-duplicate
+SEED = 20240 # Seeds the MinHash permutations; signatures from another seed are not comparable
+EMPTY = np.uint32(0xFFFFFFFF) # Signature value of texts without words
+SHINGLE_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+BAND_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5], dtype=np.uint64)
+READ_ROWS = 4096 # Rows read from the database and hashed at a time
+MAX_SHINGLES = 1 << 16 # Shingles hashed per matrix, bounding memory to NUM_PERM x MAX_SHINGLES x 8 bytes
+MAX_CACHED_WORDS = 1 << 20 # Word hashes kept before the cache is cleared
+WORD_PATTERN = re.compile(r"\w+")
+
+class MinHasher:
+    """
+    Computes MinHash signatures over word shingles. Words are hashed with CRC-32, which unlike hash() is the
+    same in every process, so signatures stored by one run can be compared with those of the next.
+    Each of the num_perm hash functions is a multiply-shift hash (a * x + b) >> 32 of the 64-bit shingle
+    hash x with a random odd a, which needs no modulo and wraps around in uint64 arithmetic.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, shingle_words=SHINGLE_WORDS, seed=SEED):
+        if shingle_words > len(SHINGLE_MULTIPLIERS):
+            raise ValueError(f"At most {len(SHINGLE_MULTIPLIERS)} words per shingle are supported")
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self._words = {}
+
+    def shingles(self, text):
+        """
+        Returns the 64-bit hashes of a text's overlapping shingle_words-word shingles. A text shorter than one
+        shingle is a single shingle; a text without words has none.
+        """
+        if len(self._words) > MAX_CACHED_WORDS:
+            self._words.clear()
+        words = self._words
+        hashes = []
+        for word in WORD_PATTERN.findall((text or '').lower()):
+            value = words.get(word)
+            if value is None:
+                value = words[word] = zlib.crc32(word.encode('utf-8'))
+            hashes.append(value)
+        hashes = np.array(hashes, dtype=np.uint64)
+        width = min(self.shingle_words, len(hashes))
+        if not width:
+            return hashes
+        count = len(hashes) - width + 1
+        # uint64 arithmetic wraps around, which is what a hash combination wants
+        return sum(hashes[i:i + count] * SHINGLE_MULTIPLIERS[i] for i in range(width))
+
+    def signatures(self, texts):
+        """
+        Returns (signatures, valid): a (texts x num_perm) uint32 array of minimum permuted shingle hashes and a
+        mask of the texts that had any shingle.
+        """
+        shingles = [self.shingles(text) for text in texts]
+        lengths = np.array([len(values) for values in shingles], dtype=np.int64)
+        # Hash functions along the first axis, so each text's shingles are contiguous for reduceat
+        signatures = np.full((self.num_perm, len(texts)), EMPTY, dtype=np.uint64)
+        if lengths.sum():
+            flat = np.concatenate(shingles)
+            owners = np.repeat(np.arange(len(texts)), lengths)
+            a, b = self.a[:, None], self.b[:, None]
+            for start in range(0, len(flat), MAX_SHINGLES):
+                values, rows = flat[start:start + MAX_SHINGLES], owners[start:start + MAX_SHINGLES]
+                permuted = np.multiply(a, values)
+                permuted += b
+                permuted >>= np.uint64(32)
+                starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+                # A text spanning two slices takes the minimum of both
+                rows = rows[starts]
+                signatures[:, rows] = np.minimum(signatures[:, rows], np.minimum.reduceat(permuted, starts, axis=1))
+        return np.ascontiguousarray(signatures.T.astype(np.uint32)), lengths > 0
+
+def band_keys(signatures, bands=BANDS):
+    """
+    Hashes each band of NUM_PERM // bands signature values into one int64 bucket key. Returns (texts x bands).
+    """
+    rows = signatures.shape[1] // bands
+    if rows > len(BAND_MULTIPLIERS):
+        raise ValueError(f"At most {len(BAND_MULTIPLIERS)} values per band are supported")
+    values = signatures[:, :bands * rows].reshape(len(signatures), bands, rows).astype(np.uint64)
+    return (values * BAND_MULTIPLIERS[:rows]).sum(axis=2, dtype=np.uint64).view(np.int64)
+
+def candidate_pairs(keys, valid, new):
+    """
+    Returns (rows, candidates): for every text marked in the boolean mask new that shares an LSH bucket with an
+    earlier text, the earlier texts to compare it with. Per band, that is the first text of its bucket and its
+    predecessor in the bucket, so a bucket of n texts gives at most 2n pairs instead of n^2 / 2.
+    """
+    indices = np.flatnonzero(valid)
+    rows, candidates = [], []
+    for band in range(keys.shape[1]):
+        order = indices[np.lexsort((indices, keys[indices, band]))]
+        sorted_keys = keys[order, band]
+        same = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+        run_start = np.maximum.accumulate(np.where(same, 0, np.arange(len(order))))
+        positions = np.flatnonzero(same)
+        positions = positions[new[order[positions]]]
+        rows.extend((order[positions], order[positions]))
+        candidates.extend((order[positions - 1], order[run_start[positions]]))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.stack([np.concatenate(rows), np.concatenate(candidates)], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+def similarity(signatures, rows, candidates, chunk=MAX_SHINGLES):
+    """
+    Estimates the Jaccard similarity of each (row, candidate) pair as the share of equal MinHash values.
+    """
+    result = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), chunk):
+        end = start + chunk
+        result[start:end] = (signatures[rows[start:end]] == signatures[candidates[start:end]]).mean(axis=1)
+    return result
+
+def live_condition(db, table):
+    """
+    Returns the SQL condition selecting a table's current rows: texts marked superseded by a regeneration are
+    about to be replaced, so they are neither hashed nor kept as cluster representatives.
+    """
+    return "superseded = 0" if 'superseded' in table_columns(db, table) else "1"
+
+def iter_new_rows(db, table, column, read_rows=READ_ROWS):
+    """
+    Streams (rowids, texts) chunks of a table's current rows not yet in text_minhashes.
+    """
+    (last,) = db.execute("SELECT COALESCE(MAX(row_id), 0) FROM text_minhashes WHERE source_table = ?", (table,)).fetchone()
+    cursor = db.execute(f"SELECT rowid, {column} FROM {table} WHERE rowid > ? AND {live_condition(db, table)} ORDER BY rowid",
+                        (last,))
+    while True:
+        rows = cursor.fetchmany(read_rows)
+        if not rows:
+            return
+        yield [rowid for rowid, _ in rows], [text or '' for _, text in rows]
+
+def load_signatures(db, num_perm=NUM_PERM):
+    """
+    Returns (tables, row_ids, signatures, valid) of every text hashed by earlier runs, in the order they were
+    hashed.
+    """
+    tables, row_ids, signatures, valid = [], [], [], []
+    empty = np.full(num_perm, EMPTY, dtype=np.uint32)
+    for table, row_id, signature in db.execute("SELECT source_table, row_id, signature FROM text_minhashes ORDER BY rowid"):
+        if signature is not None and len(signature) != num_perm * 4:
+            raise ValueError(f"Stored signatures have {len(signature) // 4} values, not {num_perm}; rerun with --reset.")
+        tables.append(table)
+        row_ids.append(row_id)
+        signatures.append(empty if signature is None else np.frombuffer(signature, dtype=np.uint32))
+        valid.append(signature is not None)
+    return (tables, row_ids, np.array(signatures, dtype=np.uint32).reshape(len(tables), num_perm),
+            np.array(valid, dtype=bool))
+
+def missing_rows(db, tables, row_ids):
+    """
+    Returns a mask of the hashed (table, row_id) pairs whose row was deleted or superseded since it was hashed.
+    """
+    missing = np.zeros(len(tables), dtype=bool)
+    tables_array = np.array(tables, dtype=object)
+    row_ids_array = np.array(row_ids, dtype=np.int64)
+    for table in set(tables):
+        rows = tables_array == table
+        if not table_columns(db, table):
+            missing[rows] = True
+            continue
+        current = np.fromiter((rowid for (rowid,) in db.execute(f"SELECT rowid FROM {table} WHERE {live_condition(db, table)}")),
+                              dtype=np.int64)
+        missing[rows] = ~np.isin(row_ids_array[rows], current)
+    return missing
+
+def find_near_duplicates(db_file=DB_FILE, sources=DEFAULT_SOURCES, threshold=THRESHOLD, hasher=None, read_rows=READ_ROWS):
+    """
+    Hashes the rows of the given sources added since the last run and flags every new row whose estimated
+    Jaccard similarity to an earlier row, of any source and any run, reaches threshold. A flagged row points
+    at the first hashed row of its cluster, so keeping only unflagged rows collapses every cluster to one text.
+    Signatures and flags of rows deleted or superseded since an earlier run are dropped, and rows that pointed
+    at such a representative are compared again, so their cluster elects a new one instead of vanishing.
+    Signatures and flags are committed together at the end, so an interrupted run leaves no trace.
+    Returns a dict of per-source counts of hashed and flagged rows, the number of pruned rows and the seconds taken.
+    """
+    start = time.perf_counter()
+    hasher = hasher or MinHasher()
+    db = connect(db_file)
+    try:
+        ensure_schema(db, TABLES)
+        tables, row_ids, signatures, valid = load_signatures(db, hasher.num_perm)
+        missing = missing_rows(db, tables, row_ids)
+        pruned = [(table, row_id) for table, row_id, gone in zip(tables, row_ids, missing.tolist()) if gone]
+        if pruned:
+            tables = [table for table, gone in zip(tables, missing.tolist()) if not gone]
+            row_ids = [row_id for row_id, gone in zip(row_ids, missing.tolist()) if not gone]
+            signatures, valid = signatures[~missing], valid[~missing]
+        first_new = len(tables)
+        new_signatures, new_valid = [signatures], [valid]
+        stats = {'hashed': {}, 'flagged': {}, 'pruned': len(pruned)}
+        for source in sources:
+            table, column = SOURCES[source]
+            if not table_columns(db, table):
+                print(f"Skipping {source}: table {table} not found")
+                continue
+            stats['hashed'][source] = 0
+            for chunk_ids, texts in iter_new_rows(db, table, column, read_rows):
+                chunk_signatures, chunk_valid = hasher.signatures(texts)
+                tables.extend([table] * len(chunk_ids))
+                row_ids.extend(chunk_ids)
+                new_signatures.append(chunk_signatures)
+                new_valid.append(chunk_valid)
+                stats['hashed'][source] += len(chunk_ids)
+        signatures, valid = np.concatenate(new_signatures), np.concatenate(new_valid)
+
+        # Representatives of earlier rows, as global indices. Rows whose representative is gone are compared again
+        position = {(table, row_id): i for i, (table, row_id) in enumerate(zip(tables, row_ids))}
+        representative = np.arange(len(tables))
+        new = np.arange(len(tables)) >= first_new
+        for table, row_id, of_table, of_row_id in db.execute(
+                "SELECT source_table, row_id, duplicate_of_table, duplicate_of_row_id FROM near_duplicates"):
+            if (table, row_id) not in position:
+                continue
+            if (of_table, of_row_id) in position:
+                representative[position[(table, row_id)]] = position[(of_table, of_row_id)]
+            else:
+                new[position[(table, row_id)]] = True
+        orphaned = np.flatnonzero(new[:first_new])
+
+        rows, candidates = candidate_pairs(band_keys(signatures), valid, new)
+        keep = similarity(signatures, rows, candidates) >= threshold
+        rows, candidates = rows[keep], candidates[keep]
+        # Rows are resolved in arrival order, so every candidate's representative is final when it is read
+        flagged = []
+        for row, group in zip(*np.unique(rows, return_index=True)):
+            group_candidates = candidates[group:np.searchsorted(rows, row, side='right')]
+            representative[row] = representative[group_candidates].min()
+            flagged.append(row)
+        flagged = np.array(flagged, dtype=np.int64)
+        scores = similarity(signatures, flagged, representative[flagged]) if flagged.size else []
+
+        with db:
+            db.executemany("DELETE FROM text_minhashes WHERE source_table = ? AND row_id = ?", pruned)
+            db.executemany("DELETE FROM near_duplicates WHERE source_table = ? AND row_id = ?",
+                           pruned + [(tables[i], row_ids[i]) for i in orphaned.tolist()])
+            insert_rows(db, 'text_minhashes', ('source_table', 'row_id', 'signature'),
+                        ((tables[i], row_ids[i], signatures[i].tobytes() if valid[i] else None)
+                         for i in range(first_new, len(tables))), rows_per_transaction=None)
+            insert_rows(db, 'near_duplicates', ('source_table', 'row_id', 'duplicate_of_table', 'duplicate_of_row_id', 'similarity'),
+                        ((tables[i], row_ids[i], tables[representative[i]], row_ids[representative[i]], float(score))
+                         for i, score in zip(flagged.tolist(), scores)),
+                        conflict=('source_table', 'row_id'), rows_per_transaction=None)
+    finally:
+        db.close()
+    table_sources = {SOURCES[source][0]: source for source in sources}
+    for i in flagged.tolist():
+        source = table_sources.get(tables[i])
+        if source is None: # An orphaned row of a source not selected in this run
+            continue
+        stats['flagged'][source] = stats['flagged'].get(source, 0) + 1
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def largest_clusters(db_file=DB_FILE, limit=10):
+    """
+    Returns (table, row_id, duplicates, minimum similarity) of the representatives with the most flagged rows.
+    """
+    db = connect(db_file)
+    try:
+        return db.execute("SELECT duplicate_of_table, duplicate_of_row_id, COUNT(*), MIN(similarity) FROM near_duplicates "
+                          "GROUP BY duplicate_of_table, duplicate_of_row_id ORDER BY COUNT(*) DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        db.close()
+
+def reset(db_file=DB_FILE):
+    """
+    Forgets every stored signature and flag, so the next run hashes and compares all rows again.
+    """
+    db = connect(db_file)
+    try:
+        ensure_schema(db, TABLES)
+        with db:
+            db.execute("DELETE FROM near_duplicates")
+            db.execute("DELETE FROM text_minhashes")
+    finally:
+        db.close()
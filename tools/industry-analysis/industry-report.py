@@ -0,0 +1,81 @@
+import argparse
+import csv
+import time
+import numpy as np
+from industry_store import (DB_FILE, MIN_COUNT, VERSUS, list_industries, load_counts, open_store,
+                            over_representation, technique_names)
+
+COLUMNS = ('technique_id', 'name', 'count', 'share', 'baseline_count', 'baseline_share', 'ratio', 'log_odds', 'z',
+           'chi_square', 'p_value')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the techniques over-represented in one industry compared with the others, from the "
+                    "summary tables filled by ingest-classifications.py. Without --industry, lists the ingested industries."
+    )
+    parser.add_argument('--industry', type=str,
+                        help="Optional: Industry to report on.")
+    parser.add_argument('--versus', choices=VERSUS, default='rest',
+                        help="Baseline: the other industries combined, or all industries including this one (default: rest).")
+    parser.add_argument('--source', type=str, action='append',
+                        help="Optional: Count only texts from this source. Repeat to select several (default: all sources).")
+    parser.add_argument('--passed', action='store_true',
+                        help="Count only texts whose top-1 score passed the threshold used when they were classified.")
+    parser.add_argument('--min-score', type=float,
+                        help="Optional: Count only texts with a top-1 score of at least this, rounded down to a 0.05 bin edge.")
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT,
+                        help=f"Leave out techniques seen fewer times in the industry (default: {MIN_COUNT}).")
+    parser.add_argument('--top', type=int, default=20,
+                        help="Number of techniques to print, by decreasing z-score (default: 20).")
+    parser.add_argument('--all-techniques', action='store_true',
+                        help="Include under-represented techniques (negative log odds) too.")
+    parser.add_argument('-o', '--output', type=str,
+                        help="Optional: Write every reported technique to this CSV file.")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    args = parser.parse_args()
+    if args.passed and args.min_score is not None:
+        parser.error("--passed cannot be combined with --min-score")
+
+    db = open_store(args.db)
+    try:
+        if not args.industry:
+            print(f"{'industry':<30} {'batches':>8} {'texts':>10}")
+            for industry, batches, texts in list_industries(db):
+                print(f"{industry:<30} {batches:>8} {texts:>10}")
+            return
+        start = time.perf_counter()
+        industries, technique_ids, counts = load_counts(db, args.source, args.min_score, args.passed)
+        if args.industry not in industries:
+            parser.error(f"No classified texts for industry {args.industry!r}; ingested: {', '.join(industries) or 'none'}")
+        stats = over_representation(counts, industries.index(args.industry), args.versus)
+        names = technique_names(db)
+    finally:
+        db.close()
+
+    keep = stats['count'] >= args.min_count
+    if not args.all_techniques:
+        keep &= stats['log_odds'] > 0
+    order = [i for i in np.argsort(-stats['z'], kind='stable') if keep[i]]
+    elapsed = time.perf_counter() - start
+    rows = [(technique_ids[i], names.get(technique_ids[i], ''), *(stats[name][i] for name in COLUMNS[2:])) for i in order]
+
+    row = industries.index(args.industry)
+    print(f"{args.industry}: {int(counts[row].sum())} texts vs {args.versus} "
+          f"({int(counts.sum() - (counts[row].sum() if args.versus == 'rest' else 0))} texts), "
+          f"{len(rows)} techniques reported in {elapsed * 1000:.1f} ms")
+    print(f"{'technique':<12} {'count':>7} {'share':>7} {'base':>7} {'ratio':>7} {'log-odds':>9} {'z':>7} {'chi2':>9} {'p':>9}  name")
+    for technique_id, name, count, share, _, baseline_share, ratio, log_odds, z, chi_square, p_value in rows[:args.top]:
+        print(f"{technique_id:<12} {int(count):>7} {share:>7.2%} {baseline_share:>7.2%} {ratio:>7.2f} {log_odds:>9.3f} "
+              f"{z:>7.2f} {chi_square:>9.2f} {p_value:>9.2g}  {name}")
+
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for values in rows:
+                writer.writerow([f'{value:.6g}' if isinstance(value, (float, np.floating)) else value for value in values])
+        print(f"Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
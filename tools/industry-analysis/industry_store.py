@@ -0,0 +1,162 @@
+import datetime
+import hashlib
+import math
+import os
+import sys
+import numpy as np
+
+# The top-k CSV reader lives with the cosine-similarity tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cosine-similarity'))
+
+from evaluation import READ_ROWS, iter_top_k_csv
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows, table_columns
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+TABLES = ('industry_batches', 'industry_technique_counts', 'industry_score_histogram')
+HISTOGRAM_BINS = 20 # Top-1 score bins of width 1 / HISTOGRAM_BINS over [0, 1]
+VERSUS = ('rest', 'all')
+CORRECTION = 0.5 # Added to every cell of a 2x2 table so techniques with zero counts get finite log-odds
+MIN_COUNT = 5 # Techniques seen fewer times in the industry are left out of reports
+HASH_BLOCK = 1 << 20
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def score_bins(scores, bins=HISTOGRAM_BINS):
+    """
+    Returns the histogram bin of each score; scores outside [0, 1] fall into the first or last bin.
+    """
+    return np.clip(np.floor(np.asarray(scores, dtype=np.float64) * bins), 0, bins - 1).astype(np.int64)
+
+def summarize_top_k_csv(csv_file, read_rows=READ_ROWS):
+    """
+    Reduces a top-k CSV written by cosine-similarity.py --output (or classify-with-model.py) to per technique
+    top-1 counts, streaming it in chunks. Every text counts once, for its top-1 technique.
+    Returns (texts, {technique_id: [texts, passed, score_sum]}, {technique_id: histogram counts}).
+    """
+    counts, histograms = {}, {}
+    texts = 0
+    for _, passed, predicted, scores in iter_top_k_csv(csv_file, read_rows):
+        if not predicted.shape[1]:
+            continue
+        texts += len(passed)
+        technique_ids, inverse = np.unique(predicted[:, 0], return_inverse=True)
+        inverse = inverse.reshape(-1)
+        size = len(technique_ids)
+        chunk_texts = np.bincount(inverse, minlength=size)
+        chunk_passed = np.bincount(inverse, weights=passed, minlength=size)
+        chunk_scores = np.bincount(inverse, weights=scores[:, 0].astype(np.float64), minlength=size)
+        chunk_histograms = np.bincount(inverse * HISTOGRAM_BINS + score_bins(scores[:, 0]),
+                                       minlength=size * HISTOGRAM_BINS).reshape(size, HISTOGRAM_BINS)
+        for i, technique_id in enumerate(technique_ids.tolist()):
+            total = counts.setdefault(technique_id, [0, 0, 0.0])
+            total[0] += int(chunk_texts[i])
+            total[1] += int(chunk_passed[i])
+            total[2] += float(chunk_scores[i])
+            histograms[technique_id] = histograms.get(technique_id, 0) + chunk_histograms[i]
+    return texts, counts, histograms
+
+def ingest_top_k_csv(db, csv_file, industry, source, read_rows=READ_ROWS):
+    """
+    Adds a top-k CSV's per technique counts and score histograms to the summary tables of its industry and
+    source in one transaction. A file already ingested for the same industry and source is skipped, so
+    appending new reports reads only the new files and updates only the summary rows they touch.
+    Returns the number of texts added, or None if the file was ingested before.
+    """
+    content_sha256 = file_sha256(csv_file)
+    key = (content_sha256, industry, source)
+    if db.execute("SELECT 1 FROM industry_batches WHERE content_sha256 = ? AND industry = ? AND source = ?", key).fetchone():
+        return None
+    texts, counts, histograms = summarize_top_k_csv(csv_file, read_rows)
+    with db:
+        insert_rows(db, 'industry_batches', ('content_sha256', 'industry', 'source', 'input_file', 'texts', 'ingested_at'),
+                    [key + (os.path.abspath(csv_file), texts, datetime.datetime.now(datetime.timezone.utc).isoformat())],
+                    rows_per_transaction=None)
+        insert_rows(db, 'industry_technique_counts', ('industry', 'source', 'technique_id', 'texts', 'passed', 'score_sum'),
+                    ((industry, source, technique_id, *total) for technique_id, total in counts.items()),
+                    conflict=('industry', 'source', 'technique_id'), accumulate=('texts', 'passed', 'score_sum'),
+                    rows_per_transaction=None)
+        insert_rows(db, 'industry_score_histogram', ('industry', 'source', 'technique_id', 'bin', 'texts'),
+                    ((industry, source, technique_id, int(bin), int(count))
+                     for technique_id, histogram in histograms.items() for bin, count in enumerate(histogram.tolist()) if count),
+                    conflict=('industry', 'source', 'technique_id', 'bin'), accumulate=('texts',),
+                    rows_per_transaction=None)
+    return texts
+
+def list_industries(db):
+    """
+    Returns (industry, batches, texts) rows for every ingested industry.
+    """
+    return db.execute("SELECT industry, COUNT(*), SUM(texts) FROM industry_batches GROUP BY industry ORDER BY industry").fetchall()
+
+def load_counts(db, sources=None, min_score=None, passed=False):
+    """
+    Returns (industries, technique_ids, counts) with counts an (industries x techniques) array of top-1 counts
+    summed over the given sources (default: all). passed counts only texts that passed the classification
+    threshold; min_score counts only texts whose top-1 score falls in a bin at or above it, rounded down to the
+    bin edge.
+    """
+    where, parameters = "", ()
+    if sources:
+        where, parameters = f"WHERE source IN ({', '.join('?' for _ in sources)})", tuple(sources)
+    if min_score is not None:
+        lowest_bin = int(score_bins([min_score])[0])
+        where += (" AND" if where else "WHERE") + " bin >= ?"
+        query = f"SELECT industry, technique_id, SUM(texts) FROM industry_score_histogram {where} GROUP BY industry, technique_id"
+        parameters += (lowest_bin,)
+    else:
+        column = 'passed' if passed else 'texts'
+        query = f"SELECT industry, technique_id, SUM({column}) FROM industry_technique_counts {where} GROUP BY industry, technique_id"
+    rows = db.execute(query, parameters).fetchall()
+    industries = sorted({row[0] for row in rows})
+    technique_ids = sorted({row[1] for row in rows})
+    industry_index = {industry: i for i, industry in enumerate(industries)}
+    technique_index = {technique_id: i for i, technique_id in enumerate(technique_ids)}
+    counts = np.zeros((len(industries), len(technique_ids)), dtype=np.float64)
+    for industry, technique_id, count in rows:
+        counts[industry_index[industry], technique_index[technique_id]] = count or 0
+    return industries, technique_ids, counts
+
+def over_representation(counts, row, versus='rest', correction=CORRECTION):
+    """
+    Compares the technique counts of one industry (a row of counts) with those of the other industries combined
+    ('rest') or of all industries including it ('all'). For each technique the 2x2 table is
+    [[a, b], [c, d]] with a its count in the industry, b the industry's other texts, c its count in the
+    baseline and d the baseline's other texts.
+    Returns a dict of arrays: shares, the log odds ratio log(a d / b c) with correction added to every cell,
+    its z-score, and Pearson's chi-square statistic with its p-value (1 degree of freedom).
+    """
+    a = counts[row]
+    c = counts.sum(axis=0) - (a if versus == 'rest' else 0)
+    b = a.sum() - a
+    d = c.sum() - c
+    share = a / max(a.sum(), 1)
+    baseline_share = c / max(c.sum(), 1)
+    a_, b_, c_, d_ = (cell + correction for cell in (a, b, c, d))
+    log_odds = np.log(a_ * d_ / (b_ * c_))
+    z = log_odds / np.sqrt(1 / a_ + 1 / b_ + 1 / c_ + 1 / d_)
+    total = a + b + c + d
+    margins = (a + b) * (c + d) * (a + c) * (b + d)
+    chi_square = np.divide(total * (a * d - b * c) ** 2, margins, out=np.zeros_like(a), where=margins > 0)
+    p_value = np.array([math.erfc(math.sqrt(value / 2)) for value in chi_square.tolist()])
+    return {'count': a, 'share': share, 'baseline_count': c, 'baseline_share': baseline_share,
+            'ratio': np.divide(share, baseline_share, out=np.full_like(share, np.inf), where=baseline_share > 0),
+            'log_odds': log_odds, 'z': z, 'chi_square': chi_square, 'p_value': p_value}
+
+def technique_names(db):
+    if not table_columns(db, 'mitre_technique_descriptions'):
+        return {}
+    return dict(db.execute("SELECT technique_id, name FROM mitre_technique_descriptions"))
+
+def open_store(db_file=DB_FILE):
+    db = connect(db_file)
+    ensure_schema(db, TABLES)
+    return db
@@ -0,0 +1,41 @@
+import argparse
+import os
+import time
+from industry_store import DB_FILE, ingest_top_k_csv, open_store
+from evaluation import READ_ROWS
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add top-k classification CSVs to the industry x technique summary tables. Files already "
+                    "ingested for the same industry and source are skipped, so rerunning over a growing "
+                    "directory of reports only reads the new ones."
+    )
+    parser.add_argument('csv_files', nargs='+',
+                        help="Top-k CSV file(s) written by classify -o or classify-model.")
+    parser.add_argument('--industry', type=str, required=True,
+                        help="Industry the classified texts come from, e.g. healthcare.")
+    parser.add_argument('--source', type=str, default='reports',
+                        help="Where the texts come from, e.g. a feed or vendor name (default: reports).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--read-rows', type=int, default=READ_ROWS,
+                        help=f"CSV rows parsed per chunk (default: {READ_ROWS}).")
+    args = parser.parse_args()
+    missing = [csv_file for csv_file in args.csv_files if not os.path.isfile(csv_file)]
+    if missing:
+        parser.error(f"File(s) not found: {', '.join(missing)}")
+
+    db = open_store(args.db)
+    try:
+        for csv_file in args.csv_files:
+            start = time.perf_counter()
+            texts = ingest_top_k_csv(db, csv_file, args.industry, args.source, args.read_rows)
+            if texts is None:
+                print(f"{csv_file}: already ingested for {args.industry}/{args.source}, skipped")
+            else:
+                print(f"{csv_file}: {texts} texts added to {args.industry}/{args.source} in {time.perf_counter() - start:.2f}s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
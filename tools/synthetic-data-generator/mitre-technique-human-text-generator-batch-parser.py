@@ -1,92 +1,178 @@
 import json
 import sqlite3 # Import sqlite3 for database operations
 import os # Import os module for path manipulation
+import sys
+import argparse
+import time
+from prompt_variants import CUSTOM_ID_PATTERN, TECHNICALITIES, STYLES, variant_slug
 
-def process_jsonl_file(file_path):
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows
+from mitre_tc.tracing import span
+
+DATABASE_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+BATCH_OUTPUT_PATH = os.path.join('data', 'openai-batches', 'batch_6859b0f79a9c8190bdf0d62ff7903192_output.jsonl')
+TABLE_NAME = 'synthetic_texts_test'
+ROWS_PER_TRANSACTION = 5000
+SYNTHETIC_COLUMNS = ('custom_id', 'technique_id', 'name', 'text', 'technicality', 'style', 'iteration')
+
+VARIANT_LABELS = {variant_slug(technicality, style): (technicality, style)
+                  for technicality in TECHNICALITIES for style in STYLES}
+
+def decode_custom_id(custom_id):
+    """
+    Splits a batch custom_id into its structured fields.
+    The label between the technique ID and the iteration is either a technicality/style variant or,
+    for older batches, the technique name (which may itself contain underscores).
+    Returns a dict with prefix, technique_id, name, technicality, style and iteration, or None if
+    the custom_id does not follow any known layout.
+    """
+    match = CUSTOM_ID_PATTERN.match(custom_id or '')
+    if not match:
+        return None
+    label = match.group('label')
+    technicality, style = VARIANT_LABELS.get(label, (None, None))
+    return {
+        'prefix': match.group('prefix'),
+        'technique_id': match.group('technique_id'),
+        'name': None if technicality or not label else label,
+        'technicality': technicality,
+        'style': style,
+        'iteration': int(match.group('iteration')),
+    }
+
+def extract_message_content(data):
+    """
+    Returns the first non-empty assistant message in a batch output line, or None for failed requests.
+    """
+    response = data.get("response") or {}
+    if response.get("status_code", 200) != 200:
+        return None
+    for choice in (response.get("body") or {}).get("choices") or []:
+        content = (choice.get("message") or {}).get("content")
+        if content:
+            return content
+    return None
+
+def open_ingest_db(db_file, table_name=TABLE_NAME):
+    """
+    Opens the connection used for the whole ingest and makes sure the synthetic text table has the
+    structured custom_id columns, with a unique index on custom_id so reruns are idempotent.
     """
-    Loads a JSON Lines (JSONL) file, extracts custom_id and message content
-    from each line, and prints them.
+    db = connect(db_file)
+    ensure_schema(db, (table_name,), kind='synthetic_texts')
+    return db
 
-    Args:
-        file_path (str): The path to the JSONL file.
+def load_technique_names(db):
+    """
+    Returns technique_id -> name from mitre_technique_descriptions, used for custom_ids that carry no name.
     """
     try:
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            print(f"Error: File not found at {file_path}")
-            return
-
-        print(f"Processing file: {file_path}")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1): # Enumerate to get line numbers for better error reporting
-                # Skip empty lines
-                if not line.strip():
-                    continue
-
-                try:
-                    # Each line is a separate JSON object
-                    data = json.loads(line.strip()) # .strip() removes leading/trailing whitespace and newlines
-
-                    custom_id = data.get("custom_id")
-                    technique_id = custom_id.split('_')[0] if custom_id else None
-                    technique_name = custom_id.split('_')[1] if custom_id and len(custom_id.split('_')) > 1 else None
-                    message_content = None
-
-                    response = data.get("response")
-                    if response:
-                        body = response.get("body")
-                        if body:
-                            choices = body.get("choices")
-                            if choices and isinstance(choices, list):
-                                for choice in choices:
-                                    message = choice.get("message")
-                                    if message:
-                                        content = message.get("content")
-                                        if content:
-                                            message_content = content
-                                            print(f"  Custom ID: {custom_id}")
-                                            print(f"  Message Content: {message_content}\n")
-                                            add_synthetic_text_to_db('data\\sqlite3\\mitre_data.db', technique_id, technique_name, message_content)
-                                            break
-
-                except json.JSONDecodeError as e:
-                    print(f"  Error decoding JSON on line {line_num} of {file_path}: {e}")
-                    print(f"  Problematic line content: '{line.strip()}'")
-                except Exception as e:
-                    print(f"  An unexpected error occurred on line {line_num}: {e}")
-                    print(f"  Problematic line content: '{line.strip()}'")
-
-    except Exception as e:
-        print(f"An error occurred while opening or processing {file_path}: {e}")
-
-
-def add_synthetic_text_to_db(db_file, technique_id, name, synthetic_text):
+        return dict(db.execute("SELECT technique_id, name FROM mitre_technique_descriptions"))
+    except sqlite3.Error:
+        return {}
+
+def iter_batch_rows(file_path, technique_names, stats):
+    """
+    Streams one batch output file and yields a row tuple per successful response.
+    Malformed lines, unknown custom_ids and failed requests are counted in stats instead of printed.
     """
-    Connects to the SQLite database and adds synthetic text for a given technique.
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                stats['malformed'] += 1
+                print(f"  Error decoding JSON on line {line_num} of {file_path}: {e}")
+                continue
+
+            custom_id = data.get("custom_id")
+            fields = decode_custom_id(custom_id)
+            if fields is None:
+                stats['unknown_id'] += 1
+                print(f"  Unrecognized custom_id on line {line_num} of {file_path}: {custom_id!r}")
+                continue
+
+            content = extract_message_content(data)
+            if content is None:
+                stats['failed'] += 1
+                continue
+
+            stats['read'] += 1
+            name = fields['name'] or technique_names.get(fields['technique_id'])
+            yield (custom_id, fields['technique_id'], name, content,
+                   fields['technicality'], fields['style'], fields['iteration'])
+
+def find_batch_files(paths):
     """
-    db = None
+    Expands directories into the .jsonl files they contain, keeping explicit files as given.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.jsonl'))
+        else:
+            files.append(path)
+    return files
+
+def ingest_batch_files(db_file, paths, table_name=TABLE_NAME, rows_per_transaction=ROWS_PER_TRANSACTION):
+    """
+    Streams batch output files into the synthetic text table over a single connection.
+    Rows are inserted with executemany, one transaction per rows_per_transaction rows, and rows whose
+    custom_id is already stored are skipped, so ingesting the same file twice inserts nothing new.
+    Returns a dict of counts.
+    """
+    stats = {'files': 0, 'read': 0, 'inserted': 0, 'malformed': 0, 'unknown_id': 0, 'failed': 0}
+    db = open_ingest_db(db_file, table_name)
     try:
-        db = sqlite3.connect(db_file)
-        cursor = db.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS synthetic_texts_test (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            technique_id TEXT,
-            name TEXT,
-            text TEXT
-        )
-        """)
-        cursor.execute("INSERT INTO synthetic_texts_test (technique_id, name, text) VALUES (?, ?, ?)", (technique_id, name, synthetic_text))
-        db.commit()
-    except sqlite3.Error as e:
-        print(f"Database error while inserting synthetic text: {e}")
+        technique_names = load_technique_names(db)
+        for file_path in find_batch_files(paths):
+            if not os.path.exists(file_path):
+                print(f"Error: File not found at {file_path}")
+                continue
+            print(f"Processing file: {file_path}")
+            stats['files'] += 1
+            read = stats['read']
+            with span('batch-ingest.file', file=os.path.basename(file_path)) as current:
+                stats['inserted'] += insert_rows(db, table_name, SYNTHETIC_COLUMNS, iter_batch_rows(file_path, technique_names, stats),
+                                                 conflict=('custom_id',), rows_per_transaction=rows_per_transaction)
+                current.add(items=stats['read'] - read, bytes=os.path.getsize(file_path))
     finally:
-        if db:
-            db.close()
+        db.close()
+    return stats
 
 def main():
-    jsonl_file_path = r"data\\openai_batches\\batch_6859b0f79a9c8190bdf0d62ff7903192_output.jsonl"
-    process_jsonl_file(jsonl_file_path)
+    parser = argparse.ArgumentParser(
+        description="Ingest OpenAI batch output files into the synthetic text table."
+    )
+    parser.add_argument(
+        'paths', nargs='*', default=[BATCH_OUTPUT_PATH],
+        help="Batch output .jsonl files or directories containing them."
+    )
+    parser.add_argument(
+        '--db', type=str, default=DATABASE_FILE,
+        help=f"SQLite database file (default: {DATABASE_FILE})."
+    )
+    parser.add_argument(
+        '--table', type=str, default=TABLE_NAME,
+        help=f"Table receiving the synthetic texts (default: {TABLE_NAME})."
+    )
+    parser.add_argument(
+        '--rows-per-transaction', type=int, default=ROWS_PER_TRANSACTION,
+        help=f"Rows inserted per transaction (default: {ROWS_PER_TRANSACTION})."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = ingest_batch_files(args.db, args.paths, args.table, args.rows_per_transaction)
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {stats['files']} file(s) in {elapsed:.2f}s: {stats['read']} responses read, "
+          f"{stats['inserted']} inserted, {stats['read'] - stats['inserted']} already present, "
+          f"{stats['failed']} failed requests, {stats['malformed']} malformed lines, {stats['unknown_id']} unrecognized custom_ids.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,70 +1,251 @@
-import openai
-from dotenv import load_dotenv
 import os
-import sqlite3
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from prompt_variants import (CUSTOM_ID_PREFIX_PATTERN, TECHNICALITIES, STYLES, SYSTEM_MESSAGE, all_variants, variant_slug,
+                             generate_prompt)
 
-# Load environment variables from .env file
-load_dotenv()
-# Set your OpenAI API key from environment variable
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set. Please set it.")
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-client = openai.OpenAI()
+from mitre_tc.db import connect, iter_techniques
+from mitre_tc.tracing import span
 
-DATABASE_FILE = 'data\\sqlite3\\mitre_data.db'  # Replace with your SQLite database file name
+DATABASE_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
 TABLE_NAME = 'mitre_technique_descriptions'
-SYSTEM_MESSAGE = "You are a synthetic data generator that creates realistic reports based on cybersecurity techniques. Your task is to generate an internal company report that describes a scenario related to a specific MITRE ATT&CK technique. The report should be informative, engaging, and relevant to the technique's context. You use semi-technical language to ensure the report is accessible to an audience with cybersecurity awareness but not expertise. The sample should be realistic and relevant to the technique. Do not highlight that this is a synthetic data sample or that the scenario is hypothetical. Do not reference MITRE ATT&CK or any specific cybersecurity terms directly."
+OUTPUT_DIR = 'batchinput'
+CUSTOM_ID_PREFIX = 'prod'
+BATCH_MODEL = 'gpt-4.1-nano'
+ITERATIONS = 1
+MAX_LINES_PER_SHARD = 50000 # OpenAI batch limit on requests per file
+MAX_BYTES_PER_SHARD = 190 * 1024 * 1024 # Kept under the 200 MB batch file limit
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_IDS_FILE = 'manifest-ids.tsv'
+SHARD_PREFIX = 'batchinput-' # Shard files are named batchinput-0000.jsonl, batchinput-0001.jsonl, ...
 
-def get_technique_data(db_file, table_name, technique_name=None):
+def iter_technique_data(db_file, table_name, technique_name=None):
     """
-    Connects to the SQLite database and retrieves technique name and description.
-    If technique_name is provided, it fetches data only for that specific technique.
+    Streams technique_id, name and description rows from the SQLite database without loading them all.
+    If technique_name is provided, only techniques whose ID starts with it are returned.
     """
-    db = None
+    db = connect(db_file)
     try:
-        db = sqlite3.connect(db_file)
-        cursor = db.cursor()
-        if technique_name:
-            # Use LIKE for partial matches and parameter binding for safety
-            cursor.execute(f"SELECT technique_id, name, description FROM {table_name} WHERE technique_id LIKE ?", ('%' + technique_name + '%',))
-        else:
-            cursor.execute(f"SELECT technique_id, name, description FROM {table_name}")
-        return cursor.fetchall()
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return []
+        yield from iter_techniques(db, prefix=technique_name, table=table_name)
     finally:
-        if db:
-            db.close()
+        db.close()
 
-def generate_prompt(technique_id, name, desc):
-    return f"Generate a synthetic internal report paragraph about a scenario pertaining to the MITRE ATT&CK technique with ID {repr(technique_id).replace("\\","\\\\").replace('"','\\\"')}, named '{repr(name).replace("\\","\\\\").replace('"','\\\"')}', which is described as: {repr(desc).replace("\\","\\\\").replace('"','\\\"')}. Use semi-technical language. The sample should be realistic and relevant to the technique. Do not highlight that this is a synthetic data sample or that the scenario is hypothetical. Do not reference MITRE ATT&CK or any specific cybersecurity terms directly."
+def make_custom_id(technique_id, technicality, style, iteration, prefix=CUSTOM_ID_PREFIX):
+    """
+    Returns the custom_id for one request, e.g. 'prod_T1055.011_semi-technical_internal-report_iteration_0'.
+    The batch parser decodes this layout back into its fields.
+    """
+    return f"{prefix}_{technique_id}_{variant_slug(technicality, style)}_iteration_{iteration}"
 
-def generate_batch_input(technique_id, name, desc, system_message, iteration=1):
-    return '{"custom_id": "prod_'+technique_id+'_'+name+'_iteration_'+str(iteration)+'", "method": "POST", "url": "/v1/chat/completions", "body": {"model": "gpt-4.1-nano", "messages": [{"role": "system", "content": "'+system_message+'"},{"role": "user", "content": "'+generate_prompt(technique_id, name, desc)+'"}],"max_tokens": 256, "temperature": 1.2}}'
+def generate_batch_input(technique_id, name, desc, technicality, style, iteration=0, prefix=CUSTOM_ID_PREFIX):
+    """
+    Returns (custom_id, request dict) for one technique, variant and iteration.
+    """
+    custom_id = make_custom_id(technique_id, technicality, style, iteration, prefix)
+    return custom_id, {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": BATCH_MODEL,
+            "messages": [
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": generate_prompt(technique_id, name, desc, technicality, style)},
+            ],
+            "max_tokens": 256,
+            "temperature": 1.2,
+        },
+    }
 
-def main():
-    techniques_to_process = get_technique_data(DATABASE_FILE, TABLE_NAME) 
-    with open('batchinput.jsonl', 'w', encoding='utf-8') as f_out:
-            for i, (technique_id, name, description) in enumerate(techniques_to_process):
-                f_out.write(generate_batch_input(technique_id, name, description, SYSTEM_MESSAGE, i))
-                f_out.write('\n')
-
-    batch_input_file = client.files.create(
-        file=open("batchinput.jsonl", "rb"),
-        purpose="batch"
-    )
+class ShardWriter:
+    """
+    Writes JSONL request lines into numbered shard files, starting a new shard whenever the next
+    line would exceed the line or byte limit.
+    Every custom_id is streamed to a TSV next to the shards so nothing but the current line is held in memory.
+    """
+
+    def __init__(self, output_dir, max_lines=MAX_LINES_PER_SHARD, max_bytes=MAX_BYTES_PER_SHARD):
+        self.output_dir = output_dir
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.current = None
+        os.makedirs(output_dir, exist_ok=True)
+        self.ids_file = open(os.path.join(output_dir, MANIFEST_IDS_FILE), 'w', encoding='utf-8')
 
-    batch_input_file_id = batch_input_file.id
-    client.batches.create(
-        input_file_id=batch_input_file_id,
+    def _open_shard(self):
+        self._close_shard()
+        file_name = f"{SHARD_PREFIX}{len(self.shards):04d}.jsonl"
+        self.current = open(os.path.join(self.output_dir, file_name), 'wb')
+        self.shards.append({"file": file_name, "requests": 0, "bytes": 0})
+
+    def _close_shard(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+
+    def write(self, custom_id, request):
+        line = (json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8')
+        if len(line) > self.max_bytes:
+            raise ValueError(f"Request {custom_id} is {len(line)} bytes, larger than the shard limit of {self.max_bytes}.")
+        shard = self.shards[-1] if self.shards else None
+        if shard is None or shard["requests"] >= self.max_lines or shard["bytes"] + len(line) > self.max_bytes:
+            self._open_shard()
+            shard = self.shards[-1]
+        self.current.write(line)
+        shard["requests"] += 1
+        shard["bytes"] += len(line)
+        self.ids_file.write(f"{custom_id}\t{shard['file']}\n")
+
+    def close(self):
+        self._close_shard()
+        self.ids_file.close()
+
+    def remove_stale_shards(self):
+        """
+        Deletes shard files left in the output directory by an earlier, larger build, so the directory
+        holds exactly the shards of the new manifest. Returns the number of files deleted.
+        """
+        current = {shard["file"] for shard in self.shards}
+        stale = [name for name in os.listdir(self.output_dir)
+                 if name.startswith(SHARD_PREFIX) and name.endswith('.jsonl') and name not in current]
+        for name in stale:
+            os.remove(os.path.join(self.output_dir, name))
+        return len(stale)
+
+def build_batch_inputs(techniques, variants, iterations, output_dir, max_lines=MAX_LINES_PER_SHARD,
+                       max_bytes=MAX_BYTES_PER_SHARD, prefix=CUSTOM_ID_PREFIX):
+    """
+    Writes one request per (technique, variant, iteration) in a single streaming pass over techniques,
+    sharding the output and writing manifest.json describing each shard.
+    Returns the manifest dict.
+    """
+    writer = ShardWriter(output_dir, max_lines, max_bytes)
+    try:
+        for technique_id, name, description in techniques:
+            with span('batch-build.technique', technique_id=technique_id) as current:
+                written = sum(shard["bytes"] for shard in writer.shards)
+                for technicality, style in variants:
+                    for iteration in range(iterations):
+                        writer.write(*generate_batch_input(technique_id, name, description, technicality, style, iteration, prefix))
+                current.add(items=len(variants) * iterations, bytes=sum(shard["bytes"] for shard in writer.shards) - written)
+    finally:
+        writer.close()
+    stale = writer.remove_stale_shards()
+    if stale:
+        print(f"Removed {stale} stale shard(s) of an earlier build from {output_dir}")
+
+    manifest = {
+        "model": BATCH_MODEL,
+        "prefix": prefix,
+        "variants": [variant_slug(technicality, style) for technicality, style in variants],
+        "iterations": iterations,
+        "ids_file": MANIFEST_IDS_FILE,
+        "shards": writer.shards,
+    }
+    write_manifest(output_dir, manifest)
+    return manifest
+
+def write_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+def submit_shard(client, output_dir, shard, description):
+    """
+    Uploads one shard and creates its batch job. Returns the batch ID.
+    """
+    with span('batch-build.upload', file=shard["file"]) as current, open(os.path.join(output_dir, shard["file"]), "rb") as f:
+        batch_input_file = client.files.create(file=f, purpose="batch")
+        current.add(items=shard["requests"], bytes=shard["bytes"])
+    batch = client.batches.create(
+        input_file_id=batch_input_file.id,
         endpoint="/v1/chat/completions",
         completion_window="24h",
         metadata={
-            "description": "prod_common_speech"
+            "description": description,
+            "shard": shard["file"],
         }
     )
+    return batch.id
+
+def submit_batches(output_dir, description, workers=4):
+    """
+    Submits every shard in the manifest that has no batch ID yet, several at a time,
+    and records the batch IDs back into the manifest.
+    """
+    # Imported here so building shards does not pay for the OpenAI client
+    import openai
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    if not openai.api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set. Please set it.")
+    client = openai.OpenAI()
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    pending = [shard for shard in manifest["shards"] if not shard.get("batch_id")]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch_ids = executor.map(lambda shard: submit_shard(client, output_dir, shard, description), pending)
+        for shard, batch_id in zip(pending, batch_ids):
+            shard["batch_id"] = batch_id
+            print(f"Submitted {shard['file']} ({shard['requests']} requests) as {batch_id}")
+    write_manifest(output_dir, manifest)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build sharded OpenAI batch input files for every technique, variant and iteration."
+    )
+    parser.add_argument('--db', type=str, default=DATABASE_FILE,
+                        help=f"SQLite database file (default: {DATABASE_FILE}).")
+    parser.add_argument('-t', '--technique', type=str,
+                        help="Optional: Only build requests for technique IDs starting with this value.")
+    parser.add_argument('--technicality', choices=list(TECHNICALITIES), action='append',
+                        help="Optional: Technicality level(s) to include. Repeat to select several; defaults to all three.")
+    parser.add_argument('--style', choices=list(STYLES), action='append',
+                        help="Optional: Style(s) to include. Repeat to select several; defaults to all three.")
+    parser.add_argument('-n', '--iterations', type=int, default=ITERATIONS,
+                        help=f"Requests per technique and variant (default: {ITERATIONS}).")
+    parser.add_argument('-o', '--output-dir', type=str, default=OUTPUT_DIR,
+                        help=f"Directory receiving the shards and manifest (default: {OUTPUT_DIR}).")
+    parser.add_argument('--max-lines', type=int, default=MAX_LINES_PER_SHARD,
+                        help=f"Maximum requests per shard (default: {MAX_LINES_PER_SHARD}).")
+    parser.add_argument('--max-bytes', type=int, default=MAX_BYTES_PER_SHARD,
+                        help=f"Maximum bytes per shard (default: {MAX_BYTES_PER_SHARD}).")
+    parser.add_argument('--prefix', type=str, default=CUSTOM_ID_PREFIX,
+                        help=f"Prefix of every custom_id (default: {CUSTOM_ID_PREFIX}).")
+    parser.add_argument('--changes', type=str,
+                        help="Optional: Change set from mitre-stix-diff.py; only affected techniques are included.")
+    parser.add_argument('--submit', action='store_true',
+                        help="Upload the shards and create one batch job per shard after building.")
+    parser.add_argument('--submit-only', action='store_true',
+                        help="Skip building and submit the shards of an existing manifest that have no batch ID yet.")
+    args = parser.parse_args()
+    if not CUSTOM_ID_PREFIX_PATTERN.fullmatch(args.prefix):
+        parser.error("--prefix must start with a letter and hold only letters, digits and hyphens, "
+                     "or the batch parser cannot read the custom_ids back")
+
+    if not args.submit_only:
+        techniques = iter_technique_data(args.db, TABLE_NAME, args.technique)
+        if args.changes:
+            with open(args.changes, 'r', encoding='utf-8') as f:
+                changed_ids = set(json.load(f)['affected_technique_ids'])
+            techniques = (row for row in techniques if row[0] in changed_ids)
+        variants = all_variants(args.technicality, args.style)
+        manifest = build_batch_inputs(techniques, variants, args.iterations, args.output_dir,
+                                      args.max_lines, args.max_bytes, args.prefix)
+        total = sum(shard["requests"] for shard in manifest["shards"])
+        print(f"Wrote {total} requests into {len(manifest['shards'])} shard(s) in {args.output_dir}")
+
+    if args.submit or args.submit_only:
+        submit_batches(args.output_dir, f"{args.prefix}_variants")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
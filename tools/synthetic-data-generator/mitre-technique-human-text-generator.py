@@ -1,41 +1,43 @@
 import sqlite3
-import openai
 import os
-from dotenv import load_dotenv
+import sys
 import time
 import argparse # Import the argparse module
+import asyncio
+import random
+import json
+from prompt_variants import TECHNICALITIES, STYLES, SYSTEM_MESSAGE, all_variants, generate_prompt
 
-# Load environment variables from .env file
-load_dotenv()
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import connect, ensure_schema, insert_rows, iter_techniques
+from mitre_tc.tracing import span
 
 # --- Configuration ---
-DATABASE_FILE = 'data\\sqlite3\\mitre_data.db'  # Replace with your SQLite database file name
+DATABASE_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
 TABLE_NAME = 'mitre_technique_descriptions'
 OUTPUT_FILE = 'synthetic_data.txt'
 OPENAI_MODEL = "gpt-3.5-turbo" # Or "gpt-4" if you have access and prefer higher quality
-REQUEST_DELAY = 0.1 # Delay in seconds between OpenAI API calls to avoid rate limits
-
-# Set your OpenAI API key from environment variable
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set. Please set it.")
+ITERATIONS = 3 # Samples generated per technique and variant
+CONCURRENCY = 16 # Maximum number of requests in flight
+REQUESTS_PER_MINUTE = 500 # Request budget enforced by the rate limiter
+TOKENS_PER_MINUTE = 200000 # Token budget enforced by the rate limiter
+MAX_TOKENS = 2000 # Completion token limit per request
+MAX_RETRIES = 6 # Attempts per request before it is given up
+BACKOFF_BASE = 1.0 # Seconds; doubled on every retry and jittered
+BACKOFF_CAP = 60.0 # Upper bound on a single backoff delay
 
 # --- Database Interaction ---
-def get_technique_data(db_file, table_name, technique_name=None):
+def get_technique_data(db_file, table_name, technique_id=None):
     """
     Connects to the SQLite database and retrieves technique name and description.
-    If technique_name is provided, it fetches data only for that specific technique.
+    If technique_id is provided, it fetches only that technique and its sub-techniques (IDs starting with it).
     """
     db = None
     try:
-        db = sqlite3.connect(db_file)
-        cursor = db.cursor()
-        if technique_name:
-            # Use LIKE for partial matches and parameter binding for safety
-            cursor.execute(f"SELECT technique_id, name, description FROM {table_name} WHERE technique_id LIKE ?", ('%' + technique_name + '%',))
-        else:
-            cursor.execute(f"SELECT technique_id, name, description FROM {table_name}")
-        return cursor.fetchall()
+        db = connect(db_file)
+        return list(iter_techniques(db, prefix=technique_id, table=table_name))
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return []
@@ -43,65 +45,232 @@ def get_technique_data(db_file, table_name, technique_name=None):
         if db:
             db.close()
 
-def add_synthetic_text_to_db(db_file, technique_id, name, synthetic_text):
+def open_generation_db(db_file):
     """
-    Connects to the SQLite database and adds synthetic text for a given technique.
+    Opens one connection for the whole generation run and makes sure synthetic_texts can record
+    which variant and iteration each row belongs to.
+    Rows written before variants existed keep NULL in those columns.
     """
-    db = None
-    try:
-        db = sqlite3.connect(db_file)
-        cursor = db.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS synthetic_texts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            technique_id TEXT,
-            name TEXT,
-            text TEXT
-        )
-        """)
-        cursor.execute("INSERT INTO synthetic_texts (technique_id, name, text) VALUES (?, ?, ?)", (technique_id, name, synthetic_text))
-        db.commit()
-    except sqlite3.Error as e:
-        print(f"Database error while inserting synthetic text: {e}")
-    finally:
-        if db:
-            db.close()
+    db = connect(db_file)
+    ensure_schema(db, ('synthetic_texts',))
+    return db
+
+def get_completed_jobs(db):
+    """
+    Returns the set of (technique_id, technicality, style, iteration) combinations already stored and not
+    superseded.
+    """
+    rows = db.execute("""
+    SELECT technique_id, technicality, style, iteration FROM synthetic_texts
+    WHERE technicality IS NOT NULL AND style IS NOT NULL AND iteration IS NOT NULL AND superseded = 0
+    """)
+    return set(rows)
+
+def load_changed_technique_ids(changes_file):
+    """
+    Reads the technique IDs affected by an ATT&CK release from a change set written by mitre-stix-diff.py.
+    """
+    with open(changes_file, 'r', encoding='utf-8') as f:
+        return set(json.load(f)['affected_technique_ids'])
+
+def supersede_variant_texts(db, technique_ids):
+    """
+    Marks the variant texts of the given techniques as superseded so they are regenerated from the new
+    descriptions. The old texts stay in place until each one's replacement is stored, so an interrupted or
+    failed run loses nothing. A technique that still has superseded texts from an interrupted run is left
+    as it is, so rerunning resumes instead of superseding the texts already regenerated.
+    Returns the number of rows marked.
+    """
+    before = db.total_changes
+    with db:
+        db.executemany("""
+        UPDATE synthetic_texts SET superseded = 1
+        WHERE technique_id = ? AND technicality IS NOT NULL AND superseded = 0
+          AND NOT EXISTS (SELECT 1 FROM synthetic_texts WHERE technique_id = ? AND superseded = 1)
+        """, ((technique_id, technique_id) for technique_id in technique_ids))
+    return db.total_changes - before
+
+def drop_superseded_texts(db, technique_ids):
+    """
+    Deletes the remaining superseded texts of techniques whose regeneration has completed, such as texts of
+    variants or iterations no longer generated. Returns the number of deleted rows.
+    """
+    before = db.total_changes
+    with db:
+        db.executemany("DELETE FROM synthetic_texts WHERE technique_id = ? AND superseded = 1",
+                       ((technique_id,) for technique_id in technique_ids))
+    return db.total_changes - before
+
+# --- Rate Limiting ---
+class RateLimiter:
+    """
+    Token-bucket limiter enforcing both a requests-per-minute and a tokens-per-minute budget.
+    Each acquire() waits until one request and the estimated number of tokens are available.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.request_capacity = requests_per_minute
+        self.token_capacity = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_capacity / 60.0)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_capacity / 60.0)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.token_capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max((1 - self.requests) * 60.0 / self.request_capacity,
+                           (tokens - self.tokens) * 60.0 / self.token_capacity)
+                await asyncio.sleep(max(wait, 0.01))
+
+    def refund(self, tokens):
+        """
+        Returns over-estimated tokens to the bucket once the real usage of a request is known.
+        """
+        if tokens > 0:
+            self.tokens = min(self.token_capacity, self.tokens + tokens)
+
+def estimate_tokens(messages, max_tokens):
+    # Roughly four characters per token for English prompts, plus the completion budget
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
 
 # --- OpenAI Interaction ---
-def generate_synthetic_text(technique_name, technique_description, num_samples=1):
+def load_api_key():
     """
-    Generates synthetic text based on the technique name and description using OpenAI.
+    Loads the OpenAI API key from the environment or a .env file.
+    dotenv and the OpenAI client are imported where they are used, so --help and argument errors stay fast.
     """
-    prompt = (
-        f"Generate a distinct and realistic paragraph resembling a very technical news article "
-        f"that describe a hypothetical, realistic scenario where the MITRE ATT&CK technique '{technique_name}' is present. "
-        f"The description of the technique '{technique_name}' is: \n\n"
-        f"'{technique_description}'\n\n"
-        f"Do not reference MITRE ATT&CK or any specific cybersecurity terms directly. "
-        f"Do not include the fact that the text is hypothetical or fictional. "
-    )
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv()
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY environment variable not set. Please set it.")
+
+def backoff_delay(attempt, error=None):
+    """
+    Returns the delay before retry number attempt: exponential with full jitter, or the
+    server's Retry-After header when one was sent.
+    """
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+async def request_completion(client, limiter, messages, max_tokens=MAX_TOKENS):
+    """
+    Sends one chat completion request through the rate limiter, retrying transient failures with jittered backoff.
+    Returns the generated text, or None if every attempt failed or returned no text.
+    """
+    import openai
+    retryable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+    estimate = estimate_tokens(messages, max_tokens)
+    for attempt in range(MAX_RETRIES):
+        with span('generate.rate_limit'):
+            await limiter.acquire(estimate)
+        try:
+            with span('generate.request', attempt=attempt) as current:
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=1.2,
+                    max_tokens=max_tokens,
+                )
+                current.add(items=1)
+                if response.usage is not None:
+                    current.add(tokens=response.usage.total_tokens)
+            if response.usage is not None:
+                limiter.refund(estimate - response.usage.total_tokens)
+            content = response.choices[0].message.content if response.choices else None
+            if content and content.strip():
+                return content.strip()
+            # An empty completion (e.g. a content filter stop) counts as a failed attempt
+            delay = backoff_delay(attempt)
+            print(f"Retrying after an empty completion (attempt {attempt + 1}/{MAX_RETRIES}, waiting {delay:.1f}s)")
+            await asyncio.sleep(delay)
+        except retryable_errors as e:
+            delay = backoff_delay(attempt, e)
+            print(f"Retrying after {type(e).__name__} (attempt {attempt + 1}/{MAX_RETRIES}, waiting {delay:.1f}s)")
+            await asyncio.sleep(delay)
+        except openai.APIError as e:
+            print(f"OpenAI API error: {e}")
+            return None
+    return None
+
+async def generate_all(techniques, variants, iterations, db, f_out, concurrency=CONCURRENCY,
+                       requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, base_url=None):
+    """
+    Generates synthetic texts for every (technique, variant, iteration) combination not yet in the database.
+    Requests run concurrently up to the concurrency limit; each result is committed as soon as it
+    arrives so an interrupted run resumes where it stopped.
+    Returns (generated, skipped, failed) counts.
+    """
+    completed = get_completed_jobs(db)
+    jobs = [(technique_id, name, description, technicality, style, iteration)
+            for technique_id, name, description in techniques
+            for technicality, style in variants
+            for iteration in range(iterations)
+            if (technique_id, technicality, style, iteration) not in completed]
+    skipped = len(techniques) * len(variants) * iterations - len(jobs)
+    print(f"{len(jobs)} generation job(s) queued, {skipped} already stored.")
+
+    import openai
+    client = openai.AsyncOpenAI(base_url=base_url, max_retries=0)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {'generated': 0, 'failed': 0}
+
+    async def run_job(technique_id, name, description, technicality, style, iteration):
+        # An unexpected error fails this job only; the other jobs keep running
+        try:
+            messages = [
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": generate_prompt(technique_id, name, description, technicality, style)},
+            ]
+            async with semaphore:
+                text = await request_completion(client, limiter, messages)
+        except Exception as e:
+            print(f"Unexpected {type(e).__name__} for '{name}' ({technicality}, {style}, iteration {iteration}): {e}")
+            text = None
+        if not text:
+            counts['failed'] += 1
+            print(f"Could not generate synthetic text for '{name}' ({technicality}, {style}, iteration {iteration}).")
+            return
+        # Writes happen on the event loop thread, so the shared connection is never used concurrently. The new
+        # text replaces a superseded one of the same variant and iteration in one transaction
+        with db:
+            insert_rows(db, 'synthetic_texts', ('technique_id', 'name', 'text', 'technicality', 'style', 'iteration'),
+                        [(technique_id, name, text, technicality, style, iteration)], rows_per_transaction=None)
+            db.execute("DELETE FROM synthetic_texts WHERE technique_id = ? AND technicality = ? AND style = ? "
+                       "AND iteration = ? AND superseded = 1", (technique_id, technicality, style, iteration))
+        f_out.write(f"--- MITRE Technique: {technique_id} - {name} ({technicality}, {style}) ---\n")
+        f_out.write(f"{text}\n\n")
+        counts['generated'] += 1
+        if counts['generated'] % 50 == 0:
+            print(f"Generated {counts['generated']}/{len(jobs)} texts")
 
     try:
-        response = openai.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant specialized in cybersecurity and MITRE ATT&CK techniques."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1.2, # Adjust for creativity; lower values are more deterministic
-            max_tokens=2000, # Adjust as needed
-            stop=["---END_GENERATION---"] # Optional: to ensure the model stops
-        )
-        generated_content = response.choices[0].message.content.strip()
-        # Split by the delimiter and filter out any empty strings
-        synthetic_texts = [text.strip() for text in generated_content.split('---NEW_TEXT_BLOCK---') if text.strip()]
-        return synthetic_texts
-    except openai.APIError as e:
-        print(f"OpenAI API error: {e}")
-        return []
-    except Exception as e:
-        print(f"An unexpected error occurred with OpenAI: {e}")
-        return []
+        await asyncio.gather(*(run_job(*job) for job in jobs))
+    finally:
+        await client.close()
+    return counts['generated'], skipped, counts['failed']
 
 # --- Main Execution ---
 def main():
@@ -110,44 +279,98 @@ def main():
     )
     parser.add_argument(
         '-t', '--technique', type=str,
-        help="Optional: Specify a specific technique name (or partial name) to process."
+        help="Optional: Technique ID to process, e.g. T1059; its sub-techniques (T1059.001, ...) are included."
+    )
+    parser.add_argument(
+        '--technicality', choices=list(TECHNICALITIES), action='append',
+        help="Optional: Technicality level(s) to generate. Repeat to select several; defaults to all three."
+    )
+    parser.add_argument(
+        '--style', choices=list(STYLES), action='append',
+        help="Optional: Style(s) to generate. Repeat to select several; defaults to all three."
+    )
+    parser.add_argument(
+        '-n', '--iterations', type=int, default=ITERATIONS,
+        help=f"Samples per technique and variant (default: {ITERATIONS})."
+    )
+    parser.add_argument(
+        '-c', '--concurrency', type=int, default=CONCURRENCY,
+        help=f"Maximum number of concurrent requests (default: {CONCURRENCY})."
+    )
+    parser.add_argument(
+        '--rpm', type=int, default=REQUESTS_PER_MINUTE,
+        help=f"Requests-per-minute limit (default: {REQUESTS_PER_MINUTE})."
+    )
+    parser.add_argument(
+        '--tpm', type=int, default=TOKENS_PER_MINUTE,
+        help=f"Tokens-per-minute limit (default: {TOKENS_PER_MINUTE})."
+    )
+    parser.add_argument(
+        '--changes', type=str,
+        help="Optional: Change set from mitre-stix-diff.py; only affected techniques are regenerated. Their old texts are kept until replaced."
+    )
+    parser.add_argument(
+        '--base-url', type=str, default=None,
+        help="Optional: Alternative API base URL, e.g. http://127.0.0.1:8000/v1 for the stub server."
+    )
+
+    parser.add_argument(
+        '--db', type=str, default=DATABASE_FILE,
+        help=f"SQLite database file (default: {DATABASE_FILE})."
     )
 
     args = parser.parse_args()
+    for option, value in (('--concurrency', args.concurrency), ('--rpm', args.rpm), ('--tpm', args.tpm)):
+        if value < 1:
+            parser.error(f"{option} must be at least 1")
+    load_api_key()
 
     # Determine which techniques to process
-    techniques_to_process = get_technique_data(DATABASE_FILE, TABLE_NAME, args.technique)
+    techniques_to_process = get_technique_data(args.db, TABLE_NAME, args.technique)
 
     if not techniques_to_process:
         if args.technique:
-            print(f"No technique found matching '{args.technique}' or an error occurred. Please check the technique name.")
+            print(f"No technique found matching '{args.technique}' or an error occurred. Please check the technique ID.")
         else:
             print("No data found in the table or an error occurred. Exiting.")
         return
 
+    if args.changes:
+        changed_ids = load_changed_technique_ids(args.changes)
+        techniques_to_process = [row for row in techniques_to_process if row[0] in changed_ids]
+        if not techniques_to_process:
+            print("No techniques in the change set need regeneration. Exiting.")
+            return
+
+    variants = all_variants(args.technicality, args.style)
     print(f"Found {len(techniques_to_process)} technique(s) to process.")
-    print(f"Generating synthetic text blocks for each selected technique.")
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out:
-        for i, (technique_id, name, description) in enumerate(techniques_to_process):
-            print(f"Processing technique {i+1}/{len(techniques_to_process)}: {name}")
-            
-            synthetic_texts = []
-            for j in range(3):
-                synthetic_texts.append(generate_synthetic_text(name, description)[0])
-            
-            if synthetic_texts:
-                for j, s_text in enumerate(synthetic_texts):
-                    f_out.write(f"--- MITRE Technique: {technique_id} - {name} ---\n")
-                    f_out.write(f"{s_text}\n\n")
-                    add_synthetic_text_to_db(DATABASE_FILE, technique_id, name, s_text)
-            else:
-                print(f"Could not generate synthetic text for '{name}'.")
-            
-            # Add a small delay to avoid hitting API rate limits
-            time.sleep(REQUEST_DELAY)
-
-    print(f"\nSynthetic text generation complete. Output saved to {OUTPUT_FILE}")
+    print(f"Generating {args.iterations} sample(s) for each of {len(variants)} variant(s) per technique.")
+
+    db = open_generation_db(args.db)
+    try:
+        if args.changes:
+            marked = supersede_variant_texts(db, [row[0] for row in techniques_to_process])
+            print(f"Marked {marked} outdated text(s) of changed techniques for regeneration.")
+        # Append so that texts from an interrupted run are kept alongside the resumed ones
+        with open(OUTPUT_FILE, 'a', encoding='utf-8') as f_out:
+            generated, skipped, failed = asyncio.run(generate_all(
+                techniques_to_process, variants, args.iterations, db, f_out,
+                concurrency=args.concurrency, requests_per_minute=args.rpm,
+                tokens_per_minute=args.tpm, base_url=args.base_url
+            ))
+        if args.changes:
+            # Only techniques with every job stored drop their leftover superseded texts
+            completed = get_completed_jobs(db)
+            finished = [technique_id for technique_id, _, _ in techniques_to_process
+                        if all((technique_id, technicality, style, iteration) in completed
+                               for technicality, style in variants for iteration in range(args.iterations))]
+            dropped = drop_superseded_texts(db, finished)
+            if dropped:
+                print(f"Removed {dropped} superseded text(s) of {len(finished)} fully regenerated technique(s).")
+    finally:
+        db.close()
+
+    print(f"\nSynthetic text generation complete: {generated} generated, {skipped} skipped, {failed} failed. Output saved to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
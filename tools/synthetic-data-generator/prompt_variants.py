@@ -0,0 +1,58 @@
+import itertools
+import re
+
+# --- Variant Definitions ---
+# Three degrees of technicality crossed with three styles, as laid out in the README
+TECHNICALITIES = {
+    'non-technical': "Use plain, non-technical language that someone without a cybersecurity background can follow.",
+    'semi-technical': "Use semi-technical language that is accessible to an audience with cybersecurity awareness but not expertise.",
+    'technical': "Use precise, technical language aimed at experienced security practitioners.",
+}
+
+STYLES = {
+    'conversation': "a realistic conversation between coworkers",
+    'news article': "a paragraph from a news article",
+    'internal report': "a paragraph from an internal company report",
+}
+
+# custom_id layouts seen so far; the batch builder writes the last one and the batch parser reads all three:
+#   T1055.011_iteration_0
+#   prod_T1055.011_Extra Window Memory Injection_iteration_0
+#   prod_T1055.011_semi-technical_internal-report_iteration_0
+CUSTOM_ID_PREFIX_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9-]*')
+CUSTOM_ID_PATTERN = re.compile(
+    rf'^(?:(?P<prefix>{CUSTOM_ID_PREFIX_PATTERN.pattern})_)?(?P<technique_id>T\d{{4}}(?:\.\d{{3}})?)(?:_(?P<label>.*?))?_iteration_(?P<iteration>\d+)$'
+)
+
+SYSTEM_MESSAGE = (
+    "You are a synthetic data generator that creates realistic texts based on cybersecurity techniques. "
+    "The sample should be realistic and relevant to the technique. "
+    "Do not highlight that this is a synthetic data sample or that the scenario is hypothetical. "
+    "Do not reference MITRE ATT&CK or any specific cybersecurity terms directly."
+)
+
+def all_variants(technicalities=None, styles=None):
+    """
+    Returns the list of (technicality, style) pairs to generate, defaulting to the full 3x3 matrix.
+    """
+    return list(itertools.product(technicalities or TECHNICALITIES, styles or STYLES))
+
+def variant_slug(technicality, style):
+    """
+    Returns a compact identifier for a variant, e.g. 'semi-technical_internal-report'.
+    """
+    return f"{technicality}_{style.replace(' ', '-')}"
+
+def generate_prompt(technique_id, name, description, technicality, style):
+    """
+    Builds the user prompt for one technique in one technicality/style variant.
+    """
+    return (
+        f"Generate {STYLES[style]} describing a scenario pertaining to the MITRE ATT&CK technique "
+        f"with ID '{technique_id}', named '{name}', which is described as:\n\n"
+        f"'{description}'\n\n"
+        f"{TECHNICALITIES[technicality]} "
+        f"The sample should be realistic and relevant to the technique. "
+        f"Do not highlight that this is a synthetic data sample or that the scenario is hypothetical. "
+        f"Do not reference MITRE ATT&CK or any specific cybersecurity terms directly."
+    )
@@ -0,0 +1,110 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint, used to exercise the generators without
+network access or API spend.
+
+Example:
+    python tools/synthetic-data-generator/stub-chat-completions-server.py --port 8000 --fail-rate 0.1
+    OPENAI_API_KEY=stub python tools/synthetic-data-generator/mitre-technique-human-text-generator.py --base-url http://127.0.0.1:8000/v1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubState:
+    """
+    Settings and counters shared by all handler threads.
+    """
+
+    def __init__(self, latency=0.05, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    state = None
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        with self.state.lock:
+            self.state.requests += 1
+            fail = random.random() < self.state.fail_rate
+            if fail:
+                self.state.failures += 1
+        time.sleep(self.state.latency)
+
+        if fail:
+            # Alternate between the two transient errors the generators must retry
+            if random.random() < 0.5:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0.1"})
+            else:
+                self._send_json(500, {"error": {"message": "Internal server error", "type": "server_error"}})
+            return
+
+        prompt = request.get('messages', [{}])[-1].get('content', '')
+        content = f"Stub completion {uuid.uuid4().hex[:8]} for: {prompt[:80]}"
+        prompt_tokens = sum(len(m.get('content', '')) for m in request.get('messages', [])) // 4
+        completion_tokens = len(content) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'stub'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(host='127.0.0.1', port=0, latency=0.05, fail_rate=0.0):
+    """
+    Creates (but does not start) a stub server; port 0 picks a free port.
+    The bound address is available as server.server_address.
+    """
+    handler = type('Handler', (ChatCompletionsHandler,), {'state': StubState(latency, fail_rate)})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub OpenAI chat-completions endpoint for local testing.")
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds each response is delayed (default: 0.05).")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 429/500 (default: 0).")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.fail_rate)
+    print(f"Stub chat-completions server listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = server.RequestHandlerClass.state
+        print(f"Served {state.requests} request(s), {state.failures} injected failure(s).")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
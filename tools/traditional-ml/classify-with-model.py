@@ -0,0 +1,61 @@
+import argparse
+import sqlite3
+import time
+from ml_features import BACKENDS, CACHE_FILE, DB_FILE, SOURCES, load_query_features
+from model_zoo import MODELS_DIR, iter_model_top_k, load_model
+from scoring import CHUNK_SIZE, TOP_K, write_top_k
+
+THRESHOLD = 0.5 # Minimum top-1 score for a text to count as classified
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Classify embedded texts with a model saved by train-models.py and write a top-k CSV in the "
+                    "format of cosine-similarity.py --output. Every text of the source is classified, labelled or not, and "
+                    "the row_id column holds the text's rowid in its source table."
+    )
+    parser.add_argument('model', help="Saved model name, e.g. logistic-regression.")
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help="Top-k CSV file to write.")
+    parser.add_argument('--version', type=int,
+                        help="Optional: Model version to load (default: the latest).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file (default: {DB_FILE}).")
+    parser.add_argument('--store', type=str,
+                        help="Optional: Embedding store written by bulk-embed.py to classify, instead of --source.")
+    parser.add_argument('--source', choices=list(SOURCES), default='synthetic',
+                        help="Text source whose vectors are read from --cache (default: synthetic).")
+    parser.add_argument('--cache', type=str, default=CACHE_FILE,
+                        help=f"Embedding cache file read by --source (default: {CACHE_FILE}).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend whose cached vectors are read (default: torch).")
+    parser.add_argument('--models-dir', type=str, default=MODELS_DIR,
+                        help=f"Directory holding the saved models (default: {MODELS_DIR}).")
+    parser.add_argument('-k', '--top-k', type=int, default=TOP_K,
+                        help=f"Number of techniques written per text (default: {TOP_K}).")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"Minimum top-1 score (probability, or decision value for models without one) for a text to pass (default: {THRESHOLD}).")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f"Texts scored per batch (default: {CHUNK_SIZE}).")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    try:
+        model, technique_ids, meta = load_model(args.model, args.version, args.models_dir)
+        features, rowids, info = load_query_features(args.db, args.store, args.source, args.backend, args.cache)
+    except (OSError, LookupError, ValueError, sqlite3.Error) as e:
+        parser.error(str(e))
+    if info['encoder'] != meta['features']['encoder']:
+        parser.error(f"{args.model} v{meta['version']} was trained on {meta['features']['encoder']} vectors, "
+                     f"but these come from {info['encoder']}.")
+
+    start = time.perf_counter()
+    chunks = iter_model_top_k(model, features, args.top_k, args.chunk_size)
+    count = write_top_k(technique_ids, chunks, args.output, min(args.top_k, len(technique_ids)), args.threshold,
+                        query_ids=rowids)
+    elapsed = time.perf_counter() - start
+    print(f"Classified {count} {info['source']} texts with {args.model} v{meta['version']} in {elapsed:.2f}s; "
+          f"top-{args.top_k} written to {args.output}")
+
+if __name__ == "__main__":
+    main()
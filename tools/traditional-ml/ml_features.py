@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+import numpy as np
+
+# The embedding cache, store and scoring modules live with the cosine-similarity tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cosine-similarity'))
+
+from bulk_embed import JOB_FILE, ROW_IDS_FILE, SOURCES, iter_source_chunks
+from embedding_cache import CACHE_FILE, EmbeddingCache
+from embedding_store import EmbeddingStore
+from encoder_backends import BACKENDS, MODEL_NAME, cache_model_name
+
+# The shared database layer lives in the mitre_tc package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mitre_tc.db import active_techniques, connect
+
+DB_FILE = os.path.join('data', 'sqlite3', 'mitre_data.db')
+LABEL_QUERIES = {
+    # source: query returning (rowid, technique_id) for the rows of the source table
+    'techniques': "SELECT rowid, technique_id FROM mitre_technique_descriptions WHERE {active}",
+    'synthetic': "SELECT rowid, technique_id FROM synthetic_texts_test",
+    'variants': "SELECT rowid, technique_id FROM synthetic_texts",
+    # An article cited by several techniques is labelled with the first of them
+    'articles': """
+    SELECT t.rowid, MIN(a.technique_id)
+    FROM cited_article_texts t JOIN cited_articles a ON a.content_sha256 = t.content_sha256
+    GROUP BY t.rowid
+    """,
+}
+
+def load_labels(db_file, source):
+    """
+    Returns rowid -> technique_id for the labelled rows of a source.
+    """
+    db = connect(db_file)
+    try:
+        query = LABEL_QUERIES[source].format(active=active_techniques(db)) if source == 'techniques' else LABEL_QUERIES[source]
+        return {rowid: technique_id for rowid, technique_id in db.execute(query) if technique_id}
+    finally:
+        db.close()
+
+def label_rows(features, rowids, labels):
+    """
+    Returns (features, technique_ids) for the rows whose rowid has a label, in their original order.
+    """
+    technique_ids = np.array([labels.get(rowid) for rowid in rowids.tolist()], dtype=object)
+    keep = np.array([technique_id is not None for technique_id in technique_ids], dtype=bool)
+    if keep.all():
+        return features, technique_ids
+    return features[keep], technique_ids[keep]
+
+def read_store(store_dir):
+    """
+    Opens an embedding store written by bulk-embed.py.
+    Float32 stores are read as a view of the memory-mapped vector file, so nothing is copied or re-encoded;
+    float16 and int8 stores are dequantized once.
+    Returns (features, source rowids, info) for every stored row, where info records where the features came from.
+    """
+    with open(os.path.join(store_dir, JOB_FILE), 'r', encoding='utf-8') as f:
+        job = json.load(f)
+    store = EmbeddingStore(store_dir)
+    rowids = np.memmap(os.path.join(store_dir, ROW_IDS_FILE), dtype=np.int64, mode='r', shape=(len(store),))
+    info = {'kind': 'store', 'path': store_dir, 'source': job['source'], 'encoder': job['model'],
+            'layout': store.layout, 'rows': len(store), 'dim': store.dim}
+    return store.vectors(), rowids, info
+
+def read_cache(source, model_name, db_file=DB_FILE, cache_file=CACHE_FILE, rowid_filter=None):
+    """
+    Looks up the vectors of a source's texts in the embedding cache filled by embed-texts.py, keeping only
+    the rows whose rowid is in rowid_filter when one is given.
+    Fails if any of those texts was never encoded with model_name, since no row may be silently dropped.
+    Returns (features, source rowids, info) like read_store.
+    """
+    rowids, keys = [], []
+    with EmbeddingCache(cache_file, model_name=model_name) as cache:
+        for chunk_rowids, texts in iter_source_chunks(db_file, source):
+            for rowid, text in zip(chunk_rowids.tolist(), texts):
+                if rowid_filter is None or rowid in rowid_filter:
+                    rowids.append(rowid)
+                    keys.append(cache.key(text))
+        found = cache.get_many(set(keys))
+    missing = sum(key not in found for key in keys)
+    if missing:
+        raise LookupError(f"{missing} of {len(keys)} {source} texts are not in {cache_file} for {model_name}; "
+                          f"encode them first with embed-texts.py --source {source}, or use a bulk-embed.py store.")
+    if not keys:
+        raise LookupError(f"No {'labelled ' if rowid_filter is not None else ''}{source} texts found in {db_file}.")
+    features = np.vstack([found[key] for key in keys])
+    info = {'kind': 'cache', 'path': cache_file, 'source': source, 'encoder': model_name,
+            'layout': 'float32', 'rows': len(keys), 'dim': int(features.shape[1])}
+    return features, np.array(rowids, dtype=np.int64), info
+
+def load_store_features(store_dir, db_file=DB_FILE):
+    """
+    Opens an embedding store written by bulk-embed.py and labels its rows from the source table.
+    Rows without a technique ID are left out.
+    Returns (features, technique_ids, info) where info records where the features came from.
+    """
+    features, rowids, info = read_store(store_dir)
+    features, technique_ids = label_rows(features, rowids, load_labels(db_file, info['source']))
+    info['rows'] = len(technique_ids)
+    return features, technique_ids, info
+
+def load_cache_features(source, model_name, db_file=DB_FILE, cache_file=CACHE_FILE):
+    """
+    Looks up the vectors of a source's labelled texts in the embedding cache filled by embed-texts.py.
+    Fails if any labelled text was never encoded with model_name, since training must not silently drop rows.
+    Returns (features, technique_ids, info) like load_store_features.
+    """
+    labels = load_labels(db_file, source)
+    features, rowids, info = read_cache(source, model_name, db_file, cache_file, rowid_filter=labels)
+    return features, np.array([labels[rowid] for rowid in rowids.tolist()], dtype=object), info
+
+def load_features(db_file=DB_FILE, store_dir=None, source=None, backend='torch', cache_file=CACHE_FILE):
+    """
+    Loads labelled features from an embedding store when store_dir is given, else the vectors a backend's
+    encoder left in the embedding cache.
+    """
+    if store_dir:
+        return load_store_features(store_dir, db_file)
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source '{source}'. Choose one of {', '.join(SOURCES)}.")
+    return load_cache_features(source, cache_model_name(backend, MODEL_NAME), db_file, cache_file)
+
+def load_query_features(db_file=DB_FILE, store_dir=None, source=None, backend='torch', cache_file=CACHE_FILE):
+    """
+    Loads the features of every row to classify, labelled or not, like load_features.
+    Returns (features, source rowids, info).
+    """
+    if store_dir:
+        return read_store(store_dir)
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source '{source}'. Choose one of {', '.join(SOURCES)}.")
+    return read_cache(source, cache_model_name(backend, MODEL_NAME), db_file, cache_file)
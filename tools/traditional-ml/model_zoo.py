@@ -0,0 +1,301 @@
+import datetime
+import importlib.metadata
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+# The scoring module lives with the cosine-similarity tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cosine-similarity'))
+
+from scoring import CHUNK_SIZE, TOP_K, normalize_embeddings, top_k_rows
+
+MODELS_DIR = os.path.join('data', 'models')
+MODEL_FILE = 'model.joblib'
+META_FILE = 'meta.json'
+MODEL_FORMAT = 1 # Bumped when the saved model layout or meta.json fields change
+FOLDS = 5
+SEED = 42
+REPORTED_PACKAGES = ('numpy', 'scikit-learn', 'joblib', 'xgboost')
+
+# scikit-learn, joblib and xgboost are imported inside the functions that use them, so --help stays fast.
+
+def _logistic_regression():
+    from sklearn.linear_model import LogisticRegression
+    return LogisticRegression(max_iter=300, warm_start=True)
+
+def _linear_svm():
+    from sklearn.svm import LinearSVC
+    # The dual solver is about twice as fast here: each one-vs-rest problem has few positives among many texts
+    return LinearSVC(dual=True)
+
+def _naive_bayes():
+    from sklearn.naive_bayes import GaussianNB
+    return GaussianNB()
+
+def _knn():
+    from sklearn.neighbors import KNeighborsClassifier
+    # Embeddings are unit length, so euclidean neighbours are cosine neighbours; brute force is one matrix product
+    return KNeighborsClassifier(weights='distance', algorithm='brute', n_jobs=1)
+
+def _xgboost():
+    from xgboost import XGBClassifier
+    return XGBClassifier(n_estimators=100, tree_method='hist', n_jobs=1, random_state=SEED)
+
+# name: (estimator factory, parameter grid, parameter walked in ascending order with warm starts, or None)
+MODELS = {
+    'logistic-regression': (_logistic_regression, {'C': [0.1, 1.0, 10.0, 100.0]}, 'C'),
+    'linear-svm': (_linear_svm, {'C': [0.1, 1.0, 10.0]}, None),
+    'naive-bayes': (_naive_bayes, {'var_smoothing': [1e-9, 1e-6, 1e-3]}, None),
+    'knn': (_knn, {'n_neighbors': [1, 5, 15]}, None),
+    'xgboost': (_xgboost, {'max_depth': [4, 6]}, None),
+}
+# xgboost grows one tree per class per round, which takes hours for hundreds of techniques; it is opt-in
+DEFAULT_MODELS = ('logistic-regression', 'linear-svm', 'naive-bayes', 'knn')
+
+def encode_labels(technique_ids):
+    """
+    Maps technique IDs to integer codes, which every estimator (xgboost included) accepts and which pass
+    to worker processes without pickling strings. Returns (sorted technique IDs, codes).
+    """
+    classes, codes = np.unique(np.asarray(technique_ids, dtype=str), return_inverse=True)
+    return classes.astype(object), codes.astype(np.int64)
+
+def grid_paths(grid, warm_param=None):
+    """
+    Splits a parameter grid into paths fitted one after another on the same estimator.
+    Without a warm-start parameter every combination is its own path; with one, the combinations that
+    differ only in it form one path in ascending order, so each fit starts from the previous solution.
+    """
+    names = sorted(name for name in grid if name != warm_param)
+    paths = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        fixed = dict(zip(names, values))
+        if warm_param is None:
+            paths.append([fixed])
+        else:
+            paths.append([dict(fixed, **{warm_param: value}) for value in sorted(grid[warm_param])])
+    return paths
+
+def _softmax(scores):
+    scores -= scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+def _knn_scores(chunk, fitted, fitted_norms, labels, neighbours, classes):
+    # Squared euclidean distances as |x|^2 + |f|^2 - 2 x.f, then the class shares of inverse-distance weights
+    distances = chunk @ fitted
+    distances *= -2
+    distances += fitted_norms
+    distances += np.square(chunk).sum(axis=1, keepdims=True)
+    nearest = np.argpartition(distances, neighbours - 1, axis=1)[:, :neighbours]
+    nearest_distances = np.sqrt(np.maximum(np.take_along_axis(distances, nearest, axis=1), 0))
+    with np.errstate(divide='ignore'):
+        weights = 1.0 / nearest_distances
+    # As in predict_proba, a query equal to training texts takes its classes from those texts only
+    exact = np.isinf(weights)
+    exact_rows = exact.any(axis=1)
+    weights[exact_rows] = exact[exact_rows]
+    scores = np.zeros((chunk.shape[0], classes), dtype=np.float32)
+    rows = np.arange(chunk.shape[0])
+    for column in range(neighbours):
+        scores[rows, labels[nearest[:, column]]] += weights[:, column]
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+def batch_scorer(model):
+    """
+    Returns a function scoring a chunk of unit vectors with float32 matrix products for the models where that
+    is much faster than scikit-learn's float64 predict_proba/decision_function, or None for other models.
+    Logistic regression and naive Bayes scores are turned into probabilities with the softmax predict_proba
+    applies; linear SVM scores stay decision values. Distance-weighted KNN finds the neighbours with one
+    product against the training texts and returns the same class probabilities as predict_proba.
+    """
+    name = type(model).__name__
+    if name == 'KNeighborsClassifier':
+        if model.weights != 'distance' or model.effective_metric_ != 'euclidean':
+            return None
+        fitted = np.ascontiguousarray(np.asarray(model._fit_X, dtype=np.float32).T)
+        fitted_norms = np.square(fitted).sum(axis=0)
+        neighbours = min(model.n_neighbors, fitted.shape[1])
+        return lambda chunk: _knn_scores(chunk, fitted, fitted_norms, model._y, neighbours, len(model.classes_))
+    if name == 'GaussianNB':
+        # The joint log-likelihood of a diagonal Gaussian is a quadratic form: one product with x^2, one with x
+        inverse = 1.0 / model.var_
+        squared_weights = np.ascontiguousarray((-0.5 * inverse).T, dtype=np.float32)
+        weights = np.ascontiguousarray((model.theta_ * inverse).T, dtype=np.float32)
+        intercept = (np.log(model.class_prior_) - 0.5 * np.log(2 * np.pi * model.var_).sum(axis=1)
+                     - 0.5 * (model.theta_ ** 2 * inverse).sum(axis=1)).astype(np.float32)
+        return lambda chunk: _softmax(np.square(chunk) @ squared_weights + chunk @ weights + intercept)
+
+    coef = getattr(model, 'coef_', None)
+    if coef is None or coef.shape[0] != len(model.classes_):
+        return None
+    weights = np.ascontiguousarray(np.asarray(coef, dtype=np.float32).T)
+    intercept = np.asarray(model.intercept_, dtype=np.float32)
+    if name == 'LogisticRegression':
+        return lambda chunk: _softmax(chunk @ weights + intercept)
+    return lambda chunk: chunk @ weights + intercept
+
+def iter_model_top_k(model, features, k=TOP_K, chunk_size=CHUNK_SIZE):
+    """
+    Scores features with a fitted model in fixed-size chunks.
+    Yields (start_row, top class indices, top scores) per chunk, best first; the indices point into model.classes_.
+    Scores are probabilities where the model has them and decision values otherwise.
+    """
+    k = min(k, len(model.classes_))
+    scorer = batch_scorer(model)
+    for start in range(0, features.shape[0], chunk_size):
+        chunk = normalize_embeddings(features[start:start + chunk_size])
+        if scorer is not None:
+            scores = scorer(chunk)
+        elif hasattr(model, 'predict_proba'):
+            scores = model.predict_proba(chunk)
+        else:
+            scores = model.decision_function(chunk)
+            if scores.ndim == 1: # Binary models return the score of the second class only
+                scores = np.column_stack([-scores, scores])
+        yield (start,) + top_k_rows(scores, k)
+
+def top_k_accuracy(model, features, labels, k=TOP_K, chunk_size=CHUNK_SIZE):
+    """
+    Returns (top-1 accuracy, top-k accuracy) of a fitted model on features whose labels are in the same
+    encoding as the model's classes_.
+    """
+    labels = np.asarray(labels)
+    top_1 = top_k = 0
+    for start, top_indices, _ in iter_model_top_k(model, features, k, chunk_size):
+        hits = model.classes_[top_indices] == labels[start:start + top_indices.shape[0], None]
+        top_1 += int(hits[:, 0].sum())
+        top_k += int(hits.any(axis=1).sum())
+    count = max(len(labels), 1)
+    return top_1 / count, top_k / count
+
+def _fit_path(name, path, features, labels, train_index, test_index, k):
+    # One parallel job: fits every setting of a path on one fold, reusing the estimator so warm starts apply
+    import warnings
+    from sklearn.exceptions import ConvergenceWarning
+    factory, _, _ = MODELS[name]
+    estimator = factory()
+    train_features, train_labels = features[train_index], labels[train_index]
+    results = []
+    for params in path:
+        estimator.set_params(**params)
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            # Cross-validation fits are capped in iterations on purpose; the final fit reports convergence
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            estimator.fit(train_features, train_labels)
+        fit_seconds = time.perf_counter() - start
+        top_1, top_k = top_k_accuracy(estimator, features[test_index], labels[test_index], k)
+        results.append({'params': params, 'top_1_accuracy': top_1, 'top_k_accuracy': top_k, 'fit_seconds': fit_seconds})
+    return name, results
+
+def cross_validate(names, features, codes, folds=FOLDS, jobs=-1, k=TOP_K, seed=SEED):
+    """
+    Runs stratified k-fold cross-validation over the parameter grid of every named model on label codes
+    from encode_labels. Folds are capped at the size of the smallest class.
+    Every (model, grid path, fold) is one job, and all jobs of all models share one process pool, so the
+    whole zoo keeps every core busy. joblib hands the feature matrix to the workers as a memory map.
+    Returns {model: [{params, top_1_accuracy, top_k_accuracy, fit_seconds, folds}]} averaged over folds,
+    best setting first.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import StratifiedKFold
+
+    folds = max(2, min(folds, int(np.bincount(codes).min())))
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(np.zeros(len(codes)), codes))
+    jobs_list = [delayed(_fit_path)(name, path, features, codes, train_index, test_index, k)
+                 for name in names
+                 for path in grid_paths(MODELS[name][1], MODELS[name][2])
+                 for train_index, test_index in splits]
+    outputs = Parallel(n_jobs=jobs)(jobs_list)
+
+    summary = {}
+    for name, results in outputs:
+        for result in results:
+            key = json.dumps(result['params'], sort_keys=True)
+            entry = summary.setdefault(name, {}).setdefault(key, {'params': result['params'], 'top_1_accuracy': 0.0,
+                                                                  'top_k_accuracy': 0.0, 'fit_seconds': 0.0, 'folds': 0})
+            for metric in ('top_1_accuracy', 'top_k_accuracy', 'fit_seconds'):
+                entry[metric] += result[metric]
+            entry['folds'] += 1
+    ranked = {}
+    for name, entries in summary.items():
+        for entry in entries.values():
+            for metric in ('top_1_accuracy', 'top_k_accuracy', 'fit_seconds'):
+                entry[metric] /= entry['folds']
+        ranked[name] = sorted(entries.values(), key=lambda entry: (-entry['top_1_accuracy'], -entry['top_k_accuracy']))
+    return ranked
+
+def _fit_final(name, params, features, codes):
+    factory, _, _ = MODELS[name]
+    estimator = factory().set_params(**params)
+    start = time.perf_counter()
+    estimator.fit(features, codes)
+    return name, estimator, time.perf_counter() - start
+
+def fit_models(settings, features, codes, jobs=-1):
+    """
+    Fits each model on all of the training features with its chosen parameters, in parallel.
+    settings maps model name -> params. Returns {model: (estimator, fit seconds)}.
+    """
+    from joblib import Parallel, delayed
+    outputs = Parallel(n_jobs=jobs)(delayed(_fit_final)(name, params, features, codes) for name, params in settings.items())
+    return {name: (estimator, seconds) for name, estimator, seconds in outputs}
+
+def package_versions():
+    versions = {}
+    for package in REPORTED_PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+def next_version(name, models_dir=MODELS_DIR):
+    model_dir = os.path.join(models_dir, name)
+    versions = [int(entry[1:]) for entry in os.listdir(model_dir)
+                if entry.startswith('v') and entry[1:].isdigit()] if os.path.isdir(model_dir) else []
+    return max(versions, default=0) + 1
+
+def save_model(name, estimator, classes, meta, models_dir=MODELS_DIR):
+    """
+    Writes a fitted model to <models_dir>/<name>/v<N>/ with the next free version N, next to a meta.json
+    recording the technique IDs its label codes stand for, its parameters, scores, training features and
+    package versions.
+    Returns the directory written.
+    """
+    import joblib
+    version = next_version(name, models_dir)
+    output_dir = os.path.join(models_dir, name, f"v{version}")
+    os.makedirs(output_dir)
+    joblib.dump(estimator, os.path.join(output_dir, MODEL_FILE))
+    meta = dict(meta, format=MODEL_FORMAT, model=name, version=version,
+                created=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                technique_ids=[str(technique_id) for technique_id in classes], python=platform.python_version(), packages=package_versions())
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return output_dir
+
+def load_model(name, version=None, models_dir=MODELS_DIR):
+    """
+    Loads a saved model, the latest version unless one is given.
+    Returns (estimator, technique ID of each entry of estimator.classes_, meta).
+    """
+    import joblib
+    if version is None:
+        version = next_version(name, models_dir) - 1
+        if version == 0:
+            raise FileNotFoundError(f"No saved versions of {name} in {models_dir}.")
+    model_dir = os.path.join(models_dir, name, f"v{version}")
+    with open(os.path.join(model_dir, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('format') != MODEL_FORMAT:
+        raise ValueError(f"{model_dir} has model format {meta.get('format')}, expected {MODEL_FORMAT}; retrain it.")
+    estimator = joblib.load(os.path.join(model_dir, MODEL_FILE))
+    return estimator, np.asarray(meta['technique_ids'], dtype=object)[estimator.classes_], meta
@@ -0,0 +1,130 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+from ml_features import BACKENDS, CACHE_FILE, DB_FILE, SOURCES, load_features
+from model_zoo import (DEFAULT_MODELS, FOLDS, MODELS, MODELS_DIR, SEED, cross_validate, encode_labels, fit_models,
+                       iter_model_top_k, save_model, top_k_accuracy)
+from scoring import TOP_K, iter_top_k, normalize_embeddings
+
+def texts_per_second(chunks, count):
+    """
+    Consumes an iterator of top-k chunks and returns how many of the count texts it scored per second.
+    """
+    start = time.perf_counter()
+    for _ in chunks:
+        pass
+    seconds = time.perf_counter() - start
+    return count / seconds if seconds > 0 else float('inf')
+
+def class_mean_matrix(features, codes, classes_count):
+    """
+    Returns one unit vector per class, the mean direction of its training vectors. Scoring against it has the
+    shape of the cosine-similarity baseline, which scores texts against one vector per technique.
+    """
+    sums = np.zeros((classes_count, features.shape[1]), dtype=np.float32)
+    np.add.at(sums, codes, np.asarray(features, dtype=np.float32))
+    return normalize_embeddings(sums)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cross-validate and train the traditional ML models on cached embeddings, and save them with "
+                    "versioned metadata."
+    )
+    parser.add_argument('--model', choices=list(MODELS), action='append',
+                        help=f"Optional: Model(s) to train. Repeat to select several (default: {', '.join(DEFAULT_MODELS)}).")
+    parser.add_argument('--db', type=str, default=DB_FILE,
+                        help=f"SQLite database file holding the technique IDs (default: {DB_FILE}).")
+    parser.add_argument('--store', type=str,
+                        help="Optional: Embedding store written by bulk-embed.py to train on, instead of --source.")
+    parser.add_argument('--source', choices=list(SOURCES), default='variants',
+                        help="Text source whose vectors are read from --cache to train on (default: variants).")
+    parser.add_argument('--test-store', type=str,
+                        help="Optional: Embedding store to evaluate the trained models on.")
+    parser.add_argument('--test-source', choices=list(SOURCES),
+                        help="Optional: Text source read from --cache to evaluate the trained models on, e.g. synthetic.")
+    parser.add_argument('--cache', type=str, default=CACHE_FILE,
+                        help=f"Embedding cache file read by --source and --test-source (default: {CACHE_FILE}).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Encoder backend whose cached vectors are read (default: torch).")
+    parser.add_argument('--folds', type=int, default=FOLDS,
+                        help=f"Stratified cross-validation folds, capped at the smallest class size (default: {FOLDS}).")
+    parser.add_argument('-j', '--jobs', type=int, default=-1,
+                        help="Parallel fitting processes (default: -1, one per CPU).")
+    parser.add_argument('-k', '--top-k', type=int, default=TOP_K,
+                        help=f"Size of the top-k set for top-k accuracy (default: {TOP_K}).")
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help=f"Seed of the fold shuffling (default: {SEED}).")
+    parser.add_argument('--models-dir', type=str, default=MODELS_DIR,
+                        help=f"Directory receiving <model>/v<N>/ (default: {MODELS_DIR}).")
+    parser.add_argument('--no-save', action='store_true',
+                        help="Only report scores; do not save the fitted models.")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    if args.folds < 2:
+        parser.error("--folds must be at least 2")
+
+    names = list(dict.fromkeys(args.model or DEFAULT_MODELS))
+    try:
+        features, technique_ids, info = load_features(args.db, args.store, args.source, args.backend, args.cache)
+        test = None
+        if args.test_store or args.test_source:
+            test = load_features(args.db, args.test_store, args.test_source, args.backend, args.cache)
+    except (OSError, LookupError, ValueError, sqlite3.Error) as e:
+        parser.error(str(e))
+    if test is not None and test[2]['encoder'] != info['encoder']:
+        parser.error(f"Training vectors come from {info['encoder']} but test vectors from {test[2]['encoder']}.")
+
+    classes, codes = encode_labels(technique_ids)
+    singletons = int((np.bincount(codes) < 2).sum())
+    if singletons:
+        parser.error(f"{singletons} of {len(classes)} techniques have a single {info['source']} vector; stratified "
+                     "cross-validation needs at least 2 per technique, such as the variants texts.")
+    print(f"Training on {len(codes)} {info['source']} vectors ({info['encoder']}, {info['kind']}) "
+          f"covering {len(classes)} techniques\n")
+
+    start = time.perf_counter()
+    cv_results = cross_validate(names, features, codes, args.folds, args.jobs, args.top_k, args.seed)
+    print(f"Cross-validation finished in {time.perf_counter() - start:.1f}s")
+    print(f"{'model':<20} {'best params':<24} {'cv top-1':>9} {f'cv top-{args.top_k}':>9} {'fit s':>8}")
+    for name in names:
+        best = cv_results[name][0]
+        params = ', '.join(f"{key}={value}" for key, value in best['params'].items())
+        print(f"{name:<20} {params:<24} {best['top_1_accuracy']:>9.4f} {best['top_k_accuracy']:>9.4f} {best['fit_seconds']:>8.2f}")
+
+    fitted = fit_models({name: cv_results[name][0]['params'] for name in names}, features, codes, args.jobs)
+
+    # Predict throughput is measured on the test set when there is one, else on the training vectors
+    eval_features, eval_codes = features, codes
+    if test is not None:
+        index = {technique_id: code for code, technique_id in enumerate(classes)}
+        eval_features = test[0]
+        # Techniques never seen in training get code -1, which no model predicts
+        eval_codes = np.array([index.get(technique_id, -1) for technique_id in test[1]], dtype=np.int64)
+
+    print(f"\n{'model':<20} {'fit s':>8} {'top-1':>8} {f'top-{args.top_k}':>8} {'texts/s':>10}  saved to")
+    for name in names:
+        estimator, fit_seconds = fitted[name]
+        top_1, top_k = top_k_accuracy(estimator, eval_features, eval_codes, args.top_k)
+        rate = texts_per_second(iter_model_top_k(estimator, eval_features, args.top_k), len(eval_codes))
+        evaluation = {'source': (test[2] if test is not None else info)['source'], 'texts': len(eval_codes),
+                      'top_1_accuracy': top_1, 'top_k_accuracy': top_k, 'texts_per_second': rate}
+        output_dir = '-'
+        if not args.no_save:
+            output_dir = save_model(name, estimator, classes, {
+                'params': cv_results[name][0]['params'],
+                'fit_seconds': fit_seconds,
+                'top_k': args.top_k,
+                'cross_validation': {'folds': cv_results[name][0]['folds'], 'seed': args.seed, 'results': cv_results[name]},
+                'evaluation': evaluation,
+                'features': info,
+                'test_features': test[2] if test is not None else None,
+            }, args.models_dir)
+        print(f"{name:<20} {fit_seconds:>8.2f} {top_1:>8.4f} {top_k:>8.4f} {rate:>10.0f}  {output_dir}")
+    baseline_rate = texts_per_second(iter_top_k(class_mean_matrix(features, codes, len(classes)), eval_features, args.top_k),
+                                     len(eval_codes))
+    print(f"{'cosine baseline':<20} {'':>8} {'':>8} {'':>8} {baseline_rate:>10.0f}  (class means, predict speed only)")
+
+if __name__ == "__main__":
+    main()